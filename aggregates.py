@@ -0,0 +1,149 @@
+import threading
+import time
+from datetime import datetime
+
+from lifecycle import FINAL_STATUSES
+
+# Order aggregates per restaurant and per user.
+#
+# Each restaurant and user has a running tally: order count, counts by status,
+# amount ordered (cancelled orders excluded), amount delivered, and a ring of
+# time buckets (orders, amount and cancellations by creation time) covering
+# the last `bucket_count` * `bucket_seconds`. Tallies are updated as orders are
+# placed and change status, so reading one costs the same however many orders
+# there are. After recovery they are rebuilt from the stored orders.
+
+
+class Tally:
+    __slots__ = ('orders', 'amount', 'delivered_amount', 'by_status', 'buckets')
+
+    def __init__(self, bucket_count):
+        self.orders = 0
+        self.amount = 0.0
+        self.delivered_amount = 0.0
+        self.by_status = {}
+        # Ring of [bucket number, orders, amount, cancelled]
+        self.buckets = [None] * bucket_count
+
+
+class Aggregates:
+    def __init__(self, bucket_seconds=3600, bucket_count=24):
+        self.bucket_seconds = bucket_seconds
+        self.bucket_count = bucket_count
+        self._restaurants = {}
+        self._users = {}
+        self._lock = threading.Lock()
+
+    def add(self, order):
+        # A new order (or, when rebuilding, a stored one in its current status)
+        status = str(order['status'])
+        amount = float(order['totalAmount'])
+        number = self._bucket_number(order)
+        with self._lock:
+            for tally in self._tallies(order):
+                tally.orders += 1
+                tally.by_status[status] = tally.by_status.get(status, 0) + 1
+                bucket = self._bucket(tally, number, create=True)
+                if bucket is not None:
+                    bucket[1] += 1
+                if status == 'CANCELLED':
+                    if bucket is not None:
+                        bucket[3] += 1
+                    continue
+                tally.amount += amount
+                if bucket is not None:
+                    bucket[2] += amount
+                if status == 'DELIVERED':
+                    tally.delivered_amount += amount
+
+    def move(self, order, old_status, status):
+        # An order changed from old_status to status
+        old_status, status = str(old_status), str(status)
+        amount = float(order['totalAmount'])
+        number = self._bucket_number(order)
+        with self._lock:
+            for tally in self._tallies(order):
+                remaining = tally.by_status.get(old_status, 0) - 1
+                if remaining > 0:
+                    tally.by_status[old_status] = remaining
+                else:
+                    tally.by_status.pop(old_status, None)
+                tally.by_status[status] = tally.by_status.get(status, 0) + 1
+                if status == 'CANCELLED':
+                    tally.amount -= amount
+                    bucket = self._bucket(tally, number)
+                    if bucket is not None:
+                        bucket[2] -= amount
+                        bucket[3] += 1
+                elif status == 'DELIVERED':
+                    tally.delivered_amount += amount
+
+    def rebuild(self, orders):
+        with self._lock:
+            self._restaurants.clear()
+            self._users.clear()
+        for order in orders:
+            self.add(order)
+
+    def restaurant(self, restaurant_id, now=None):
+        return self._summary(self._restaurants.get(restaurant_id), now)
+
+    def user(self, user_id, now=None):
+        return self._summary(self._users.get(user_id), now)
+
+    def empty(self, now=None):
+        # Summary for a restaurant or user without orders
+        return self._summary(Tally(self.bucket_count), now)
+
+    def _tallies(self, order):
+        restaurant = self._restaurants.get(order['restaurantId'])
+        if restaurant is None:
+            restaurant = self._restaurants[order['restaurantId']] = Tally(self.bucket_count)
+        user = self._users.get(order['userId'])
+        if user is None:
+            user = self._users[order['userId']] = Tally(self.bucket_count)
+        return restaurant, user
+
+    def _bucket_number(self, order):
+        created = order.get('createdAt')
+        seconds = datetime.fromisoformat(created).timestamp() if created else time.time()
+        return int(seconds // self.bucket_seconds)
+
+    def _bucket(self, tally, number, create=False):
+        # The bucket for `number`, or None once it has rotated out of the ring
+        slot = number % self.bucket_count
+        bucket = tally.buckets[slot]
+        if bucket is not None and bucket[0] == number:
+            return bucket
+        if create and (bucket is None or bucket[0] < number):
+            bucket = tally.buckets[slot] = [number, 0, 0.0, 0]
+            return bucket
+        return None
+
+    def _summary(self, tally, now=None):
+        if tally is None:
+            return None
+        current = int((now or time.time()) // self.bucket_seconds)
+        with self._lock:
+            by_status = dict(tally.by_status)
+            window = []
+            for number in range(current - self.bucket_count + 1, current + 1):
+                bucket = tally.buckets[number % self.bucket_count]
+                orders, amount, cancelled = bucket[1:] if bucket is not None and bucket[0] == number else (0, 0.0, 0)
+                window.append({
+                    'start': datetime.fromtimestamp(number * self.bucket_seconds).isoformat(),
+                    'orders': orders,
+                    'amount': round(amount, 2),
+                    'cancelled': cancelled
+                })
+            placed = tally.orders - by_status.get('CANCELLED', 0)
+            return {
+                'orders': tally.orders,
+                'active': sum(count for status, count in by_status.items() if status not in FINAL_STATUSES),
+                'byStatus': by_status,
+                'totalAmount': round(tally.amount, 2),
+                'deliveredAmount': round(tally.delivered_amount, 2),
+                'averageOrderAmount': round(tally.amount / placed, 2) if placed else 0.0,
+                'bucketSeconds': self.bucket_seconds,
+                'buckets': window
+            }
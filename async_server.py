@@ -0,0 +1,215 @@
+import asyncio
+import json
+import re
+import time
+from urllib.parse import parse_qsl, unquote
+
+import h11
+
+# Event-loop HTTP server for requests that mostly wait.
+#
+# The WSGI server gives every request a thread for its whole lifetime, so a
+# notification stream or a login waiting on Backend1 holds one doing nothing.
+# Routes registered here are coroutines served by a small HTTP/1.1 server
+# (h11) on an asyncio loop, normally the Backend1 client loop: a waiting
+# request costs a coroutine, not a thread, so thousands can be open at once.
+# Handlers must not block the loop; CPU work goes to an executor.
+#
+# A handler gets a Request and returns a Response, whose body is bytes or an
+# async iterator of chunks (sent chunked as they are produced).
+
+MAX_BODY = 1024 * 1024
+IDLE_TIMEOUT = 75
+
+
+class Request:
+    __slots__ = ('method', 'path', 'args', 'headers', 'body')
+
+    def __init__(self, method, path, args, headers, body):
+        self.method = method
+        self.path = path
+        self.args = args
+        self.headers = headers
+        self.body = body
+
+    def json(self):
+        # Parsed body, or None when it is missing or not JSON
+        try:
+            return json.loads(self.body) if self.body else None
+        except ValueError:
+            return None
+
+
+class Response:
+    def __init__(self, status, body=b'', headers=None, stream=None):
+        self.status = status
+        self.body = body
+        self.headers = headers or {}
+        self.stream = stream
+
+
+def json_response(status, data, headers=None):
+    return Response(status, json.dumps(data).encode(), dict(headers or {}, **{'Content-Type': 'application/json'}))
+
+
+class AsyncServer:
+    def __init__(self, observe=None, max_body=MAX_BODY, idle_timeout=IDLE_TIMEOUT):
+        # observe(route, method, status, seconds) is called after each response
+        # (seconds is None for streams)
+        self.observe = observe
+        self.max_body = max_body
+        self.idle_timeout = idle_timeout
+        self.port = None
+        self.routes = []
+        self._server = None
+        self._loop = None
+
+    def route(self, rule, methods=('GET',)):
+        # Flask-style rule: /api/users/<user_id>
+        pattern = re.compile('^' + re.sub(r'<(\w+)>', r'(?P<\1>[^/]+)', rule) + '$')
+
+        def decorator(handler):
+            self.routes.append((pattern, tuple(methods), rule, handler))
+            return handler
+        return decorator
+
+    def start(self, loop, host, port):
+        # Listen on `loop` (running in another thread); returns the bound port.
+        # SO_REUSEPORT lets every pre-forked worker listen on the same port.
+        self._loop = loop
+        future = asyncio.run_coroutine_threadsafe(self._listen(host, port), loop)
+        return future.result()
+
+    def stop(self):
+        # Stop accepting; open streams end on their own
+        if self._server is not None:
+            self._loop.call_soon_threadsafe(self._server.close)
+
+    async def _listen(self, host, port):
+        self._server = await asyncio.start_server(self._serve, host, port, reuse_port=True)
+        self.port = self._server.sockets[0].getsockname()[1]
+        return self.port
+
+    async def _serve(self, reader, writer):
+        connection = h11.Connection(h11.SERVER)
+        try:
+            while True:
+                try:
+                    request = await self._read_request(connection, reader)
+                except h11.RemoteProtocolError as error:
+                    if connection.our_state is h11.SEND_RESPONSE:
+                        await self._send(connection, writer, json_response(error.error_status_hint,
+                            {'error': 'Bad request'}))
+                    break
+                if request is None:
+                    break
+                if isinstance(request, Response):
+                    # Rejected before the body was read
+                    await self._send(connection, writer, request)
+                    break
+                await self._respond(connection, reader, writer, request)
+                if connection.our_state is not h11.DONE or connection.their_state is not h11.DONE:
+                    break
+                connection.start_next_cycle()
+        except (ConnectionError, asyncio.TimeoutError, h11.LocalProtocolError):
+            pass
+        finally:
+            writer.close()
+
+    async def _next_event(self, connection, reader):
+        while True:
+            event = connection.next_event()
+            if event is not h11.NEED_DATA:
+                return event
+            connection.receive_data(await asyncio.wait_for(reader.read(65536), self.idle_timeout))
+
+    async def _read_request(self, connection, reader):
+        # A Request, a Response rejecting it, or None once the client is gone
+        event = await self._next_event(connection, reader)
+        if not isinstance(event, h11.Request):
+            return None
+        body = bytearray()
+        while True:
+            part = await self._next_event(connection, reader)
+            if isinstance(part, h11.Data):
+                body += part.data
+                if len(body) > self.max_body:
+                    return json_response(413, {'error': 'Request body too large'})
+            elif isinstance(part, h11.EndOfMessage):
+                break
+            else:
+                return None
+        target = event.target.decode('latin-1')
+        path, _, query = target.partition('?')
+        headers = {name.decode('latin-1'): value.decode('latin-1') for name, value in event.headers}
+        return Request(event.method.decode('ascii'), unquote(path), dict(parse_qsl(query)), headers, bytes(body))
+
+    async def _respond(self, connection, reader, writer, request):
+        started = time.perf_counter()
+        route, response = await self._dispatch(request)
+        try:
+            await self._send(connection, writer, response, reader)
+        finally:
+            # A stream's lifetime is not a latency, so it has no duration
+            if self.observe is not None:
+                seconds = time.perf_counter() - started if response.stream is None else None
+                self.observe(route, request.method, response.status, seconds)
+
+    async def _dispatch(self, request):
+        allowed = False
+        for pattern, methods, rule, handler in self.routes:
+            match = pattern.match(request.path)
+            if match is None:
+                continue
+            if request.method not in methods:
+                allowed = True
+                continue
+            try:
+                return rule, await handler(request, **match.groupdict())
+            except Exception as error:
+                print(f'Error handling {request.method} {request.path}: {error!r}')
+                return rule, json_response(500, {'error': 'Internal server error'})
+        if allowed:
+            return 'unmatched', json_response(405, {'error': 'Method not allowed'})
+        return 'unmatched', json_response(404, {'error': 'Not found'})
+
+    async def _send(self, connection, writer, response, reader=None):
+        headers = [(name, str(value)) for name, value in response.headers.items()]
+        if response.stream is None:
+            headers.append(('Content-Length', str(len(response.body))))
+        else:
+            # The connection ends with the stream, so anything the client
+            # sends meanwhile (normally just EOF) means it is gone
+            headers.append(('Connection', 'close'))
+        writer.write(connection.send(h11.Response(status_code=response.status, headers=headers)))
+        if response.stream is None:
+            if response.body:
+                writer.write(connection.send(h11.Data(data=response.body)))
+        else:
+            if not await self._stream(connection, writer, response.stream, reader):
+                return
+        writer.write(connection.send(h11.EndOfMessage()))
+        await writer.drain()
+
+    async def _stream(self, connection, writer, stream, reader):
+        # Send chunks until the stream ends (True) or the client goes away
+        # (False); a stream waiting for its next chunk is cancelled then
+        gone = asyncio.ensure_future(reader.read(1)) if reader is not None else asyncio.get_running_loop().create_future()
+        chunks = stream.__aiter__()
+        try:
+            while True:
+                pending = asyncio.ensure_future(chunks.__anext__())
+                await asyncio.wait((pending, gone), return_when=asyncio.FIRST_COMPLETED)
+                if not pending.done():
+                    pending.cancel()
+                    await asyncio.gather(pending, return_exceptions=True)
+                    return False
+                try:
+                    chunk = pending.result()
+                except StopAsyncIteration:
+                    return True
+                writer.write(connection.send(h11.Data(data=chunk.encode() if isinstance(chunk, str) else chunk)))
+                await writer.drain()
+        finally:
+            gone.cancel()
+            await stream.aclose()
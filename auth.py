@@ -0,0 +1,135 @@
+import base64
+import hashlib
+import hmac
+import json
+import os
+import secrets
+import threading
+import time
+from collections import OrderedDict
+
+# Tokens and password hashing.
+#
+# Tokens are base64url(JSON payload) + "." + base64url(HMAC-SHA256 of it),
+# carrying the user id and an expiry, so they are verified without a store
+# lookup. Verified tokens are kept in a small LRU cache, which makes repeat
+# requests with the same token a dictionary hit.
+#
+# Passwords are hashed with scrypt and a random salt; the cost parameters are
+# stored with each hash, so raising SCRYPT_N only affects new hashes and old
+# ones are upgraded on the next successful login. Hashes from before (bare
+# unsalted sha256 hex) are still accepted and upgraded the same way.
+
+TOKEN_SECRET = os.environ.get('BACKEND2_TOKEN_SECRET', '').encode()
+if not TOKEN_SECRET:
+    # Tokens then only verify in this process and stop working on restart
+    print('[AUTH] BACKEND2_TOKEN_SECRET is not set, using a random secret')
+    TOKEN_SECRET = secrets.token_bytes(32)
+TOKEN_TTL = int(os.environ.get('BACKEND2_TOKEN_TTL_SECONDS', 24 * 3600))
+
+SCRYPT_N = int(os.environ.get('BACKEND2_SCRYPT_N', 2 ** 14))
+SCRYPT_R = 8
+SCRYPT_P = 1
+
+
+def _b64encode(data):
+    return base64.urlsafe_b64encode(data).rstrip(b'=').decode()
+
+
+def _b64decode(text):
+    return base64.urlsafe_b64decode(text + '=' * (-len(text) % 4))
+
+
+def _sign(data):
+    return hmac.new(TOKEN_SECRET, data, hashlib.sha256).digest()
+
+
+def generate_token(user_id, ttl=TOKEN_TTL):
+    now = int(time.time())
+    payload = _b64encode(json.dumps({'userId': user_id, 'iat': now, 'exp': now + ttl},
+        separators=(',', ':')).encode())
+    return f'{payload}.{_b64encode(_sign(payload.encode()))}'
+
+
+def decode_token(token):
+    # Payload of a correctly signed, unexpired token, else None
+    try:
+        payload, signature = token.split('.')
+        if not hmac.compare_digest(_b64decode(signature), _sign(payload.encode())):
+            return None
+        claims = json.loads(_b64decode(payload))
+    except ValueError:
+        return None
+    if claims.get('exp', 0) <= time.time():
+        return None
+    return claims
+
+
+def hash_password(password, n=None):
+    n = n or SCRYPT_N
+    salt = secrets.token_bytes(16)
+    key = hashlib.scrypt(password.encode(), salt=salt, n=n, r=SCRYPT_R, p=SCRYPT_P, maxmem=256 * n * SCRYPT_R)
+    return f'scrypt${n}${SCRYPT_R}${SCRYPT_P}${_b64encode(salt)}${_b64encode(key)}'
+
+
+def verify_password(password, stored):
+    # (matches, should be rehashed with the current parameters)
+    if not stored:
+        return False, False
+    if not stored.startswith('scrypt$'):
+        legacy = hashlib.sha256(password.encode()).hexdigest()
+        return hmac.compare_digest(legacy, stored), True
+    try:
+        _, n, r, p, salt, expected = stored.split('$')
+        n, r, p = int(n), int(r), int(p)
+        key = hashlib.scrypt(password.encode(), salt=_b64decode(salt), n=n, r=r, p=p, maxmem=256 * n * r)
+    except ValueError:
+        return False, False
+    matches = hmac.compare_digest(key, _b64decode(expected))
+    return matches, (n, r, p) != (SCRYPT_N, SCRYPT_R, SCRYPT_P)
+
+
+class SessionCache:
+    # LRU of verified tokens -> claims; entries are dropped once expired
+
+    def __init__(self, maxsize=10000):
+        self.maxsize = maxsize
+        self.stats = {'verified': 0, 'hits': 0, 'rejected': 0, 'totalMicros': 0.0}
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def verify(self, token):
+        started = time.perf_counter()
+        with self._lock:
+            claims = self._entries.get(token)
+            if claims is not None and claims['exp'] > time.time():
+                self._entries.move_to_end(token)
+                self.stats['hits'] += 1
+            else:
+                claims = None
+        if claims is None:
+            claims = decode_token(token)
+            with self._lock:
+                if claims is None:
+                    self._entries.pop(token, None)
+                    self.stats['rejected'] += 1
+                else:
+                    self._entries[token] = claims
+                    self._entries.move_to_end(token)
+                    if len(self._entries) > self.maxsize:
+                        self._entries.popitem(last=False)
+        with self._lock:
+            self.stats['verified'] += 1
+            self.stats['totalMicros'] += (time.perf_counter() - started) * 1e6
+        return claims
+
+    def summary(self):
+        with self._lock:
+            verified = self.stats['verified']
+            return {
+                'entries': len(self._entries),
+                'verified': verified,
+                'hits': self.stats['hits'],
+                'rejected': self.stats['rejected'],
+                'avgVerifyMicros': round(self.stats['totalMicros'] / verified, 2) if verified else 0.0
+            }
@@ -0,0 +1,109 @@
+import asyncio
+import concurrent.futures
+import threading
+import time
+
+import httpx
+
+from backend1_client import BACKEND1_URL, CircuitBreaker, backend1
+from metrics import backend1_calls, backend1_seconds
+
+# Asyncio client for the Backend1 (Node.js) peer.
+#
+# One event loop per process runs in a background thread and owns a pooled
+# httpx.AsyncClient. Request handlers hand it coroutines with run() and can
+# gather any number of independent Backend1 calls concurrently; a call that
+# overruns its timeout is cancelled inside the loop, so a slow peer never ties
+# up more than the waiting request.
+
+READ_TIMEOUT = 2.0
+
+
+class Backend1Error(Exception):
+    pass
+
+
+class AsyncBackend1Client:
+    def __init__(self, base_url=BACKEND1_URL, breaker=None, max_connections=100):
+        self.base_url = base_url.rstrip('/')
+        self.breaker = breaker or CircuitBreaker()
+        self.max_connections = max_connections
+        self._loop = None
+        self._client = None
+        self._lock = threading.Lock()
+
+    def start(self):
+        if self._loop is not None:
+            return
+        with self._lock:
+            if self._loop is not None:
+                return
+            loop = asyncio.new_event_loop()
+            started = threading.Event()
+
+            def run_loop():
+                asyncio.set_event_loop(loop)
+                self._client = httpx.AsyncClient(base_url=self.base_url, limits=httpx.Limits(
+                    max_connections=self.max_connections, max_keepalive_connections=self.max_connections))
+                started.set()
+                loop.run_forever()
+
+            threading.Thread(target=run_loop, name='backend1-async', daemon=True).start()
+            started.wait()
+            self._loop = loop
+
+    def loop(self):
+        # The client loop, also used by the event-loop server
+        self.start()
+        return self._loop
+
+    def run(self, coro, timeout=READ_TIMEOUT + 0.5):
+        # Run a coroutine on the client loop from a request thread
+        self.start()
+        future = asyncio.run_coroutine_threadsafe(coro, self._loop)
+        try:
+            return future.result(timeout)
+        except concurrent.futures.TimeoutError:
+            future.cancel()
+            raise Backend1Error('Backend1 call timed out')
+
+    async def request(self, method, path, timeout=READ_TIMEOUT, **kwargs):
+        if not self.breaker.allow():
+            backend1_calls.inc(method, 'circuit_open')
+            raise Backend1Error(f'Backend1 circuit open, skipping {method} {path}')
+        started = time.perf_counter()
+        try:
+            response = await asyncio.wait_for(self._client.request(method, path, **kwargs), timeout)
+        except (httpx.HTTPError, asyncio.TimeoutError) as error:
+            self.breaker.record_failure()
+            backend1_calls.inc(method, 'error')
+            raise Backend1Error(f'{method} {path} failed: {error!r}')
+        except BaseException:
+            # Cancelled (run() gave up waiting) or unexpected: still report
+            # back, so a half-open probe doesn't stay outstanding
+            self.breaker.record_failure()
+            backend1_calls.inc(method, 'error')
+            raise
+        finally:
+            backend1_seconds.observe(time.perf_counter() - started, method)
+        if response.status_code >= 500:
+            self.breaker.record_failure()
+            backend1_calls.inc(method, 'server_error')
+        else:
+            self.breaker.record_success()
+            backend1_calls.inc(method, 'ok')
+        return response
+
+    async def get(self, path, **kwargs):
+        return await self.request('GET', path, **kwargs)
+
+    async def post(self, path, json=None, **kwargs):
+        return await self.request('POST', path, json=json, **kwargs)
+
+    async def gather(self, *coros):
+        # Run independent calls concurrently; failures come back as exceptions
+        return await asyncio.gather(*coros, return_exceptions=True)
+
+
+# Shares the circuit breaker with the pooled sync client
+async_backend1 = AsyncBackend1Client(breaker=backend1.breaker)
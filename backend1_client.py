@@ -0,0 +1,194 @@
+import os
+import queue
+import threading
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from background import BackgroundThread
+from metrics import backend1_calls, backend1_seconds
+
+# Client for the Backend1 (Node.js) peer.
+#
+# All calls share one pooled keep-alive session and go through a circuit
+# breaker, so a dead or slow peer is skipped instead of costing every request
+# a connect timeout. Write-through syncs are handed to a bounded background
+# queue and never block the caller.
+
+BACKEND1_URL = os.environ.get('BACKEND1_URL', 'http://localhost:3001')
+
+# (connect, read) timeouts in seconds
+READ_TIMEOUT = (0.5, 2)
+SYNC_TIMEOUT = (0.5, 1)
+
+
+class CircuitOpenError(requests.exceptions.RequestException):
+    pass
+
+
+class CircuitBreaker:
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half-open'
+
+    def __init__(self, failure_threshold=5, reset_timeout=10.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self.probe_started = 0.0
+        self._lock = threading.Lock()
+
+    def allow(self):
+        with self._lock:
+            if self.state == self.CLOSED:
+                return True
+            now = time.monotonic()
+            # Let a single probe through; everyone else keeps failing fast. A
+            # probe that never reported back (e.g. cancelled) expires after
+            # reset_timeout, so the breaker can't stay half-open forever.
+            if (self.state == self.OPEN and now - self.opened_at >= self.reset_timeout or
+                    self.state == self.HALF_OPEN and now - self.probe_started >= self.reset_timeout):
+                self.state = self.HALF_OPEN
+                self.probe_started = now
+                return True
+            return False
+
+    def retry_in(self):
+        # Seconds until allow() could let a call through again
+        with self._lock:
+            if self.state == self.CLOSED:
+                return 0.0
+            since = self.probe_started if self.state == self.HALF_OPEN else self.opened_at
+            return max(self.reset_timeout - (time.monotonic() - since), 0.0)
+
+    def record_success(self):
+        with self._lock:
+            self.state = self.CLOSED
+            self.failures = 0
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+                self.state = self.OPEN
+                self.opened_at = time.monotonic()
+
+
+class Backend1Client:
+    def __init__(self, base_url=BACKEND1_URL, pool_size=20, breaker=None):
+        self.base_url = base_url.rstrip('/')
+        self.breaker = breaker or CircuitBreaker()
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, max_retries=0)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+
+    def request(self, method, path, timeout=READ_TIMEOUT, **kwargs):
+        if not self.breaker.allow():
+            backend1_calls.inc(method, 'circuit_open')
+            raise CircuitOpenError(f'Backend1 circuit open, skipping {method} {path}')
+        started = time.perf_counter()
+        try:
+            response = self.session.request(method, self.base_url + path, timeout=timeout, **kwargs)
+        except BaseException:
+            # Any failure counts, so a half-open probe always reports back
+            self.breaker.record_failure()
+            backend1_calls.inc(method, 'error')
+            raise
+        finally:
+            backend1_seconds.observe(time.perf_counter() - started, method)
+        if response.status_code >= 500:
+            self.breaker.record_failure()
+            backend1_calls.inc(method, 'server_error')
+        else:
+            self.breaker.record_success()
+            backend1_calls.inc(method, 'ok')
+        return response
+
+    def get(self, path, **kwargs):
+        return self.request('GET', path, **kwargs)
+
+    def post(self, path, json=None, **kwargs):
+        return self.request('POST', path, json=json, **kwargs)
+
+
+class SyncQueue:
+    # Bounded write-through queue drained by a single background worker.
+    # Jobs are sent in batches over the pooled session and retried with
+    # exponential backoff; when the queue is full new jobs are dropped.
+    # While the circuit is open a job is held (not failed) until the breaker
+    # lets a call through again, so syncs made during an outage are sent
+    # once Backend1 is back; only calls that were actually made count as
+    # attempts.
+
+    def __init__(self, client, maxsize=1000, batch_size=50, max_retries=3, backoff=0.5):
+        self.client = client
+        self.batch_size = batch_size
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.stats = {'queued': 0, 'sent': 0, 'retried': 0, 'deferred': 0, 'failed': 0, 'dropped': 0}
+        self._queue = queue.Queue(maxsize=maxsize)
+        self._worker = BackgroundThread(self._run, 'backend1-sync')
+        self._lock = threading.Lock()
+
+    def submit(self, path, payload):
+        self._worker.ensure_started()
+        try:
+            self._queue.put_nowait((path, payload))
+            self._count('queued')
+            return True
+        except queue.Full:
+            self._count('dropped')
+            return False
+
+    def pending(self):
+        return self._queue.qsize()
+
+    def _count(self, stat):
+        with self._lock:
+            self.stats[stat] += 1
+
+    def start(self):
+        self._worker.ensure_started()
+
+    def _run(self):
+        while True:
+            batch = [self._queue.get()]
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            for path, payload in batch:
+                self._send(path, payload)
+                self._queue.task_done()
+
+    def _send(self, path, payload):
+        attempt = 0
+        while True:
+            try:
+                response = self.client.post(path, json=payload, timeout=SYNC_TIMEOUT)
+            except CircuitOpenError:
+                # Not an attempt: wait for the breaker instead of failing the job
+                self._count('deferred')
+                time.sleep(max(self.client.breaker.retry_in(), 0.05))
+                continue
+            except requests.exceptions.RequestException:
+                response = None
+            if response is not None and response.status_code < 500:
+                self._count('sent')
+                return
+            # Every call that reached (or tried to reach) Backend1 counts, so a
+            # payload it always rejects fails after max_retries
+            attempt += 1
+            if attempt > self.max_retries:
+                self._count('failed')
+                return
+            self._count('retried')
+            time.sleep(self.backoff * (2 ** (attempt - 1)))
+
+backend1 = Backend1Client()
+sync_queue = SyncQueue(backend1)
@@ -1,196 +1,731 @@
-from flask import Flask, request, jsonify
+from flask import Flask, Response, g, request, jsonify
+from flask.json.provider import DefaultJSONProvider
 from flask_cors import CORS
-from datetime import datetime
+from datetime import datetime, timedelta
+import asyncio
+import math
+import os
 import random
-import hashlib
-import base64
-import json
-import requests
+import threading
+import time
+from urllib.parse import urlencode
+from aggregates import Aggregates
+from async_server import AsyncServer, Response as AsyncResponse
+from auth import SessionCache, generate_token, hash_password, verify_password
+from backend1_async import Backend1Error, async_backend1
+from backend1_client import sync_queue
+from cache import ResponseCache, TTLCache, make_etag, merge_unique
+from dispatch import Dispatcher
+from eta import EtaModel, EtaRefresher, parse_time
+from export import gzip_chunks, ndjson_chunks
+from geo import GeoIndex, valid_position
+from pagination import paginate, parse_filters, time_range, wants_page
+from pricing import PriceTables, price_order, price_orders
+from notifier import NotificationPipeline
+from pubsub import Hub
+from records import Record
+from lifecycle import FINAL_STATUSES, TransitionError, check_transition
+from metrics import registry
+import profiler
+from ids import WORKER_COUNT, WORKER_INDEX, IdSequence
+from store import DuplicateKeyError, Store
+from wal import Persistence
+
+class RecordJSONProvider(DefaultJSONProvider):
+    # Compact records (records.py) are turned into their API dicts only here
+    @staticmethod
+    def default(o):
+        if isinstance(o, Record):
+            return o.to_dict()
+        return DefaultJSONProvider.default(o)
 
 app = Flask(__name__)
+app.json = RecordJSONProvider(app)
 CORS(app)
 
-# Simple token generation (for demo - use proper JWT library in production)
-def generate_token(user_id):
-    payload = {'userId': user_id, 'timestamp': int(datetime.now().timestamp() * 1000)}
-    return base64.b64encode(json.dumps(payload).encode()).decode()
+# Merged (local + Backend1) restaurant list and menus, invalidated on local writes
+RESTAURANTS_TTL = 30
+MENU_TTL = 15
+merged_cache = TTLCache(default_ttl=RESTAURANTS_TTL)
 
-def verify_token(token):
+# Serialized bodies of polled read endpoints, rebuilt only when the resource changes
+response_cache = ResponseCache()
+
+def serialize(data):
+    return app.json.dumps(data).encode()
+
+def conditional_json(etag, body):
+    # Strong ETag + If-None-Match handling; unchanged resources answer 304
+    response = Response(body, mimetype='application/json')
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = 'no-cache'
+    return response.make_conditional(request)
+
+def cached_json(key, version, build):
+    etag, body = response_cache.get_or_build(key, version, lambda: serialize(build()))
+    return conditional_json(etag, body)
+
+def list_response(collection, filters):
+    # Without paging parameters the full list is returned (cached per
+    # generation); otherwise a page, with the next cursor in X-Next-Cursor
+    if not wants_page(request.args, filters):
+        return cached_json(collection.name, collection.generation, collection.all)
     try:
-        payload = json.loads(base64.b64decode(token.encode()).decode())
-        return payload
-    except:
-        return None
+        records, next_cursor = paginate(collection, request.args, filters)
+    except ValueError as error:
+        return jsonify({'error': str(error)}), 400
+    response = jsonify(records)
+    if next_cursor:
+        response.headers['X-Next-Cursor'] = next_cursor
+        args = request.args.to_dict()
+        args['cursor'] = next_cursor
+        response.headers['Link'] = f'<{request.base_url}?{urlencode(args)}>; rel="next"'
+    return response
+
+def export_response(collection, filters):
+    # Stream the collection as NDJSON (chunked), gzip-compressed when accepted
+    try:
+        where = parse_filters(request.args, filters)
+        since, until = time_range(request.args)
+    except ValueError as error:
+        return jsonify({'error': str(error)}), 400
+    chunks = ndjson_chunks(collection, where=where, since=since, until=until)
+    headers = {'Content-Disposition': f'attachment; filename="{collection.name}.jsonl"'}
+    if 'gzip' in request.accept_encodings:
+        chunks = gzip_chunks(chunks)
+        headers['Content-Encoding'] = 'gzip'
+        headers['Vary'] = 'Accept-Encoding'
+    return Response(chunks, mimetype='application/x-ndjson', headers=headers)
 
-# User storage (in-memory)
-users = []
+def cache_merged(key, data, ttl):
+    body = serialize(data)
+    return merged_cache.set(key, (make_etag(body), body, data), ttl)
 
-# In-memory databases (for simplicity)
-restaurants = []
-menu_items = []
-orders = []
-deliveries = []
-notifications = []
+# Signed tokens (see auth.py); verified tokens are cached per process
+sessions = SessionCache()
 
-# Mock delivery partners
+def verify_token(token):
+    return sessions.verify(token)
+
+# Query filters accepted by the list and export endpoints
+ORDER_FILTERS = {'status': str, 'userId': str, 'restaurantId': int}
+DELIVERY_FILTERS = {'status': str, 'orderId': str, 'partnerId': str}
+NOTIFICATION_FILTERS = {'userId': str, 'status': str, 'type': str, 'orderId': str}
+
+# In-memory databases (for simplicity), indexed for constant-time lookups
+store = Store()
+users = store.users
+restaurants = store.restaurants
+menu_items = store.menu_items
+orders = store.orders
+deliveries = store.deliveries
+notifications = store.notifications
+
+# Mock delivery partners; each can carry up to `capacity` active orders
+PARTNER_CAPACITY = int(os.environ.get('BACKEND2_PARTNER_CAPACITY', 3))
 MOCK_PARTNERS = [
-    {'id': 'DP001', 'name': 'John Doe', 'phone': '+1234567890', 'available': True},
-    {'id': 'DP002', 'name': 'Jane Smith', 'phone': '+1234567891', 'available': True},
-    {'id': 'DP003', 'name': 'Mike Johnson', 'phone': '+1234567892', 'available': True},
+    {'id': 'DP001', 'name': 'John Doe', 'phone': '+1234567890', 'available': True,
+     'latitude': 40.7128, 'longitude': -74.0060},
+    {'id': 'DP002', 'name': 'Jane Smith', 'phone': '+1234567891', 'available': True,
+     'latitude': 40.7306, 'longitude': -73.9866},
+    {'id': 'DP003', 'name': 'Mike Johnson', 'phone': '+1234567892', 'available': True,
+     'latitude': 40.7580, 'longitude': -73.9855},
 ]
+for partner in MOCK_PARTNERS:
+    partner.update(capacity=PARTNER_CAPACITY, activeOrders=0)
+partners = {partner['id']: partner for partner in MOCK_PARTNERS}
+
+# Spatial index for nearby search and dispatch pickup points
+restaurant_locations = GeoIndex()
+
+def parse_position(lat, lng):
+    # (lat, lng) as floats; ValueError unless both are finite and in range
+    lat, lng = float(lat), float(lng)
+    if not valid_position(lat, lng):
+        raise ValueError('latitude must be within [-90, 90] and longitude within [-180, 180]')
+    return lat, lng
+
+def index_restaurant_locations():
+    restaurant_locations.clear()
+    for restaurant in restaurants:
+        restaurant_locations.put(restaurant['id'], restaurant['latitude'], restaurant['longitude'])
+
+# Id sequences, safe to share between request threads (and striped per
+# worker process via BACKEND2_WORKER_INDEX / BACKEND2_WORKER_COUNT)
+restaurant_ids = IdSequence()
+menu_item_ids = IdSequence()
+order_ids = IdSequence()
+order_numbers = IdSequence()
+delivery_ids = IdSequence()
+notification_ids = IdSequence()
+
+# Durable state: set BACKEND2_DATA_DIR to keep a write-ahead log and snapshots
+DATA_DIR = os.environ.get('BACKEND2_DATA_DIR')
+persistence = None
+
+def next_counter(collection, field, prefix=''):
+    # Highest numeric suffix of ids like ORD-12 in the collection, plus one
+    highest = 0
+    for record in collection:
+        value = str(record.get(field, ''))
+        if value.startswith(prefix) and value[len(prefix):].isdigit():
+            highest = max(highest, int(value[len(prefix):]))
+    return highest + 1
+
+def start_persistence():
+    global persistence
+    # Each pre-forked worker owns its own log directory
+    data_dir = os.path.join(DATA_DIR, f'worker-{WORKER_INDEX}') if WORKER_COUNT > 1 else DATA_DIR
+    persistence = Persistence(store, data_dir,
+        snapshot_every=int(os.environ.get('BACKEND2_SNAPSHOT_EVERY', 50000)),
+        flush_interval=float(os.environ.get('BACKEND2_WAL_FLUSH_MS', 5)) / 1000)
+    recovery = persistence.start()
+    restaurant_ids.advance_to(next_counter(restaurants, 'id'))
+    menu_item_ids.advance_to(next_counter(menu_items, 'id'))
+    order_ids.advance_to(next_counter(orders, 'orderId', 'ORD-'))
+    order_numbers.advance_to(next_counter(orders, 'id'))
+    delivery_ids.advance_to(next_counter(deliveries, 'deliveryId', 'DEL-'))
+    notification_ids.advance_to(next_counter(notifications, 'id', 'NOTIF-'))
+    index_restaurant_locations()
+    restore_dispatch_state()
+    learn_eta_history()
+    order_aggregates.rebuild(orders)
+    print(f'[WAL] Recovered {recovery["snapshotRecords"]} snapshot records and '
+          f'{recovery["replayedEntries"]} log entries in {recovery["seconds"]}s')
+    return recovery
+
+@app.after_request
+def commit_writes(response):
+    # Group commit: wait until this request's mutations are fsynced
+    if persistence is not None:
+        persistence.commit()
+    return response
+
+# Request metrics, exported at /metrics. Routes are labelled by their rule
+# (/api/orders/<order_id>), not the URL, to keep the label set bounded.
+http_requests = registry.counter('backend2_http_requests_total',
+    'HTTP requests by route, method and status', ('route', 'method', 'status'))
+http_seconds = registry.histogram('backend2_http_request_duration_seconds',
+    'HTTP request latency by route', ('route', 'method'))
+http_in_flight = registry.gauge('backend2_http_requests_in_flight', 'Requests currently being handled')
+collection_records = registry.gauge('backend2_collection_records', 'Records per collection', ('collection',))
+collection_records.set_function(lambda: {(c.name,): len(c) for c in store.collections()})
+queue_depth = registry.gauge('backend2_queue_depth', 'Items waiting in background queues', ('queue',))
+queue_depth.set_function(lambda: {
+    ('backend1_sync',): sync_queue.pending(),
+    ('notifications',): notification_pipeline.depth(),
+    ('dispatch',): dispatcher.stats['pending']
+})
+
+@app.before_request
+def start_request_timer():
+    g.request_started = time.perf_counter()
+    http_in_flight.inc()
+
+@app.after_request
+def record_status(response):
+    g.response_status = response.status_code
+    return response
+
+@app.teardown_request
+def record_request(error=None):
+    started = g.pop('request_started', None)
+    if started is None:
+        return
+    http_in_flight.dec()
+    route = request.url_rule.rule if request.url_rule is not None else 'unmatched'
+    http_seconds.observe(time.perf_counter() - started, route, request.method)
+    http_requests.inc(route, request.method, str(g.pop('response_status', 500)))
+
+def observe_async_request(route, method, status, seconds):
+    if seconds is not None:
+        http_seconds.observe(seconds, route, method)
+    http_requests.inc(route, method, str(status))
+
+# Routes that mostly wait are served on the Backend1 client loop by an
+# event-loop server on BACKEND2_ASYNC_PORT (see async_server.py), so they hold
+# no request thread; the load balancer sends them there
+ASYNC_PORT = int(os.environ.get('BACKEND2_ASYNC_PORT', 3003))
+async_front = AsyncServer(observe=observe_async_request)
+
+def async_json(status, data, headers=None):
+    return AsyncResponse(status, serialize(data), dict(headers or {}, **{'Content-Type': 'application/json'}))
+
+# Notifications: the store keeps the newest NOTIFICATION_RETENTION records,
+# and each user's last NOTIFICATION_BUFFER events are pushed to live streams
+NOTIFICATION_RETENTION = int(os.environ.get('BACKEND2_NOTIFICATION_RETENTION', 10000))
+NOTIFICATION_BUFFER = int(os.environ.get('BACKEND2_NOTIFICATION_BUFFER', 100))
+SSE_HEARTBEAT = 15
+# Streams are coroutines on the event-loop server; the cap only bounds memory
+MAX_STREAMS = int(os.environ.get('BACKEND2_MAX_STREAMS', 10000))
+open_streams = 0
+notification_hub = Hub(buffer_size=NOTIFICATION_BUFFER)
+
+def notification_event_id(notification):
+    # NOTIF-<n> ids only grow (also across restarts), so n is the stream position
+    return int(notification['id'].rsplit('-', 1)[1])
+
+def publish_notification(notification):
+    notification_hub.publish(notification['userId'], notification_event_id(notification), notification)
+
+def evict_notifications():
+    # Trim in chunks of a tenth of the retention so eviction stays amortized
+    excess = len(notifications) - NOTIFICATION_RETENTION
+    if excess > NOTIFICATION_RETENTION // 10:
+        notifications.evict(excess)
+
+def prime_notification_streams():
+    for notification in notifications:
+        publish_notification(notification)
 
-order_id_counter = 1
-delivery_id_counter = 1
-notification_id_counter = 1
+def sse_event(event_id, data):
+    return f'id: {event_id}\nevent: notification\ndata: {app.json.dumps(data)}\n\n'
+
+def store_notifications(events):
+    # Pipeline worker: persist a batch and push it to streams under one lock.
+    # Ids and timestamps are assigned here so both grow with insertion order,
+    # and publishing under the lock keeps stream ids in that order too
+    # (publishing only queues the event for each subscriber).
+    with notifications.lock:
+        batch = []
+        for event in events:
+            notification = {'id': f'NOTIF-{notification_ids.next()}', **event,
+                'timestamp': datetime.now().isoformat()}
+            notifications.insert(notification)
+            batch.append(notification)
+        evict_notifications()
+        for notification in batch:
+            publish_notification(notification)
+    if NOTIFICATION_LOG:
+        print('\n'.join(f'[NOTIFICATION] {n["title"]}: {n["message"]}' for n in batch))
+
+# Handlers only enqueue; NOTIFICATION_WORKERS threads batch, persist and publish
+NOTIFICATION_LOG = os.environ.get('BACKEND2_NOTIFICATION_LOG', '1') == '1'
+notification_pipeline = NotificationPipeline(store_notifications,
+    workers=int(os.environ.get('BACKEND2_NOTIFICATION_WORKERS', 2)),
+    maxsize=int(os.environ.get('BACKEND2_NOTIFICATION_QUEUE', 10000)))
 
 # Helper functions
 def send_notification(user_id, notif_type, title, message, order_id, status):
-    notification = {
-        'id': f'NOTIF-{notification_id_counter}',
+    notification_pipeline.submit(user_id, {
         'userId': user_id,
         'type': notif_type,
         'title': title,
         'message': message,
         'orderId': order_id,
-        'status': status,
-        'timestamp': datetime.now().isoformat()
-    }
-    notifications.append(notification)
-    notification_id_counter += 1
-    print(f'[NOTIFICATION] {title}: {message}')
-    return notification
-
-def assign_delivery_partner(order_id):
-    partner = random.choice(MOCK_PARTNERS)
-    delivery_id = f'DEL-{delivery_id_counter}'
-    delivery_id_counter += 1
-    
-    estimated_time = datetime.now()
-    estimated_time = estimated_time.replace(minute=estimated_time.minute + 30 + random.randint(0, 15))
-    
-    delivery = {
-        'id': delivery_id,
-        'deliveryId': delivery_id,
-        'orderId': order_id,
-        'partnerId': partner['id'],
-        'partnerName': partner['name'],
-        'partnerPhone': partner['phone'],
-        'status': 'ASSIGNED',
-        'estimatedDeliveryTime': estimated_time.isoformat(),
-        'createdAt': datetime.now().isoformat()
-    }
-    deliveries.append(delivery)
+        'status': status
+    })
+
+def assign_delivery_partner(order_id, partner, distance):
+    # Called by the dispatcher once the batch matching picked a partner
+    order = orders.get(order_id)
+    if not order:
+        dispatcher.release(partner)
+        return None
+    
+    now = datetime.now()
+    eta = eta_model.estimate([eta_job(order, partner, distance)], now.timestamp())[0]
+    estimated_time = now + timedelta(seconds=float(eta) - now.timestamp())
+    
+    with orders.lock:
+        # Cancelled between the dispatch tick and now: release_order found
+        # nothing to free, so give the partner back here
+        if order['status'] in FINAL_STATUSES:
+            dispatcher.release(partner)
+            return None
+        delivery_id = f'DEL-{delivery_ids.next()}'
+        delivery = {
+            'id': delivery_id,
+            'deliveryId': delivery_id,
+            'orderId': order_id,
+            'partnerId': partner['id'],
+            'partnerName': partner['name'],
+            'partnerPhone': partner['phone'],
+            'pickupDistanceKm': round(distance, 3),
+            'status': 'ASSIGNED',
+            'estimatedDeliveryTime': estimated_time.isoformat(),
+            'createdAt': now.isoformat()
+        }
+        deliveries.insert(delivery)
+        orders.update(order, deliveryId=delivery_id)
     
-    send_notification('user', 'DELIVERY_ASSIGNED', 'Delivery Partner Assigned',
+    send_notification(order['userId'], 'DELIVERY_ASSIGNED', 'Delivery Partner Assigned',
         f'Your order {order_id} has been assigned to {partner["name"]}. Estimated delivery: {estimated_time.strftime("%I:%M %p")}',
         order_id, 'OUT_FOR_DELIVERY')
     
     return delivery
 
+# Delivery ETAs, learned from order timestamps and refreshed in batches
+ETA_REFRESH_TOLERANCE = 60
+STATUS_TIMESTAMPS = {'PREPARING': 'preparingAt', 'OUT_FOR_DELIVERY': 'outForDeliveryAt', 'DELIVERED': 'deliveredAt'}
+eta_model = EtaModel()
+
+def eta_job(order, partner=None, pickup_km=None):
+    # partner['activeOrders'] already counts this order
+    return {
+        'order': order,
+        'restaurantPosition': restaurant_locations.position(order['restaurantId']),
+        'pickupKm': pickup_km,
+        'queueAhead': partner['activeOrders'] - 1 if partner else 0
+    }
+
+def active_eta_jobs():
+    jobs = []
+    for status in ('PREPARING', 'OUT_FOR_DELIVERY'):
+        for order in orders.find('status', status):
+            delivery = deliveries.get(order['deliveryId']) if order.get('deliveryId') else None
+            if delivery:
+                job = eta_job(order, partners.get(delivery['partnerId']), delivery.get('pickupDistanceKm'))
+                jobs.append((job, delivery))
+    return jobs
+
+def publish_eta(delivery, eta):
+    # Only rewrite estimates that moved, to keep log writes and ETag churn low
+    current = parse_time(delivery.get('estimatedDeliveryTime'))
+    if current is None or abs(eta - current) >= ETA_REFRESH_TOLERANCE:
+        deliveries.update(delivery, estimatedDeliveryTime=datetime.fromtimestamp(eta).isoformat())
+
+def learn_eta_history():
+    # After recovery: replay finished orders into the running averages
+    for order in orders.find('status', 'DELIVERED'):
+        eta_model.observe(order, restaurant_locations.position(order['restaurantId']))
+
+eta_refresher = EtaRefresher(eta_model, active_eta_jobs, publish_eta,
+    interval=float(os.environ.get('BACKEND2_ETA_REFRESH_SECONDS', 5)))
+
+# Order status changes (see lifecycle.py for the allowed transitions)
+RESTAURANT_ACTIONS = {'accept': 'CONFIRMED', 'reject': 'CANCELLED'}
+STATUS_NOTIFICATIONS = {
+    'CONFIRMED': ('ORDER_CONFIRMED', 'Order Confirmed', 'Your order {} has been confirmed by the restaurant.'),
+    'PREPARING': ('ORDER_PREPARING', 'Order Being Prepared', 'Your order {} is being prepared.'),
+    'OUT_FOR_DELIVERY': ('ORDER_OUT_FOR_DELIVERY', 'Order Out for Delivery', 'Your order {} is on the way!'),
+    'DELIVERED': ('ORDER_DELIVERED', 'Order Delivered', 'Your order {} has been delivered. Enjoy your meal!'),
+    'CANCELLED': ('ORDER_CANCELLED', 'Order Cancelled', 'Your order {} has been cancelled.')
+}
+MAX_STATUS_BATCH = 500
+# Per-restaurant and per-user order tallies, kept current as orders change
+order_aggregates = Aggregates(
+    bucket_seconds=int(os.environ.get('BACKEND2_AGGREGATE_BUCKET_SECONDS', 3600)),
+    bucket_count=int(os.environ.get('BACKEND2_AGGREGATE_BUCKETS', 24)))
+# Results of requests sent with an Idempotency-Key, replayed on retries
+idempotent_results = TTLCache(default_ttl=24 * 3600, maxsize=100000)
+
+def order_etag(order):
+    etag, _ = response_cache.get_or_build(('order', order['orderId']), orders.version(order['orderId']),
+        lambda: serialize(order))
+    return etag
+
+def if_match_etags():
+    # ETags listed in If-Match, or None ('*' or no header: no check)
+    if request.if_match.star_tag or not request.if_match:
+        return None
+    return request.if_match.as_set()
+
+def transition_order(order, status, etags=None):
+    # Check and apply one transition atomically; side effects only run when
+    # the status actually changed
+    with orders.lock:
+        if etags is not None and order_etag(order) not in etags:
+            raise TransitionError('version_conflict', 'Order was modified; fetch it again and retry', 412)
+        if not check_transition(order['status'], status):
+            return False
+        if status == 'OUT_FOR_DELIVERY' and not order.get('deliveryId'):
+            # Still queued for dispatch: without this a partner could be
+            # assigned after pickup, or never (DELIVERED before the tick)
+            raise TransitionError('not_dispatched', 'No delivery partner assigned yet; retry shortly')
+        now = datetime.now().isoformat()
+        changes = {'status': status, 'updatedAt': now}
+        if status in STATUS_TIMESTAMPS:
+            changes[STATUS_TIMESTAMPS[status]] = now
+        previous = order['status']
+        orders.update(order, **changes)
+        order_aggregates.move(order, previous, status)
+        
+        if status == 'PREPARING':
+            # A partner is assigned by the next dispatch tick
+            dispatch_order(order)
+        if status in ('DELIVERED', 'CANCELLED'):
+            release_order(order)
+        if status == 'DELIVERED':
+            eta_model.observe(order, restaurant_locations.position(order['restaurantId']))
+    
+    notif_type, title, message = STATUS_NOTIFICATIONS[status]
+    send_notification(order['userId'], notif_type, title, message.format(order['orderId']),
+        order['orderId'], status)
+    return True
+
+def update_status(order_id, status, etags=None, idempotency_key=None):
+    # (http status, body) for one status update, replayed for a repeated
+    # Idempotency-Key
+    if idempotency_key:
+        replay = idempotent_results.get((order_id, idempotency_key))
+        if replay is not None:
+            if replay[0] != status:
+                return 422, {'error': 'Idempotency-Key was already used with a different status',
+                    'code': 'idempotency_mismatch'}
+            return replay[1]
+    
+    order = orders.get(order_id)
+    if not order:
+        return 404, {'error': 'Order not found'}
+    try:
+        transition_order(order, status, etags)
+        result = (200, dict(order))
+    except TransitionError as error:
+        result = (error.http_status, {'error': str(error), 'code': error.code, 'currentStatus': order['status']})
+    
+    # not_dispatched is temporary, so a retry with the same key runs again
+    if idempotency_key and result[1].get('code') != 'not_dispatched':
+        idempotent_results.set((order_id, idempotency_key), (status, result))
+    return result
+
+def status_update_error(update):
+    # Why a status update (a batch item or a PATCH body) is malformed, or None
+    if not isinstance(update, dict):
+        return 'Each update must be a JSON object'
+    if not isinstance(update.get('status'), str):
+        return 'status must be a string'
+    for field in ('etag', 'idempotencyKey'):
+        if update.get(field) is not None and not isinstance(update[field], str):
+            return f'{field} must be a string'
+    return None
+
+def status_response(status, body):
+    response = jsonify(body)
+    response.status_code = status
+    if status == 200:
+        response.set_etag(order_etag(orders.get(body['orderId'])))
+    return response
+
+# Batched dispatch of PREPARING orders to partners
+dispatcher = Dispatcher(MOCK_PARTNERS, assign_delivery_partner,
+    window=float(os.environ.get('BACKEND2_DISPATCH_WINDOW_MS', 500)) / 1000)
+
+def dispatch_order(order):
+    dispatcher.submit(order['orderId'], restaurant_locations.position(order['restaurantId']))
+
+def release_order(order):
+    # Order finished or cancelled: drop it from the queue or free its partner
+    if dispatcher.cancel(order['orderId']) or not order.get('deliveryId'):
+        return
+    delivery = deliveries.get(order['deliveryId'])
+    if delivery and delivery['partnerId'] in partners:
+        dispatcher.release(partners[delivery['partnerId']])
+
+def restore_dispatch_state():
+    # After recovery: re-reserve partners for open deliveries and re-queue
+    # PREPARING orders that never got one
+    for order in orders:
+        if order['status'] in ('DELIVERED', 'CANCELLED'):
+            continue
+        delivery = deliveries.get(order['deliveryId']) if order.get('deliveryId') else None
+        if delivery and delivery['partnerId'] in partners:
+            dispatcher.reserve(partners[delivery['partnerId']])
+        elif order['status'] == 'PREPARING':
+            dispatch_order(order)
+
+# Backend1 fan-out, run on the async client loop via async_backend1.run()
+#
+# The last Backend1 payload of each merged view is kept. Once it is older
+# than the view's TTL it is still served (merged with current local data)
+# while a background task fetches a new one, so request threads only wait
+# for Backend1 when a view was never fetched or its payload is older than
+# BACKEND1_MAX_STALE. Both are only touched on the client loop, and at most
+# BACKEND1_SNAPSHOTS payloads are kept (menus are keyed by any restaurant id
+# a client asks for).
+BACKEND1_MAX_STALE = int(os.environ.get('BACKEND2_BACKEND1_MAX_STALE_SECONDS', 300))
+BACKEND1_SNAPSHOTS = int(os.environ.get('BACKEND2_BACKEND1_SNAPSHOTS', 10000))
+backend1_snapshots = {}
+backend1_refreshing = set()
+
+def store_backend1_snapshot(key, data):
+    # Bounded like TTLCache: past the limit, drop payloads too stale to serve,
+    # then the least recently fetched (dicts keep insertion order)
+    now = time.monotonic()
+    backend1_snapshots.pop(key, None)
+    if len(backend1_snapshots) >= BACKEND1_SNAPSHOTS:
+        for stale in [k for k, (fetched_at, _) in backend1_snapshots.items() if now - fetched_at >= BACKEND1_MAX_STALE]:
+            del backend1_snapshots[stale]
+        if len(backend1_snapshots) >= BACKEND1_SNAPSHOTS:
+            del backend1_snapshots[next(iter(backend1_snapshots))]
+    backend1_snapshots[key] = (now, data)
+
+async def fetch_backend1_list(key, path, ttl):
+    snapshot = backend1_snapshots.get(key)
+    age = time.monotonic() - snapshot[0] if snapshot else None
+    if snapshot is None or age >= BACKEND1_MAX_STALE:
+        return await refresh_backend1_list(key, path)
+    if age >= ttl and key not in backend1_refreshing:
+        backend1_refreshing.add(key)
+        asyncio.ensure_future(refresh_backend1_list(key, path, background=True))
+    return snapshot[1]
+
+async def refresh_backend1_list(key, path, background=False):
+    try:
+        backend1_response = await async_backend1.get(path)
+        data = backend1_response.json() if backend1_response.status_code == 200 else []
+        store_backend1_snapshot(key, data)
+        if background:
+            merged_cache.invalidate(key)
+        return data
+    except Backend1Error:
+        if background:
+            return None
+        raise
+    finally:
+        backend1_refreshing.discard(key)
+
+async def fetch_merged_restaurants():
+    cached = merged_cache.get('restaurants')
+    if cached is not None:
+        return cached
+    backend1_restaurants = await fetch_backend1_list('restaurants', '/api/restaurants', RESTAURANTS_TTL)
+    
+    # Merge restaurants, avoiding duplicates by name+address
+    merged_restaurants = merge_unique(restaurants.all(), backend1_restaurants,
+        key=lambda r: (r.get('name'), r.get('address')))
+    return cache_merged('restaurants', merged_restaurants, RESTAURANTS_TTL)
+
+async def fetch_merged_menu(restaurant_id):
+    cached = merged_cache.get(('menu', restaurant_id))
+    if cached is not None:
+        return cached
+    backend1_menu = await fetch_backend1_list(('menu', restaurant_id),
+        f'/api/restaurants/{restaurant_id}/menu', MENU_TTL)
+    
+    # Merge menu items, avoiding duplicates by name+restaurantId
+    merged_menu = merge_unique(menu_items.find('restaurantId', restaurant_id), backend1_menu,
+        key=lambda m: (m.get('name'), m.get('restaurantId')))
+    return cache_merged(('menu', restaurant_id), merged_menu, MENU_TTL)
+
+async def fetch_restaurants_with_menus():
+    # One call for the list, then every menu concurrently; a menu that fails
+    # or times out falls back to the local items for that restaurant
+    try:
+        merged_restaurants = (await fetch_merged_restaurants())[2]
+    except Backend1Error:
+        merged_restaurants = restaurants.all()
+    ids = [r.get('id') for r in merged_restaurants]
+    menus = await async_backend1.gather(*(fetch_merged_menu(restaurant_id) for restaurant_id in ids))
+    return [{**restaurant, 'menu': menu_items.find('restaurantId', restaurant_id)
+                if isinstance(menu, Exception) else menu[2]}
+            for restaurant, restaurant_id, menu in zip(merged_restaurants, ids, menus)]
+
 # AUTHENTICATION API
+#
+# Register and login mostly wait (on Backend1, and on the password KDF), so
+# they are coroutines served by the event-loop server; the load balancer
+# sends them there. The KDF runs in the loop's executor. The Flask routes run
+# the same coroutines for clients talking to this port directly.
 
-@app.route('/api/auth/register', methods=['POST'])
-def register():
+async def in_executor(function, *args):
+    return await asyncio.get_running_loop().run_in_executor(None, function, *args)
+
+async def register_user(data):
+    # (http status, body)
+    data = data if isinstance(data, dict) else {}
+    email = data.get('email')
+    password = data.get('password')
+    name = data.get('name')
+    phone = data.get('phone', '')
+    
+    if not email or not password or not name:
+        return 400, {'error': 'Email, password, and name are required'}
+    
+    # Check if user already exists locally
+    existing_user = users.find_one('email', email)
+    if existing_user:
+        return 400, {'error': 'User with this email already exists'}
+    
+    # Register on Backend1 (Node.js) first; one call either creates the
+    # user there (mirrored locally) or tells us to register locally
+    backend1_available = True
     try:
-        data = request.json
-        email = data.get('email')
-        password = data.get('password')
-        name = data.get('name')
-        phone = data.get('phone', '')
-        
-        if not email or not password or not name:
-            return jsonify({'error': 'Email, password, and name are required'}), 400
-        
-        # Check if user already exists locally
-        existing_user = next((u for u in users if u['email'] == email), None)
-        if existing_user:
-            return jsonify({'error': 'User with this email already exists'}), 400
-        
-        # Check if user exists on Backend1 (Node.js)
+        backend1_response = await async_backend1.post('/api/auth/register',
+            json={'email': email, 'password': password, 'name': name, 'phone': phone})
+        if backend1_response.status_code == 201:
+            # User was registered on Backend1, sync to local storage
+            backend1_user = backend1_response.json()['user']
+            users.insert({
+                'id': backend1_user['id'],
+                'email': backend1_user['email'],
+                'password': await in_executor(hash_password, password),
+                'name': backend1_user['name'],
+                'phone': backend1_user.get('phone', ''),
+                'createdAt': datetime.now().isoformat()
+            })
+            # Backend1's token isn't signed by us, so issue our own
+            return 201, dict(backend1_response.json(), token=generate_token(backend1_user['id']))
+    except Backend1Error:
+        # If Backend1 is unavailable, continue with local registration
+        backend1_available = False
+    
+    # Create new user locally
+    user_id = f'USER-{int(datetime.now().timestamp() * 1000)}-{random.randint(1000, 9999)}'
+    hashed_password = await in_executor(hash_password, password)
+    
+    user = {
+        'id': user_id,
+        'email': email,
+        'password': hashed_password,
+        'name': name,
+        'phone': phone,
+        'createdAt': datetime.now().isoformat()
+    }
+    
+    users.insert(user)
+    
+    # Backend1 was down: sync once it's back (dropped if the queue is full)
+    if not backend1_available:
+        sync_queue.submit('/api/auth/register',
+            {'email': email, 'password': password, 'name': name, 'phone': phone})
+    
+    # Generate token
+    token = generate_token(user_id)
+    
+    return 201, {
+        'message': 'User registered successfully',
+        'user': {
+            'id': user['id'],
+            'email': user['email'],
+            'name': user['name'],
+            'phone': user['phone']
+        },
+        'token': token
+    }
+
+async def login_user(data):
+    # (http status, body)
+    data = data if isinstance(data, dict) else {}
+    email = data.get('email')
+    password = data.get('password')
+    
+    if not email or not password:
+        return 400, {'error': 'Email and password are required'}
+    
+    # The password KDF only runs here and on register, never per request
+    local_user = users.find_one('email', email)
+    matches, outdated = await in_executor(verify_password, password, local_user['password']) if local_user else (False, False)
+    user = local_user if matches else None
+    if user and outdated:
+        # Legacy sha256 hash or old cost parameters: store a fresh hash
+        users.update(user, password=await in_executor(hash_password, password))
+    
+    # If user not found locally, check Backend1
+    if not user:
         try:
-            backend1_response = requests.post('http://localhost:3001/api/auth/register', 
-                json={'email': email, 'password': password, 'name': name, 'phone': phone},
-                timeout=2)
-            if backend1_response.status_code == 201:
-                # User was registered on Backend1, sync to local storage
+            backend1_response = await async_backend1.post('/api/auth/login',
+                json={'email': email, 'password': password})
+            if backend1_response.status_code == 200:
+                # User exists on Backend1, sync to local storage
                 backend1_user = backend1_response.json()['user']
-                users.append({
-                    'id': backend1_user['id'],
-                    'email': backend1_user['email'],
-                    'password': hashlib.sha256(password.encode()).hexdigest(),
-                    'name': backend1_user['name'],
-                    'phone': backend1_user.get('phone', ''),
-                    'createdAt': datetime.now().isoformat()
-                })
-                return jsonify(backend1_response.json()), 201
-        except requests.exceptions.RequestException:
-            # If Backend1 is unavailable, continue with local registration
-            pass
-        
-        # Create new user locally
-        user_id = f'USER-{int(datetime.now().timestamp() * 1000)}-{random.randint(1000, 9999)}'
-        hashed_password = hashlib.sha256(password.encode()).hexdigest()
-        
-        user = {
-            'id': user_id,
-            'email': email,
-            'password': hashed_password,
-            'name': name,
-            'phone': phone,
-            'createdAt': datetime.now().isoformat()
-        }
-        
-        users.append(user)
-        
-        # Sync to Backend1 (non-blocking)
-        try:
-            requests.post('http://localhost:3001/api/auth/register',
-                json={'email': email, 'password': password, 'name': name, 'phone': phone},
-                timeout=1)
-        except:
-            # Silently fail if Backend1 is unavailable
-            pass
-        
-        # Generate token
-        token = generate_token(user_id)
-        
-        return jsonify({
-            'message': 'User registered successfully',
-            'user': {
-                'id': user['id'],
-                'email': user['email'],
-                'name': user['name'],
-                'phone': user['phone']
-            },
-            'token': token
-        }), 201
-    except Exception as error:
-        print(f'Error registering user: {error}')
-        return jsonify({'error': 'Internal server error', 'message': str(error)}), 500
-
-@app.route('/api/auth/login', methods=['POST'])
-def login():
-    try:
-        data = request.json
-        email = data.get('email')
-        password = data.get('password')
-        
-        if not email or not password:
-            return jsonify({'error': 'Email and password are required'}), 400
-        
-        hashed_password = hashlib.sha256(password.encode()).hexdigest()
-        user = next((u for u in users if u['email'] == email and u['password'] == hashed_password), None)
-        
-        # If user not found locally, check Backend1
-        if not user:
-            try:
-                backend1_response = requests.post('http://localhost:3001/api/auth/login',
-                    json={'email': email, 'password': password},
-                    timeout=2)
-                if backend1_response.status_code == 200:
-                    # User exists on Backend1, sync to local storage
-                    backend1_user = backend1_response.json()['user']
-                    users.append({
+                hashed_password = await in_executor(hash_password, password)
+                user_id = local_user['id'] if local_user else backend1_user['id']
+                if local_user:
+                    # Password changed on Backend1, refresh the local copy
+                    users.update(local_user, password=hashed_password)
+                else:
+                    users.insert({
                         'id': backend1_user['id'],
                         'email': backend1_user['email'],
                         'password': hashed_password,
@@ -198,28 +733,55 @@ def login():
                         'phone': backend1_user.get('phone', ''),
                         'createdAt': datetime.now().isoformat()
                     })
-                    return jsonify(backend1_response.json())
-            except requests.exceptions.RequestException:
-                pass
-            
-            return jsonify({'error': 'Invalid email or password'}), 401
-        
-        # Generate token
-        token = generate_token(user['id'])
+                return 200, dict(backend1_response.json(), token=generate_token(user_id))
+        except Backend1Error:
+            pass
         
-        return jsonify({
-            'message': 'Login successful',
-            'user': {
-                'id': user['id'],
-                'email': user['email'],
-                'name': user['name'],
-                'phone': user['phone']
-            },
-            'token': token
-        })
+        return 401, {'error': 'Invalid email or password'}
+    
+    # Generate token
+    token = generate_token(user['id'])
+    
+    return 200, {
+        'message': 'Login successful',
+        'user': {
+            'id': user['id'],
+            'email': user['email'],
+            'name': user['name'],
+            'phone': user['phone']
+        },
+        'token': token
+    }
+
+async def auth_response(action, data, description):
+    try:
+        return await action(data)
+    except DuplicateKeyError:
+        # Lost a race with a concurrent registration for the same email
+        return 400, {'error': 'User with this email already exists'}
     except Exception as error:
-        print(f'Error logging in: {error}')
-        return jsonify({'error': 'Internal server error', 'message': str(error)}), 500
+        print(f'Error {description}: {error}')
+        return 500, {'error': 'Internal server error', 'message': str(error)}
+
+@async_front.route('/api/auth/register', methods=('POST',))
+async def register_async(request):
+    return async_json(*await auth_response(register_user, request.json(), 'registering user'))
+
+@async_front.route('/api/auth/login', methods=('POST',))
+async def login_async(request):
+    return async_json(*await auth_response(login_user, request.json(), 'logging in'))
+
+@app.route('/api/auth/register', methods=['POST'])
+def register():
+    status, body = async_backend1.run(auth_response(register_user, request.get_json(silent=True), 'registering user'),
+        timeout=None)
+    return jsonify(body), status
+
+@app.route('/api/auth/login', methods=['POST'])
+def login():
+    status, body = async_backend1.run(auth_response(login_user, request.get_json(silent=True), 'logging in'),
+        timeout=None)
+    return jsonify(body), status
 
 @app.route('/api/auth/me', methods=['GET'])
 def get_current_user():
@@ -234,7 +796,7 @@ def get_current_user():
         if not payload:
             return jsonify({'error': 'Invalid token'}), 401
         
-        user = next((u for u in users if u['id'] == payload.get('userId')), None)
+        user = users.get(payload.get('userId'))
         if not user:
             return jsonify({'error': 'User not found'}), 404
         
@@ -248,6 +810,10 @@ def get_current_user():
         print(f'Error getting user: {error}')
         return jsonify({'error': 'Internal server error'}), 500
 
+@app.route('/api/auth/stats', methods=['GET'])
+def get_auth_stats():
+    return jsonify(sessions.summary())
+
 # RESTAURANT API
 @app.route('/api/restaurants', methods=['POST'])
 def create_restaurant():
@@ -258,30 +824,31 @@ def create_restaurant():
         
         if not name or not address:
             return jsonify({'error': 'Name and address are required'}), 400
+        try:
+            latitude, longitude = parse_position(data.get('latitude', 0), data.get('longitude', 0))
+        except (TypeError, ValueError):
+            return jsonify({'error': 'latitude and longitude must be numbers within range'}), 400
         
         restaurant = {
-            'id': len(restaurants) + 1,
+            'id': restaurant_ids.next(),
             'name': name,
             'cuisine': data.get('cuisine'),
             'address': address,
-            'latitude': float(data.get('latitude', 0)),
-            'longitude': float(data.get('longitude', 0)),
+            'latitude': latitude,
+            'longitude': longitude,
             'phone': data.get('phone'),
             'isActive': True,
             'createdAt': datetime.now().isoformat()
         }
-        restaurants.append(restaurant)
+        restaurants.insert(restaurant)
+        restaurant_locations.put(restaurant['id'], restaurant['latitude'], restaurant['longitude'])
+        merged_cache.invalidate('restaurants')
         
         # Sync to Backend1 (non-blocking)
-        try:
-            requests.post('http://localhost:3001/api/restaurants',
-                json={'name': name, 'cuisine': data.get('cuisine'), 'address': address,
-                      'latitude': data.get('latitude', 0), 'longitude': data.get('longitude', 0),
-                      'phone': data.get('phone')},
-                timeout=1)
-        except:
-            # Silently fail if Backend1 is unavailable
-            pass
+        sync_queue.submit('/api/restaurants',
+            {'name': name, 'cuisine': data.get('cuisine'), 'address': address,
+             'latitude': data.get('latitude', 0), 'longitude': data.get('longitude', 0),
+             'phone': data.get('phone')})
         
         return jsonify(restaurant), 201
     except Exception as error:
@@ -291,58 +858,66 @@ def create_restaurant():
 @app.route('/api/restaurants', methods=['GET'])
 def get_restaurants():
     try:
-        # Get restaurants from Backend1 and merge
+        # ?include=menu embeds every restaurant's menu, fetched concurrently
+        if request.args.get('include') == 'menu':
+            return jsonify(async_backend1.run(fetch_restaurants_with_menus(), timeout=5))
+        
+        # Get restaurants from Backend1 and merge (cached)
         try:
-            backend1_response = requests.get('http://localhost:3001/api/restaurants', timeout=2)
-            backend1_restaurants = backend1_response.json() if backend1_response.status_code == 200 else []
-            
-            # Merge restaurants, avoiding duplicates by name+address
-            merged_restaurants = list(restaurants)
-            for backend1_rest in backend1_restaurants:
-                exists = any(r['name'] == backend1_rest.get('name') and 
-                           r['address'] == backend1_rest.get('address') 
-                           for r in merged_restaurants)
-                if not exists:
-                    merged_restaurants.append(backend1_rest)
-            
-            return jsonify(merged_restaurants)
-        except:
+            etag, body, _ = async_backend1.run(fetch_merged_restaurants())
+            return conditional_json(etag, body)
+        except Backend1Error:
             # If Backend1 is unavailable, return local restaurants
-            return jsonify(restaurants)
+            return cached_json('restaurants-local', restaurants.generation, restaurants.all)
     except Exception as error:
         print(f'Error fetching restaurants: {error}')
         return jsonify({'error': 'Internal server error'}), 500
 
+@app.route('/api/restaurants/nearby', methods=['GET'])
+def get_nearby_restaurants():
+    try:
+        lat, lng = parse_position(request.args.get('lat', request.args.get('latitude')),
+            request.args.get('lng', request.args.get('longitude')))
+        radius = float(request.args.get('radius', 5))
+        if not math.isfinite(radius) or radius <= 0:
+            raise ValueError('radius must be a positive number')
+        # Nothing on Earth is further than half its circumference
+        radius = min(radius, 20040.0)
+    except (TypeError, ValueError):
+        return jsonify({'error': 'lat, lng (within range) and a positive radius (km) are required'}), 400
+    
+    nearby = []
+    for restaurant_id, distance in restaurant_locations.within(lat, lng, radius):
+        restaurant = restaurants.get(restaurant_id)
+        if restaurant and restaurant.get('isActive'):
+            nearby.append({**restaurant, 'distanceKm': round(distance, 3)})
+    return jsonify(nearby)
+
 @app.route('/api/restaurants/<int:restaurant_id>', methods=['GET'])
 def get_restaurant(restaurant_id):
-    restaurant = next((r for r in restaurants if r['id'] == restaurant_id), None)
+    restaurant = restaurants.get(restaurant_id)
     if not restaurant:
         return jsonify({'error': 'Restaurant not found'}), 404
     return jsonify(restaurant)
 
+@app.route('/api/restaurants/<int:restaurant_id>/stats', methods=['GET'])
+def get_restaurant_stats(restaurant_id):
+    if not restaurants.get(restaurant_id):
+        return jsonify({'error': 'Restaurant not found'}), 404
+    summary = order_aggregates.restaurant(restaurant_id) or order_aggregates.empty()
+    return jsonify(dict(summary, restaurantId=restaurant_id))
+
 @app.route('/api/restaurants/<int:restaurant_id>/menu', methods=['GET'])
 def get_restaurant_menu(restaurant_id):
     try:
-        local_menu = [item for item in menu_items if item['restaurantId'] == restaurant_id]
-        
-        # Get menu items from Backend1 and merge
+        # Get menu items from Backend1 and merge (cached)
         try:
-            backend1_response = requests.get(f'http://localhost:3001/api/restaurants/{restaurant_id}/menu', timeout=2)
-            backend1_menu = backend1_response.json() if backend1_response.status_code == 200 else []
-            
-            # Merge menu items, avoiding duplicates by name+restaurantId
-            merged_menu = list(local_menu)
-            for backend1_item in backend1_menu:
-                exists = any(m['name'] == backend1_item.get('name') and 
-                           m['restaurantId'] == backend1_item.get('restaurantId')
-                           for m in merged_menu)
-                if not exists:
-                    merged_menu.append(backend1_item)
-            
-            return jsonify(merged_menu)
-        except:
+            etag, body, _ = async_backend1.run(fetch_merged_menu(restaurant_id))
+            return conditional_json(etag, body)
+        except Backend1Error:
             # If Backend1 is unavailable, return local menu
-            return jsonify(local_menu)
+            return cached_json(('menu-local', restaurant_id), menu_items.generation,
+                lambda: menu_items.find('restaurantId', restaurant_id))
     except Exception as error:
         print(f'Error fetching menu: {error}')
         return jsonify({'error': 'Internal server error'}), 500
@@ -358,7 +933,7 @@ def create_menu_item(restaurant_id):
             return jsonify({'error': 'Name and price are required'}), 400
         
         menu_item = {
-            'id': len(menu_items) + 1,
+            'id': menu_item_ids.next(),
             'restaurantId': restaurant_id,
             'name': name,
             'description': data.get('description'),
@@ -367,17 +942,14 @@ def create_menu_item(restaurant_id):
             'available': data.get('available', True),
             'createdAt': datetime.now().isoformat()
         }
-        menu_items.append(menu_item)
+        menu_items.insert(menu_item)
+        merged_cache.invalidate(('menu', restaurant_id))
+        price_tables.invalidate(restaurant_id)
         
         # Sync to Backend1 (non-blocking)
-        try:
-            requests.post(f'http://localhost:3001/api/restaurants/{restaurant_id}/menu/items',
-                json={'name': name, 'description': data.get('description'), 'price': price,
-                      'category': data.get('category', 'General'), 'available': data.get('available', True)},
-                timeout=1)
-        except:
-            # Silently fail if Backend1 is unavailable
-            pass
+        sync_queue.submit(f'/api/restaurants/{restaurant_id}/menu/items',
+            {'name': name, 'description': data.get('description'), 'price': price,
+             'category': data.get('category', 'General'), 'available': data.get('available', True)})
         
         return jsonify(menu_item), 201
     except Exception as error:
@@ -385,163 +957,357 @@ def create_menu_item(restaurant_id):
         return jsonify({'error': 'Internal server error'}), 500
 
 # ORDER API
+# Menu price/availability tables used to validate and price orders
+price_tables = PriceTables(lambda restaurant_id: menu_items.find('restaurantId', restaurant_id))
+MAX_ORDER_BATCH = int(os.environ.get('BACKEND2_MAX_ORDER_BATCH', 1000))
+
+def is_count(value):
+    return type(value) is int and value > 0
+
+def parse_order(data):
+    # (error, None) or (None, (restaurant id, menu item ids, quantities))
+    if not isinstance(data, dict):
+        return 'Order must be an object', None
+    user_id = data.get('userId')
+    restaurant_id = data.get('restaurantId')
+    items = data.get('items')
+    delivery_address = data.get('deliveryAddress')
+    
+    if not user_id or not restaurant_id or not items or not delivery_address:
+        return 'Missing required fields', None
+    if not isinstance(user_id, (str, int)) or isinstance(user_id, bool):
+        return 'userId must be a string or number', None
+    try:
+        parse_position(data.get('deliveryLatitude', 0), data.get('deliveryLongitude', 0))
+    except (TypeError, ValueError):
+        return 'deliveryLatitude and deliveryLongitude must be numbers within range', None
+    
+    try:
+        restaurant = restaurants.get(int(restaurant_id))
+    except (TypeError, ValueError):
+        restaurant = None
+    if not restaurant or not restaurant.get('isActive'):
+        return 'Restaurant not available', None
+    
+    if not isinstance(items, list) or len(items) == 0:
+        return 'Items array is required and cannot be empty', None
+    
+    ids = []
+    quantities = []
+    for item in items:
+        menu_item_id = item.get('menuItemId') if isinstance(item, dict) else None
+        if not is_count(menu_item_id):
+            return f'Menu item {menu_item_id} not found or unavailable for restaurant {restaurant_id}', None
+        if not is_count(item.get('quantity')):
+            return f'Quantity for menu item {menu_item_id} must be a positive integer', None
+        ids.append(menu_item_id)
+        quantities.append(item['quantity'])
+    return None, (int(restaurant_id), ids, quantities)
+
+def place_order(data, restaurant_id, total_amount, items):
+    order_id = f'ORD-{order_ids.next()}'
+    record = {
+        'orderId': order_id,
+        'id': order_numbers.next(),
+        'userId': data['userId'],
+        'restaurantId': restaurant_id,
+        'status': 'CREATED',
+        'totalAmount': total_amount,
+        'items': [{'menuItemId': menu_item_id, 'quantity': quantity, 'menuItemName': name, 'price': price}
+                  for menu_item_id, quantity, name, price in items],
+        'deliveryAddress': data['deliveryAddress'],
+        'deliveryLatitude': float(data.get('deliveryLatitude', 0)),
+        'deliveryLongitude': float(data.get('deliveryLongitude', 0))
+    }
+    with orders.lock:
+        # Stamped under the lock so createdAt follows insertion order, which
+        # the createdFrom/createdTo binary search relies on. The tallies are
+        # updated under it too, or a status change could move() the order
+        # before add() counted it.
+        record['createdAt'] = record['updatedAt'] = datetime.now().isoformat()
+        order = orders.insert(record)
+        order_aggregates.add(order)
+    
+    send_notification(data['userId'], 'ORDER_CREATED', 'Order Placed Successfully',
+        f'Your order {order_id} has been placed. Total: ${total_amount:.2f}',
+        order_id, 'CREATED')
+    return order
+
 @app.route('/api/orders', methods=['POST'])
 def create_order():
-    global order_id_counter
     try:
         data = request.json
-        user_id = data.get('userId')
-        restaurant_id = data.get('restaurantId')
-        items = data.get('items')
-        delivery_address = data.get('deliveryAddress')
-        
-        if not user_id or not restaurant_id or not items or not delivery_address:
-            return jsonify({'error': 'Missing required fields'}), 400
+        error, parsed = parse_order(data)
+        if error:
+            return jsonify({'error': error}), 400
         
-        restaurant = next((r for r in restaurants if r['id'] == int(restaurant_id) and r.get('isActive')), None)
-        if not restaurant:
-            return jsonify({'error': 'Restaurant not available'}), 400
+        restaurant_id, ids, quantities = parsed
+        total_amount, items = price_order(price_tables.get(restaurant_id), ids, quantities)
+        if total_amount is None:
+            return jsonify({'error': f'Menu item {items} not found or unavailable for restaurant {restaurant_id}'}), 400
         
-        if not isinstance(items, list) or len(items) == 0:
-            return jsonify({'error': 'Items array is required and cannot be empty'}), 400
-        
-        # Validate menu items
-        validated_items = []
-        for item in items:
-            menu_item = next((m for m in menu_items 
-                            if m['id'] == item.get('menuItemId') 
-                            and m['restaurantId'] == int(restaurant_id)
-                            and m.get('available')), None)
-            if not menu_item:
-                return jsonify({'error': f'Menu item {item.get("menuItemId")} not found or unavailable for restaurant {restaurant_id}'}), 400
-            
-            validated_items.append({
-                **item,
-                'menuItemName': menu_item['name'],
-                'price': menu_item['price']
-            })
-        
-        total_amount = sum(float(item['price']) * item['quantity'] for item in validated_items)
-        
-        order_id = f'ORD-{order_id_counter}'
-        order_id_counter += 1
+        return jsonify(place_order(data, restaurant_id, total_amount, items)), 201
+    except Exception as error:
+        print(f'Error creating order: {error}')
+        return jsonify({'error': 'Internal server error', 'message': str(error)}), 500
+
+@app.route('/api/orders/batch', methods=['POST'])
+def create_orders():
+    # Many orders in one request: all of them are validated and priced in one
+    # pass, and each gets its own result. An order may carry an
+    # idempotencyKey, so a retried batch doesn't place it twice; a key
+    # repeated within one batch gets the first order's result.
+    try:
+        data = request.get_json(silent=True)
+        batch = data.get('orders') if isinstance(data, dict) else None
+        if not isinstance(batch, list) or not batch:
+            return jsonify({'error': 'orders array is required and cannot be empty'}), 400
+        if len(batch) > MAX_ORDER_BATCH:
+            return jsonify({'error': f'At most {MAX_ORDER_BATCH} orders per request'}), 400
         
-        order = {
-            'orderId': order_id,
-            'id': len(orders) + 1,
-            'userId': user_id,
-            'restaurantId': int(restaurant_id),
-            'status': 'CREATED',
-            'totalAmount': total_amount,
-            'items': validated_items,
-            'deliveryAddress': delivery_address,
-            'deliveryLatitude': float(data.get('deliveryLatitude', 0)),
-            'deliveryLongitude': float(data.get('deliveryLongitude', 0)),
-            'createdAt': datetime.now().isoformat(),
-            'updatedAt': datetime.now().isoformat()
-        }
-        orders.append(order)
+        results = [None] * len(batch)
+        keys = [None] * len(batch)
+        first_with_key = {}
+        repeats = []
+        pending = []
+        for index, order_data in enumerate(batch):
+            key = order_data.get('idempotencyKey') if isinstance(order_data, dict) else None
+            if key is not None and not isinstance(key, str):
+                results[index] = {'index': index, 'status': 400, 'error': 'idempotencyKey must be a string'}
+                continue
+            if key:
+                if key in first_with_key:
+                    repeats.append((index, first_with_key[key]))
+                    continue
+                first_with_key[key] = index
+                keys[index] = key
+                replay = idempotent_results.get(('order', key))
+                if replay is not None:
+                    results[index] = dict(replay, index=index, replayed=True)
+                    continue
+            error, parsed = parse_order(order_data)
+            if error:
+                results[index] = {'index': index, 'status': 400, 'error': error}
+            else:
+                pending.append((index, parsed))
         
-        send_notification(user_id, 'ORDER_CREATED', 'Order Placed Successfully',
-            f'Your order {order_id} has been placed. Total: ${total_amount:.2f}',
-            order_id, 'CREATED')
+        priced = price_orders(price_tables, [parsed for _, parsed in pending])
+        for (index, (restaurant_id, _, _)), (total_amount, items) in zip(pending, priced):
+            if total_amount is None:
+                results[index] = {'index': index, 'status': 400,
+                    'error': f'Menu item {items} not found or unavailable for restaurant {restaurant_id}'}
+                continue
+            order = place_order(batch[index], restaurant_id, total_amount, items)
+            results[index] = {'index': index, 'status': 201, 'order': dict(order)}
+            if keys[index]:
+                idempotent_results.set(('order', keys[index]), results[index])
+        for index, first in repeats:
+            results[index] = dict(results[first], index=index, replayed=True)
         
-        return jsonify(order), 201
+        return jsonify({
+            'created': sum(1 for result in results if result['status'] == 201 and not result.get('replayed')),
+            'replayed': sum(1 for result in results if result.get('replayed')),
+            'failed': sum(1 for result in results if result['status'] != 201),
+            'results': results
+        })
     except Exception as error:
-        print(f'Error creating order: {error}')
+        print(f'Error creating orders: {error}')
         return jsonify({'error': 'Internal server error', 'message': str(error)}), 500
 
 @app.route('/api/orders', methods=['GET'])
 def get_orders():
-    return jsonify(orders)
+    return list_response(orders, ORDER_FILTERS)
+
+@app.route('/api/orders/export', methods=['GET'])
+def export_orders():
+    return export_response(orders, ORDER_FILTERS)
+
+@app.route('/api/orders/user/<user_id>/summary', methods=['GET'])
+def get_user_order_summary(user_id):
+    summary = order_aggregates.user(user_id) or order_aggregates.empty()
+    return jsonify(dict(summary, userId=user_id))
 
 @app.route('/api/orders/<order_id>', methods=['GET'])
 def get_order(order_id):
-    order = next((o for o in orders if o['orderId'] == order_id), None)
+    order = orders.get(order_id)
     if not order:
         return jsonify({'error': 'Order not found'}), 404
-    return jsonify(order)
+    return cached_json(('order', order_id), orders.version(order_id), lambda: order)
 
 @app.route('/api/orders/<order_id>/restaurant-action', methods=['POST'])
 def restaurant_action(order_id):
-    data = request.json
-    action = data.get('action')
-    
-    order = next((o for o in orders if o['orderId'] == order_id), None)
-    if not order:
-        return jsonify({'error': 'Order not found'}), 404
-    
-    if action == 'accept':
-        order['status'] = 'CONFIRMED'
-        send_notification(order['userId'], 'ORDER_CONFIRMED', 'Order Confirmed',
-            f'Your order {order_id} has been confirmed by the restaurant.',
-            order_id, 'CONFIRMED')
-    elif action == 'reject':
-        order['status'] = 'CANCELLED'
-        send_notification(order['userId'], 'ORDER_CANCELLED', 'Order Cancelled',
-            f'Your order {order_id} has been cancelled.',
-            order_id, 'CANCELLED')
-    
-    order['updatedAt'] = datetime.now().isoformat()
-    return jsonify(order)
+    try:
+        data = request.json or {}
+        if not isinstance(data, dict):
+            return jsonify({'error': 'Request body must be a JSON object'}), 400
+        action = data.get('action')
+        
+        if not isinstance(action, str) or action not in RESTAURANT_ACTIONS:
+            return jsonify({'error': 'Action must be accept or reject'}), 400
+        
+        status, body = update_status(order_id, RESTAURANT_ACTIONS[action], etags=if_match_etags(),
+            idempotency_key=request.headers.get('Idempotency-Key'))
+        return status_response(status, body)
+    except Exception as error:
+        print(f'Error applying restaurant action: {error}')
+        return jsonify({'error': 'Internal server error', 'message': str(error)}), 500
 
 @app.route('/api/orders/<order_id>/status', methods=['PATCH'])
 def update_order_status(order_id):
-    data = request.json
-    status = data.get('status')
-    
-    order = next((o for o in orders if o['orderId'] == order_id), None)
-    if not order:
-        return jsonify({'error': 'Order not found'}), 404
-    
-    valid_statuses = ['CREATED', 'CONFIRMED', 'PREPARING', 'OUT_FOR_DELIVERY', 'DELIVERED', 'CANCELLED']
-    if status not in valid_statuses:
-        return jsonify({'error': 'Invalid status'}), 400
-    
-    order['status'] = status
-    order['updatedAt'] = datetime.now().isoformat()
-    
-    if status == 'PREPARING':
-        delivery = assign_delivery_partner(order_id)
-        order['deliveryId'] = delivery['deliveryId']
-        send_notification(order['userId'], 'ORDER_PREPARING', 'Order Being Prepared',
-            f'Your order {order_id} is being prepared.',
-            order_id, 'PREPARING')
-    
-    if status == 'OUT_FOR_DELIVERY':
-        send_notification(order['userId'], 'ORDER_OUT_FOR_DELIVERY', 'Order Out for Delivery',
-            f'Your order {order_id} is on the way!',
-            order_id, 'OUT_FOR_DELIVERY')
+    try:
+        data = request.json or {}
+        error = status_update_error(data)
+        if error:
+            return jsonify({'error': error}), 400
+        
+        status, body = update_status(order_id, data['status'], etags=if_match_etags(),
+            idempotency_key=request.headers.get('Idempotency-Key'))
+        return status_response(status, body)
+    except Exception as error:
+        print(f'Error updating order status: {error}')
+        return jsonify({'error': 'Internal server error', 'message': str(error)}), 500
+
+@app.route('/api/orders/status/batch', methods=['POST'])
+def update_order_statuses():
+    # Many transitions in one request, applied in order; each update may
+    # carry its own etag and idempotencyKey and gets its own result
+    try:
+        data = request.json or {}
+        updates = data.get('updates') if isinstance(data, dict) else None
+        if not isinstance(updates, list) or not updates:
+            return jsonify({'error': 'updates array is required and cannot be empty'}), 400
+        if len(updates) > MAX_STATUS_BATCH:
+            return jsonify({'error': f'At most {MAX_STATUS_BATCH} updates per request'}), 400
+        
+        results = []
+        for update in updates:
+            if not isinstance(update, dict) or not isinstance(update.get('orderId'), str) or not update['orderId']:
+                results.append({'status': 400, 'error': 'orderId is required'})
+                continue
+            error = status_update_error(update)
+            if error:
+                results.append({'orderId': update['orderId'], 'status': 400, 'error': error})
+                continue
+            status, body = update_status(update['orderId'], update['status'],
+                etags={update['etag'].strip('"')} if update.get('etag') else None, idempotency_key=update.get('idempotencyKey'))
+            result = {'orderId': update['orderId'], 'status': status}
+            result.update({'order': body} if status == 200 else body)
+            results.append(result)
+        
+        return jsonify({
+            'applied': sum(1 for result in results if result['status'] == 200),
+            'failed': sum(1 for result in results if result['status'] != 200),
+            'results': results
+        })
+    except Exception as error:
+        print(f'Error updating order statuses: {error}')
+        return jsonify({'error': 'Internal server error', 'message': str(error)}), 500
+
+# DELIVERY PARTNER API
+@app.route('/api/partners', methods=['GET'])
+def get_partners():
+    return jsonify(MOCK_PARTNERS)
+
+@app.route('/api/dispatch/stats', methods=['GET'])
+def get_dispatch_stats():
+    return jsonify(dispatcher.stats)
+
+@app.route('/api/eta/stats', methods=['GET'])
+def get_eta_stats():
+    return jsonify({'model': eta_model.stats(), 'refresh': eta_refresher.stats})
+
+@app.route('/api/partners/<partner_id>/location', methods=['PATCH'])
+def update_partner_location(partner_id):
+    partner = partners.get(partner_id)
+    if not partner:
+        return jsonify({'error': 'Partner not found'}), 404
     
-    if status == 'DELIVERED':
-        send_notification(order['userId'], 'ORDER_DELIVERED', 'Order Delivered',
-            f'Your order {order_id} has been delivered. Enjoy your meal!',
-            order_id, 'DELIVERED')
+    data = request.json or {}
+    try:
+        latitude, longitude = parse_position(data['latitude'], data['longitude'])
+    except (KeyError, TypeError, ValueError):
+        return jsonify({'error': 'Numeric latitude and longitude within range are required'}), 400
     
-    return jsonify(order)
+    partner.update(latitude=latitude, longitude=longitude)
+    return jsonify(partner)
 
 # DELIVERY API
 @app.route('/api/deliveries', methods=['GET'])
 def get_deliveries():
-    return jsonify(deliveries)
+    return list_response(deliveries, DELIVERY_FILTERS)
 
 @app.route('/api/deliveries/order/<order_id>', methods=['GET'])
 def get_delivery_by_order(order_id):
-    delivery = next((d for d in deliveries if d['orderId'] == order_id), None)
+    matches = deliveries.find('orderId', order_id)
+    delivery = matches[0] if matches else None
     if not delivery:
         return jsonify({'error': 'Delivery not found'}), 404
-    return jsonify(delivery)
+    return cached_json(('delivery', delivery['deliveryId']), deliveries.version(delivery['deliveryId']),
+        lambda: delivery)
 
 # NOTIFICATION API
 @app.route('/api/notifications', methods=['GET'])
 def get_notifications():
-    return jsonify(notifications)
+    return list_response(notifications, NOTIFICATION_FILTERS)
+
+@app.route('/api/notifications/export', methods=['GET'])
+def export_notifications():
+    return export_response(notifications, NOTIFICATION_FILTERS)
 
 @app.route('/api/notifications/user/<user_id>', methods=['GET'])
 def get_user_notifications(user_id):
-    user_notifications = [n for n in notifications if n['userId'] == user_id]
+    user_notifications = notifications.find('userId', user_id)
     return jsonify(user_notifications)
 
+@async_front.route('/api/notifications/user/<user_id>/stream')
+async def stream_user_notifications(request, user_id):
+    # Server-sent events, served on the event-loop server; reconnecting
+    # clients send Last-Event-ID and get what they missed from the user's buffer
+    last_event_id = request.headers.get('last-event-id') or request.args.get('lastEventId')
+    if last_event_id is not None:
+        try:
+            last_event_id = int(last_event_id)
+        except ValueError:
+            return async_json(400, {'error': 'Last-Event-ID must be an integer'})
+    
+    if open_streams >= MAX_STREAMS:
+        return async_json(503, {'error': 'Too many open notification streams, retry later'},
+            {'Retry-After': SSE_HEARTBEAT})
+    
+    async def events():
+        # Subscribes on first use, so a stream that is never sent leaks nothing
+        global open_streams
+        subscription, backlog = notification_hub.subscribe(user_id, last_event_id, asyncio.get_running_loop())
+        open_streams += 1
+        try:
+            yield 'retry: 3000\n\n'
+            for event_id, data in backlog:
+                yield sse_event(event_id, data)
+            while not subscription.closed and not draining.is_set():
+                event = await subscription.next(SSE_HEARTBEAT)
+                if event is None:
+                    yield ': keep-alive\n\n'
+                else:
+                    yield sse_event(*event)
+        finally:
+            subscription.close()
+            open_streams -= 1
+    
+    return AsyncResponse(200, stream=events(), headers={'Content-Type': 'text/event-stream',
+        'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+@app.route('/api/notifications/stats', methods=['GET'])
+def get_notification_stats():
+    return jsonify({'streams': dict(notification_hub.summary(), open=open_streams, limit=MAX_STREAMS),
+        'pipeline': notification_pipeline.summary(),
+        'retained': len(notifications)})
+
+# CACHE API
+@app.route('/api/cache/stats', methods=['GET'])
+def get_cache_stats():
+    return jsonify({'merged': merged_cache.stats(), 'responses': response_cache.stats(),
+        'priceTables': price_tables.summary()})
+
 # Root route
 @app.route('/', methods=['GET'])
 def root():
@@ -555,10 +1321,112 @@ def root():
 # Health check
 @app.route('/health', methods=['GET'])
 def health():
-    return jsonify({'status': 'ok', 'service': 'backend2-python-service', 'language': 'Python'})
+    # 503 until warm-up finishes and again while draining, so the load
+    # balancer only routes to instances that are ready for traffic
+    if draining.is_set():
+        state = 'draining'
+    elif not ready.is_set():
+        state = 'starting'
+    else:
+        state = 'ok'
+    status = {'status': state, 'service': 'backend2-python-service', 'language': 'Python'}
+    if persistence is not None:
+        status['recovery'] = persistence.recovery
+    if warm_up_seconds is not None:
+        status['warmUpSeconds'] = warm_up_seconds
+    if async_front.port is not None:
+        status['asyncPort'] = async_front.port
+    # Load, read by the load balancer's least-loaded strategy (this request
+    # itself is not counted as in flight)
+    status['load'] = {
+        'inFlight': max(http_in_flight.value() - 1, 0),
+        'requestsTotal': http_requests.total(),
+        'threads': threading.active_count(),
+        'loadAverage': round(os.getloadavg()[0], 2) if hasattr(os, 'getloadavg') else None
+    }
+    return jsonify(status), 200 if state == 'ok' else 503
+
+# Prometheus scrape endpoint
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    return Response(registry.render(), mimetype='text/plain; version=0.0.4')
+
+# On-demand sampling profile in collapsed-stack format (flamegraph.pl,
+# speedscope). Off unless BACKEND2_PROFILER=1; one profile at a time.
+PROFILER_ENABLED = os.environ.get('BACKEND2_PROFILER', '0') == '1'
+MAX_PROFILE_SECONDS = 60
+
+@app.route('/debug/profile', methods=['GET'])
+def debug_profile():
+    if not PROFILER_ENABLED:
+        return jsonify({'error': 'Not found'}), 404
+    
+    try:
+        seconds = float(request.args.get('seconds', 5))
+        interval = float(request.args.get('interval', 0.005))
+    except ValueError:
+        return jsonify({'error': 'seconds and interval must be numbers'}), 400
+    if not 0 < seconds <= MAX_PROFILE_SECONDS or not 0.001 <= interval <= 1:
+        return jsonify({'error': f'seconds must be in (0, {MAX_PROFILE_SECONDS}] and interval in [0.001, 1]'}), 400
+    idle = request.args.get('idle', 'false').lower() in ('1', 'true')
+    
+    if not profiler.PROFILE_LOCK.acquire(blocking=False):
+        return jsonify({'error': 'A profile is already running'}), 409
+    try:
+        stacks, samples = profiler.sample(seconds, interval, idle)
+    finally:
+        profiler.PROFILE_LOCK.release()
+    
+    response = Response(profiler.collapsed(stacks), mimetype='text/plain')
+    response.headers['X-Profile-Samples'] = str(samples)
+    return response
+
+# Lifecycle (driven by gunicorn.conf.py in production, or __main__ below)
+ready = threading.Event()
+draining = threading.Event()
+warm_up_seconds = None
+_warm_up_lock = threading.Lock()
+
+def warm_up():
+    # Recover persisted state, prime the hot response caches and start the
+    # background sync worker before reporting ready
+    global warm_up_seconds
+    with _warm_up_lock:
+        if ready.is_set():
+            return
+        started = datetime.now()
+        if DATA_DIR and persistence is None:
+            start_persistence()
+        prime_notification_streams()
+        with app.app_context():
+            for collection in (restaurants, orders, deliveries, notifications):
+                response_cache.get_or_build(collection.name, collection.generation,
+                    lambda: serialize(collection.all()))
+        sync_queue.start()
+        async_backend1.start()
+        async_front.start(async_backend1.loop(), '0.0.0.0', ASYNC_PORT)
+        dispatcher.start()
+        eta_refresher.start()
+        notification_pipeline.start()
+        warm_up_seconds = round((datetime.now() - started).total_seconds(), 4)
+        ready.set()
+        print(f'Backend 2 ready in {warm_up_seconds}s')
+
+def start_draining():
+    draining.set()
+
+def shutdown():
+    async_front.stop()
+    notification_pipeline.flush()
+    if persistence is not None:
+        persistence.close()
 
 if __name__ == '__main__':
-    print('Backend 2 (Python Flask Service) starting on http://localhost:3002')
+    port = int(os.environ.get('PORT', 3002))
+    print(f'Backend 2 (Python Flask Service) starting on http://localhost:{port}')
+    warm_up()
+    print(f'Notification streams on http://localhost:{async_front.port}')
     print('Ready to receive requests from Load Balancer')
-    app.run(host='0.0.0.0', port=3002, debug=True)
+    # Development server; use `gunicorn -c gunicorn.conf.py backend2:app` in production
+    app.run(host='0.0.0.0', port=port, debug=os.environ.get('FLASK_DEBUG') == '1', threaded=True)
 
@@ -0,0 +1,24 @@
+import threading
+
+# Background threads started on first use.
+#
+# gunicorn pre-forks its workers after the app is imported, and threads don't
+# survive a fork, so each background thread is started by the first call that
+# needs it in the current process (and restarted if it has died).
+
+
+class BackgroundThread:
+    def __init__(self, target, name, args=()):
+        self.target = target
+        self.name = name
+        self.args = args
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def ensure_started(self):
+        if self._thread is not None and self._thread.is_alive():
+            return
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self.target, args=self.args, name=self.name, daemon=True)
+                self._thread.start()
@@ -0,0 +1,428 @@
+import argparse
+import json
+import os
+import random
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import numpy as np
+
+# Load test and micro-benchmarks for Backend 2.
+#
+#   python benchmark.py load --mix balanced --threads 8 --duration 10
+#   python benchmark.py load --mode http --url http://localhost:3002
+#   python benchmark.py load --save            # store as the baseline
+#   python benchmark.py load --compare         # fail on regressions (or no baseline)
+#   python benchmark.py micro
+#
+# `load` synthesizes register/login/browse/order/status traffic (or replays an
+# NDJSON file of {"method", "path", "json"} lines with --replay) against the
+# Flask app in-process (test client) or over HTTP, and reports p50/p95/p99
+# latency and req/s per endpoint. In-process, Backend1 is replaced by a local
+# stub with configurable latency; over HTTP the server uses whatever Backend1
+# it was started with. Baselines are JSON files under benchmarks/.
+
+BASELINE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'benchmarks')
+
+# Relative weights of each operation
+MIXES = {
+    'balanced': {'register': 2, 'login': 3, 'browse': 40, 'menu': 20, 'nearby': 10, 'order': 15, 'status': 10},
+    'browse': {'login': 2, 'browse': 55, 'menu': 30, 'nearby': 13},
+    'ordering': {'login': 2, 'browse': 10, 'menu': 10, 'order': 45, 'status': 33},
+    'auth': {'register': 20, 'login': 40, 'me': 40}
+}
+STATUS_FLOW = ('CONFIRMED', 'PREPARING', 'OUT_FOR_DELIVERY', 'DELIVERED')
+
+
+class Backend1Stub:
+    # Minimal Backend1: empty catalog, rejects auth (so Backend2 handles it
+    # locally) and accepts syncs, each after `latency` seconds
+
+    def __init__(self, port=0, latency=0.0):
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                self._reply(200, [])
+
+            def do_POST(self):
+                self.rfile.read(int(self.headers.get('Content-Length', 0)))
+                self._reply(400 if self.path.startswith('/api/auth/') else 200, {})
+
+            def _reply(self, status, body):
+                time.sleep(stub.latency)
+                data = json.dumps(body).encode()
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def log_message(self, *args):
+                pass
+
+        self.latency = latency
+        self.server = ThreadingHTTPServer(('127.0.0.1', port), Handler)
+        self.server.daemon_threads = True
+        self.url = f'http://127.0.0.1:{self.server.server_address[1]}'
+
+    def start(self):
+        threading.Thread(target=self.server.serve_forever, name='backend1-stub', daemon=True).start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+
+
+class InProcessClient:
+    def __init__(self, app):
+        self.client = app.test_client()
+
+    def request(self, method, path, json=None, headers=None):
+        response = self.client.open(path, method=method, json=json, headers=headers)
+        return response.status_code, response.get_json(silent=True)
+
+
+class HttpClient:
+    def __init__(self, base_url):
+        import requests
+        self.base_url = base_url.rstrip('/')
+        self.session = requests.Session()
+
+    def request(self, method, path, json=None, headers=None):
+        response = self.session.request(method, self.base_url + path, json=json, headers=headers, timeout=30)
+        try:
+            body = response.json()
+        except ValueError:
+            body = None
+        return response.status_code, body
+
+
+class Workload:
+    # Shared fixtures (restaurants, menus) plus per-thread users and orders
+
+    def __init__(self, mix, seed=1):
+        self.mix = MIXES[mix]
+        self.seed = seed
+        self.restaurants = []
+        self._user_counter = 0
+        self._lock = threading.Lock()
+
+    def setup(self, client, restaurants=20, items=10):
+        rng = random.Random(self.seed)
+        for i in range(restaurants):
+            status, restaurant = client.request('POST', '/api/restaurants', json={
+                'name': f'Bench Restaurant {i}', 'address': f'{i} Bench St', 'cuisine': 'Bench',
+                'phone': '+10000000000', 'latitude': 40.70 + rng.random() * 0.1,
+                'longitude': -74.02 + rng.random() * 0.1})
+            if status != 201:
+                raise RuntimeError(f'Creating restaurants failed with {status}: {restaurant}')
+            menu = []
+            for j in range(items):
+                _, item = client.request('POST', f'/api/restaurants/{restaurant["id"]}/menu/items', json={
+                    'name': f'Dish {j}', 'price': round(5 + rng.random() * 20, 2), 'category': 'Main'})
+                menu.append(item['id'])
+            self.restaurants.append((restaurant['id'], menu))
+
+    def new_user(self):
+        with self._lock:
+            self._user_counter += 1
+            n = self._user_counter
+        return {'email': f'bench-{os.getpid()}-{n}-{time.time_ns()}@example.com', 'password': 'bench-password',
+                'name': f'Bench User {n}'}
+
+    def run(self, client, deadline, max_requests, samples, index=0):
+        # Seeded per thread index (not thread id) so runs are repeatable
+        rng = random.Random(f'{self.seed}:{index}')
+        ops = list(self.mix)
+        weights = [self.mix[op] for op in ops]
+        state = {'users': [], 'tokens': [], 'orders': []}
+        done = 0
+        while time.perf_counter() < deadline and (max_requests is None or done < max_requests):
+            op = rng.choices(ops, weights)[0]
+            label, method, path, body, headers = getattr(self, f'_{op}')(rng, state)
+            started = time.perf_counter()
+            status, response = client.request(method, path, json=body, headers=headers)
+            elapsed = time.perf_counter() - started
+            # An order not yet picked up by the dispatcher is expected, not an error
+            waiting = status == 409 and isinstance(response, dict) and response.get('code') == 'not_dispatched'
+            samples.setdefault(label, []).append((elapsed, status >= 400 and not waiting))
+            self._after(label, state, status, body, response)
+            done += 1
+
+    def _register(self, rng, state):
+        return 'POST /api/auth/register', 'POST', '/api/auth/register', self.new_user(), None
+
+    def _login(self, rng, state):
+        if not state['users']:
+            return self._register(rng, state)
+        user = rng.choice(state['users'])
+        return 'POST /api/auth/login', 'POST', '/api/auth/login', {'email': user['email'], 'password': user['password']}, None
+
+    def _me(self, rng, state):
+        if not state['tokens']:
+            return self._register(rng, state)
+        headers = {'Authorization': f'Bearer {rng.choice(state["tokens"])}'}
+        return 'GET /api/auth/me', 'GET', '/api/auth/me', None, headers
+
+    def _browse(self, rng, state):
+        return 'GET /api/restaurants', 'GET', '/api/restaurants', None, None
+
+    def _menu(self, rng, state):
+        restaurant_id, _ = rng.choice(self.restaurants)
+        return 'GET /api/restaurants/:id/menu', 'GET', f'/api/restaurants/{restaurant_id}/menu', None, None
+
+    def _nearby(self, rng, state):
+        path = f'/api/restaurants/nearby?lat={40.70 + rng.random() * 0.1:.5f}&lng={-74.02 + rng.random() * 0.1:.5f}&radius=3'
+        return 'GET /api/restaurants/nearby', 'GET', path, None, None
+
+    def _order(self, rng, state):
+        restaurant_id, menu = rng.choice(self.restaurants)
+        items = [{'menuItemId': item, 'quantity': rng.randint(1, 3)} for item in rng.sample(menu, min(3, len(menu)))]
+        return 'POST /api/orders', 'POST', '/api/orders', {
+            'userId': f'bench-user-{rng.randint(1, 500)}', 'restaurantId': restaurant_id, 'items': items,
+            'deliveryAddress': '1 Bench Ave', 'deliveryLatitude': 40.70 + rng.random() * 0.1,
+            'deliveryLongitude': -74.02 + rng.random() * 0.1}, None
+
+    def _status(self, rng, state):
+        if not state['orders']:
+            return self._order(rng, state)
+        order = state['orders'][0]
+        return ('PATCH /api/orders/:id/status', 'PATCH', f'/api/orders/{order["orderId"]}/status',
+                {'status': STATUS_FLOW[order['step']]}, None)
+
+    def _after(self, label, state, status, body, response):
+        if label == 'POST /api/auth/register' and status == 201:
+            state['users'] = state['users'][-199:] + [body]
+        if isinstance(response, dict) and response.get('token'):
+            state['tokens'] = state['tokens'][-99:] + [response['token']]
+        if label == 'POST /api/orders' and status == 201:
+            state['orders'].append({'orderId': response['orderId'], 'step': 0})
+        elif label == 'PATCH /api/orders/:id/status':
+            # Walk the oldest order through the lifecycle, one step per update
+            order = state['orders'][0]
+            if status == 409 and isinstance(response, dict) and response.get('code') == 'not_dispatched':
+                # Try another order while this one waits for a partner
+                state['orders'].append(state['orders'].pop(0))
+                return
+            order['step'] += 1
+            if order['step'] >= len(STATUS_FLOW) or status >= 400:
+                state['orders'].pop(0)
+
+
+class Replay:
+    # Requests from an NDJSON file, replayed round-robin by every thread
+
+    def __init__(self, path):
+        with open(path, encoding='utf-8') as f:
+            self.requests = [json.loads(line) for line in f if line.strip()]
+
+    def setup(self, client, **kwargs):
+        pass
+
+    def run(self, client, deadline, max_requests, samples, index=0):
+        done = 0
+        while time.perf_counter() < deadline and (max_requests is None or done < max_requests):
+            entry = self.requests[done % len(self.requests)]
+            label = entry.get('label') or f'{entry["method"]} {entry["path"].split("?")[0]}'
+            started = time.perf_counter()
+            status, _ = client.request(entry['method'], entry['path'], json=entry.get('json'),
+                headers=entry.get('headers'))
+            samples.setdefault(label, []).append((time.perf_counter() - started, status >= 400))
+            done += 1
+
+
+def summarize(samples, seconds):
+    report = {}
+    for label, values in sorted(samples.items()):
+        latencies = np.array([elapsed for elapsed, _ in values]) * 1000
+        report[label] = {
+            'requests': len(values),
+            'errors': sum(1 for _, failed in values if failed),
+            'rps': round(len(values) / seconds, 1),
+            'p50Ms': round(float(np.percentile(latencies, 50)), 3),
+            'p95Ms': round(float(np.percentile(latencies, 95)), 3),
+            'p99Ms': round(float(np.percentile(latencies, 99)), 3)
+        }
+    total = sum(len(values) for values in samples.values())
+    report['TOTAL'] = {
+        'requests': total,
+        'errors': sum(r['errors'] for r in report.values()),
+        'rps': round(total / seconds, 1),
+        'p50Ms': None, 'p95Ms': None, 'p99Ms': None
+    }
+    if total:
+        latencies = np.concatenate([np.array([e for e, _ in values]) for values in samples.values()]) * 1000
+        for name, q in (('p50Ms', 50), ('p95Ms', 95), ('p99Ms', 99)):
+            report['TOTAL'][name] = round(float(np.percentile(latencies, q)), 3)
+    return report
+
+
+def print_report(report, baseline=None):
+    print(f'{"endpoint":34} {"requests":>9} {"errors":>7} {"req/s":>9} {"p50 ms":>9} {"p95 ms":>9} {"p99 ms":>9}')
+    for label, row in report.items():
+        line = (f'{label:34} {row["requests"]:9d} {row["errors"]:7d} {row["rps"]:9.1f} '
+                f'{row["p50Ms"] or 0:9.3f} {row["p95Ms"] or 0:9.3f} {row["p99Ms"] or 0:9.3f}')
+        if baseline and label in baseline and baseline[label]['p95Ms']:
+            change = (row['p95Ms'] - baseline[label]['p95Ms']) / baseline[label]['p95Ms'] * 100
+            line += f'  p95 {change:+.0f}%'
+        print(line)
+
+
+def regressions(report, baseline, tolerance):
+    # Endpoints whose p95 grew or throughput fell by more than tolerance
+    found = []
+    for label, row in report.items():
+        before = baseline.get(label)
+        if not before:
+            continue
+        if before['p95Ms'] and row['p95Ms'] > before['p95Ms'] * (1 + tolerance):
+            found.append(f'{label}: p95 {before["p95Ms"]}ms -> {row["p95Ms"]}ms')
+        if label == 'TOTAL' and row['rps'] < before['rps'] * (1 - tolerance):
+            found.append(f'{label}: {before["rps"]} -> {row["rps"]} req/s')
+    return found
+
+
+def run_load(args):
+    name = args.name or (os.path.splitext(os.path.basename(args.replay))[0] if args.replay else args.mix)
+    path = os.path.join(BASELINE_DIR, f'{name}-{args.mode}.json')
+    if args.compare and not args.save and not os.path.exists(path):
+        print(f'No baseline to compare with at {path}; run with --save first', file=sys.stderr)
+        return 2
+
+    os.environ.setdefault('BACKEND2_NOTIFICATION_LOG', '0')
+    stub = None
+    if args.mode == 'inprocess':
+        stub = Backend1Stub(latency=args.backend1_latency_ms / 1000).start()
+        # Must be set before backend2 (and its Backend1 clients) is imported
+        os.environ['BACKEND1_URL'] = stub.url
+        import backend2
+        backend2.warm_up()
+        make_client = lambda: InProcessClient(backend2.app)
+    else:
+        make_client = lambda: HttpClient(args.url)
+
+    workload = Replay(args.replay) if args.replay else Workload(args.mix, seed=args.seed)
+    workload.setup(make_client(), restaurants=args.restaurants, items=args.items)
+
+    per_thread = [{} for _ in range(args.threads)]
+    max_requests = args.requests // args.threads if args.requests else None
+    deadline = time.perf_counter() + (args.duration if not args.requests else 1e9)
+    threads = [threading.Thread(target=workload.run, args=(make_client(), deadline, max_requests, samples, index))
+               for index, samples in enumerate(per_thread)]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    seconds = time.perf_counter() - started
+
+    samples = {}
+    for thread_samples in per_thread:
+        for label, values in thread_samples.items():
+            samples.setdefault(label, []).extend(values)
+    report = summarize(samples, seconds)
+
+    baseline = None
+    if args.compare and os.path.exists(path):
+        with open(path, encoding='utf-8') as f:
+            baseline = json.load(f)['report']
+    elif args.compare:
+        print(f'No baseline to compare with at {path} yet')
+
+    backend1 = (f'Backend1 stub latency {args.backend1_latency_ms}ms' if stub
+                else f'Backend1 as configured for {args.url}')
+    print(f'{name} ({args.mode}, {args.threads} threads, {seconds:.1f}s, {backend1})')
+    print_report(report, baseline)
+
+    if args.save:
+        os.makedirs(BASELINE_DIR, exist_ok=True)
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump({'createdAt': time.time(), 'threads': args.threads, 'report': report}, f, indent=2)
+        print(f'Saved baseline to {path}')
+    if stub:
+        stub.stop()
+    if baseline is not None:
+        found = regressions(report, baseline, args.tolerance)
+        for line in found:
+            print(f'REGRESSION {line}')
+        return 1 if found else 0
+    return 0
+
+
+def timeit(fn, repeat):
+    started = time.perf_counter()
+    for _ in range(repeat):
+        fn()
+    return (time.perf_counter() - started) / repeat * 1e6
+
+
+def run_micro(args):
+    # Hot-path building blocks, in microseconds per call
+    from auth import SessionCache, decode_token, generate_token, hash_password
+    from eta import EtaModel
+    from geo import GeoIndex
+    from records import Order
+
+    rng = random.Random(args.seed)
+    token = generate_token('USER-1')
+    sessions = SessionCache()
+    index = GeoIndex()
+    for i in range(10000):
+        index.put(i, 40.6 + rng.random() * 0.3, -74.1 + rng.random() * 0.3)
+    order = {'orderId': 'ORD-1', 'id': 1, 'userId': 'u', 'restaurantId': 1, 'status': 'PREPARING',
+             'totalAmount': 12.5, 'items': [{'menuItemId': 1, 'quantity': 2, 'menuItemName': 'Dish', 'price': 6.25}],
+             'deliveryAddress': 'x', 'deliveryLatitude': 40.75, 'deliveryLongitude': -73.98,
+             'createdAt': '2026-01-01T12:00:00', 'updatedAt': '2026-01-01T12:00:00',
+             'preparingAt': '2026-01-01T12:00:00'}
+    jobs = [{'order': order, 'restaurantPosition': (40.72, -74.0), 'pickupKm': 1.0, 'queueAhead': 1}] * 1000
+    model = EtaModel()
+    record = Order.from_dict(order)
+
+    results = {
+        'token verify (cold)': timeit(lambda: decode_token(token), 2000),
+        'token verify (cached)': timeit(lambda: sessions.verify(token), 20000),
+        'password hash': timeit(lambda: hash_password('bench-password'), 5),
+        'nearby 2km in 10k points': timeit(lambda: index.within(40.75, -73.98, 2.0), 500),
+        'eta batch of 1000': timeit(lambda: model.estimate(jobs), 50),
+        'order record from dict': timeit(lambda: Order.from_dict(order), 5000),
+        'order record to dict': timeit(record.to_dict, 5000)
+    }
+    for name, micros in results.items():
+        print(f'{name:28} {micros:12.2f} us')
+    return 0
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Backend 2 load test and micro-benchmarks')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    load = commands.add_parser('load', help='run a traffic mix and report latency per endpoint')
+    load.add_argument('--mode', choices=('inprocess', 'http'), default='inprocess')
+    load.add_argument('--url', default='http://localhost:3002', help='Backend 2 URL for --mode http')
+    load.add_argument('--mix', choices=sorted(MIXES), default='balanced')
+    load.add_argument('--replay', help='NDJSON file of {"method", "path", "json"} requests to replay')
+    load.add_argument('--threads', type=int, default=8)
+    load.add_argument('--duration', type=float, default=10.0, help='seconds to run')
+    load.add_argument('--requests', type=int, help='total requests instead of a duration')
+    load.add_argument('--restaurants', type=int, default=20)
+    load.add_argument('--items', type=int, default=10, help='menu items per restaurant')
+    load.add_argument('--backend1-latency-ms', type=float, default=20.0,
+                      help='Backend1 stub delay (in-process only)')
+    load.add_argument('--seed', type=int, default=1)
+    load.add_argument('--name', help='baseline name (default: the mix or replay file name)')
+    load.add_argument('--save', action='store_true', help='save the results as the baseline')
+    load.add_argument('--compare', action='store_true', help='compare with the saved baseline (exit 2 if there is none)')
+    load.add_argument('--tolerance', type=float, default=0.2, help='allowed regression (0.2 = 20%%)')
+
+    micro = commands.add_parser('micro', help='time hot-path building blocks')
+    micro.add_argument('--seed', type=int, default=1)
+
+    args = parser.parse_args(argv)
+    return run_load(args) if args.command == 'load' else run_micro(args)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,118 @@
+import hashlib
+import threading
+import time
+
+# Small TTL cache with explicit invalidation.
+#
+# Each entry carries its own expiry, so different kinds of data (the merged
+# restaurant list, per-restaurant menus) can live side by side with different
+# TTLs. Writers call invalidate() for the keys they affect.
+
+
+class TTLCache:
+    def __init__(self, default_ttl=30.0, maxsize=10000):
+        self.default_ttl = default_ttl
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+        self._entries = {}
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                value, expires_at = entry
+                if expires_at > time.monotonic():
+                    self.hits += 1
+                    return value
+                del self._entries[key]
+            self.misses += 1
+            return None
+
+    def set(self, key, value, ttl=None):
+        with self._lock:
+            if len(self._entries) >= self.maxsize and key not in self._entries:
+                self._evict_expired()
+                if len(self._entries) >= self.maxsize:
+                    # Drop the oldest entry (dicts keep insertion order)
+                    del self._entries[next(iter(self._entries))]
+            self._entries[key] = (value, time.monotonic() + (ttl if ttl is not None else self.default_ttl))
+        return value
+
+    def invalidate(self, key):
+        with self._lock:
+            if self._entries.pop(key, None) is not None:
+                self.invalidations += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                'entries': len(self._entries),
+                'hits': self.hits,
+                'misses': self.misses,
+                'invalidations': self.invalidations,
+                'hitRatio': round(self.hits / total, 4) if total else 0.0
+            }
+
+    def _evict_expired(self):
+        now = time.monotonic()
+        for key in [k for k, (_, expires_at) in self._entries.items() if expires_at <= now]:
+            del self._entries[key]
+
+
+class ResponseCache:
+    # Serialized response bodies keyed by resource, valid for one version of
+    # that resource. The ETag is a hash of the body, so it is strong and the
+    # same for every worker that serializes the same data.
+
+    def __init__(self, maxsize=10000):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._entries = {}
+        self._lock = threading.Lock()
+
+    def get_or_build(self, key, version, build):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] == version:
+                self.hits += 1
+                return entry[1], entry[2]
+            self.misses += 1
+
+        body = build()
+        if isinstance(body, str):
+            body = body.encode()
+        etag = make_etag(body)
+        with self._lock:
+            if len(self._entries) >= self.maxsize and key not in self._entries:
+                del self._entries[next(iter(self._entries))]
+            self._entries[key] = (version, etag, body)
+        return etag, body
+
+    def stats(self):
+        with self._lock:
+            return {'entries': len(self._entries), 'hits': self.hits, 'misses': self.misses}
+
+
+def make_etag(body):
+    return hashlib.blake2b(body, digest_size=16).hexdigest()
+
+
+def merge_unique(local, remote, key):
+    # Append remote records whose key isn't already present, in O(n + m)
+    merged = list(local)
+    seen = {key(record) for record in merged}
+    for record in remote:
+        record_key = key(record)
+        if record_key not in seen:
+            seen.add(record_key)
+            merged.append(record)
+    return merged
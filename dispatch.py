@@ -0,0 +1,156 @@
+import threading
+import time
+
+import numpy as np
+from scipy.optimize import linear_sum_assignment
+
+from background import BackgroundThread
+from geo import distance_matrix_km
+
+# Batched delivery dispatch.
+#
+# Orders that reach PREPARING are queued instead of being assigned one by one.
+# Every `window` seconds the dispatcher takes the pending batch and the
+# partners with free capacity and solves the order -> partner assignment as a
+# min-cost bipartite matching on pickup distance. A partner with capacity c
+# contributes c slots (columns). For large batches each order only considers
+# its nearest `candidates` partners, which keeps the cost matrix small.
+# Orders that get no partner stay queued for the next tick.
+#
+# assign(order_id, partner, distance) runs outside the lock once a partner is
+# reserved; it returns None when the order no longer needs one (cancelled
+# meanwhile), after handing the partner back with release().
+
+
+class Dispatcher:
+    def __init__(self, partners, assign, window=0.5, max_batch=2000, candidates=10):
+        self.partners = partners
+        self.assign = assign
+        self.window = window
+        self.max_batch = max_batch
+        self.candidates = candidates
+        self.stats = {
+            'ticks': 0,
+            'assigned': 0,
+            'pending': 0,
+            'lastBatchSize': 0,
+            'lastTickSeconds': 0.0,
+            'lastTickOrdersPerSecond': 0.0,
+            'avgAssignmentLatencySeconds': 0.0,
+            'maxAssignmentLatencySeconds': 0.0
+        }
+        self._pending = {}
+        self._lock = threading.Lock()
+        self._worker = BackgroundThread(self._run, 'dispatcher')
+        self._latency_total = 0.0
+
+    def submit(self, order_id, pickup):
+        # pickup is the restaurant (lat, lng), or None when it has no position
+        self._worker.ensure_started()
+        with self._lock:
+            if order_id not in self._pending:
+                self._pending[order_id] = (pickup, time.monotonic())
+            self.stats['pending'] = len(self._pending)
+
+    def cancel(self, order_id):
+        with self._lock:
+            removed = self._pending.pop(order_id, None) is not None
+            self.stats['pending'] = len(self._pending)
+            return removed
+
+    def reserve(self, partner):
+        with self._lock:
+            self._reserve(partner)
+
+    def release(self, partner):
+        with self._lock:
+            partner['activeOrders'] = max(partner['activeOrders'] - 1, 0)
+            partner['available'] = partner['activeOrders'] < partner['capacity']
+
+    def start(self):
+        self._worker.ensure_started()
+
+    def tick(self):
+        started = time.perf_counter()
+        with self._lock:
+            batch = list(self._pending.items())[:self.max_batch]
+            free = [p for p in self.partners if p['activeOrders'] < p['capacity']]
+        if not batch or not free:
+            return 0
+
+        matches = self._match(batch, free)
+
+        assigned = []
+        now = time.monotonic()
+        with self._lock:
+            for row, partner, distance in matches:
+                order_id, (_, submitted_at) = batch[row]
+                # Skip orders cancelled meanwhile and partners filled meanwhile
+                if order_id not in self._pending or partner['activeOrders'] >= partner['capacity']:
+                    continue
+                del self._pending[order_id]
+                self._reserve(partner)
+                assigned.append((order_id, partner, distance, now - submitted_at))
+            self.stats['pending'] = len(self._pending)
+
+        done = 0
+        latencies = []
+        for order_id, partner, distance, latency in assigned:
+            try:
+                if self.assign(order_id, partner, distance) is None:
+                    continue
+                done += 1
+                latencies.append(latency)
+            except Exception as error:
+                print(f'Error assigning {order_id} to {partner["id"]}: {error}')
+                self.release(partner)
+
+        elapsed = time.perf_counter() - started
+        with self._lock:
+            self.stats['ticks'] += 1
+            self.stats['assigned'] += done
+            self._latency_total += sum(latencies)
+            if latencies:
+                self.stats['maxAssignmentLatencySeconds'] = max(
+                    self.stats['maxAssignmentLatencySeconds'], round(max(latencies), 4))
+            self.stats['lastBatchSize'] = len(batch)
+            self.stats['lastTickSeconds'] = round(elapsed, 6)
+            self.stats['lastTickOrdersPerSecond'] = round(done / elapsed, 1) if elapsed else 0.0
+            if self.stats['assigned']:
+                self.stats['avgAssignmentLatencySeconds'] = round(self._latency_total / self.stats['assigned'], 4)
+        return done
+
+    def _match(self, batch, free):
+        # [(batch row, partner, distance_km)] minimising total pickup distance
+        pickups = [pickup for _, (pickup, _) in batch]
+        known = [pickup is not None for pickup in pickups]
+        order_lats = [pickup[0] if pickup else 0.0 for pickup in pickups]
+        order_lngs = [pickup[1] if pickup else 0.0 for pickup in pickups]
+        distances = distance_matrix_km(order_lats, order_lngs,
+            [p['latitude'] for p in free], [p['longitude'] for p in free])
+        # Orders without a pickup position can go to anyone
+        distances[~np.asarray(known)] = 0.0
+
+        columns = np.arange(len(free))
+        if len(free) > self.candidates:
+            nearest = np.argpartition(distances, self.candidates - 1, axis=1)[:, :self.candidates]
+            columns = np.unique(nearest)
+
+        # One column per free slot, never more slots per partner than orders
+        slots = np.array([min(free[c]['capacity'] - free[c]['activeOrders'], len(batch)) for c in columns])
+        slot_partner = np.repeat(columns, slots)
+        costs = distances[:, slot_partner]
+        rows, cols = linear_sum_assignment(costs)
+        return [(row, free[slot_partner[col]], float(costs[row, col])) for row, col in zip(rows, cols)]
+
+    def _reserve(self, partner):
+        partner['activeOrders'] += 1
+        partner['available'] = partner['activeOrders'] < partner['capacity']
+
+    def _run(self):
+        while True:
+            time.sleep(self.window)
+            try:
+                self.tick()
+            except Exception as error:
+                print(f'Error in dispatch tick: {error}')
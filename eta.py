@@ -0,0 +1,173 @@
+import math
+import threading
+import time
+from datetime import datetime
+
+import numpy as np
+
+from background import BackgroundThread
+from geo import haversine_km
+
+# Delivery ETA model.
+#
+# An ETA is the later of "food ready" and "partner at the restaurant" plus the
+# ride to the customer:
+#
+#   max(prep remaining, pickup ride + queue ahead of us) + drop-off ride
+#
+# Prep time is learned per restaurant from PREPARING -> OUT_FOR_DELIVERY, ride
+# speed and time per delivery per zone (a lat/lng grid cell around the
+# restaurant) from OUT_FOR_DELIVERY -> DELIVERED, using exponentially weighted
+# moving averages updated as each order completes. Estimates for many
+# deliveries are computed as numpy arrays in one pass.
+
+DEFAULT_PREP_SECONDS = 15 * 60
+DEFAULT_SPEED_KMH = 20.0
+DEFAULT_DELIVERY_SECONDS = 20 * 60
+DEFAULT_DROPOFF_KM = 3.0
+MIN_RIDE_SECONDS = 60
+ALPHA = 0.2
+ZONE_DEGREES = 0.05
+
+
+def parse_time(value):
+    return datetime.fromisoformat(value).timestamp() if value else None
+
+
+def has_position(lat, lng):
+    # (0, 0) is what the API stores when no coordinates were given
+    return lat is not None and lng is not None and (lat or lng)
+
+
+class EtaModel:
+    def __init__(self):
+        self._prep = {}
+        self._speed = {}
+        self._delivery = {}
+        self._lock = threading.Lock()
+
+    def zone(self, position):
+        if position is None:
+            return None
+        return (math.floor(position[0] / ZONE_DEGREES), math.floor(position[1] / ZONE_DEGREES))
+
+    def prep_seconds(self, restaurant_id):
+        return self._prep.get(restaurant_id, DEFAULT_PREP_SECONDS)
+
+    def speed_kmh(self, zone):
+        return self._speed.get(zone, DEFAULT_SPEED_KMH)
+
+    def delivery_seconds(self, zone):
+        return self._delivery.get(zone, DEFAULT_DELIVERY_SECONDS)
+
+    def observe(self, order, restaurant_position):
+        # Fold a finished order's timestamps into the running averages
+        preparing = parse_time(order.get('preparingAt'))
+        out = parse_time(order.get('outForDeliveryAt'))
+        delivered = parse_time(order.get('deliveredAt'))
+        zone = self.zone(restaurant_position)
+        with self._lock:
+            if preparing and out and out > preparing:
+                self._update(self._prep, order['restaurantId'], out - preparing, DEFAULT_PREP_SECONDS)
+            if out and delivered and delivered > out:
+                self._update(self._delivery, zone, delivered - out, DEFAULT_DELIVERY_SECONDS)
+                distance = self.dropoff_km(order, restaurant_position)
+                if distance:
+                    speed = distance / ((delivered - out) / 3600)
+                    self._update(self._speed, zone, min(speed, 80.0), DEFAULT_SPEED_KMH)
+
+    def dropoff_km(self, order, restaurant_position):
+        lat, lng = order.get('deliveryLatitude'), order.get('deliveryLongitude')
+        if restaurant_position is None or not has_position(lat, lng):
+            return None
+        return float(haversine_km(restaurant_position[0], restaurant_position[1], [lat], [lng])[0])
+
+    def estimate(self, jobs, now=None):
+        # jobs: dicts with order, restaurantPosition, pickupKm, queueAhead.
+        # Returns ETAs as epoch seconds, one per job.
+        if not jobs:
+            return np.array([])
+        now = now if now is not None else datetime.now().timestamp()
+        n = len(jobs)
+        prep = np.empty(n)
+        speed = np.empty(n)
+        per_delivery = np.empty(n)
+        pickup_km = np.empty(n)
+        queue_ahead = np.empty(n)
+        prep_started = np.empty(n)
+        ride_started = np.full(n, np.nan)
+        # Restaurant and customer coordinates; NaN where either is unknown
+        ends = np.full((n, 4), np.nan)
+        for i, job in enumerate(jobs):
+            order = job['order']
+            position = job['restaurantPosition']
+            zone = self.zone(position)
+            prep[i] = self.prep_seconds(order['restaurantId'])
+            speed[i] = self.speed_kmh(zone)
+            per_delivery[i] = self.delivery_seconds(zone)
+            pickup_km[i] = job.get('pickupKm') or 0.0
+            queue_ahead[i] = max(job.get('queueAhead', 0), 0)
+            prep_started[i] = parse_time(order.get('preparingAt')) or now
+            out = parse_time(order.get('outForDeliveryAt'))
+            if out:
+                ride_started[i] = out
+            lat, lng = order.get('deliveryLatitude'), order.get('deliveryLongitude')
+            if position is not None and has_position(lat, lng):
+                ends[i] = (position[0], position[1], lat, lng)
+
+        dropoff_km = haversine_km(ends[:, 0], ends[:, 1], ends[:, 2], ends[:, 3])
+        dropoff_km = np.where(np.isnan(dropoff_km), DEFAULT_DROPOFF_KM, dropoff_km)
+        seconds_per_km = 3600.0 / speed
+        on_the_way = ~np.isnan(ride_started)
+        prep_left = np.maximum(prep - (now - prep_started), 0.0)
+        pickup = pickup_km * seconds_per_km + queue_ahead * per_delivery
+        ride = dropoff_km * seconds_per_km
+        ride_left = np.maximum(ride - np.where(on_the_way, now - ride_started, 0.0), MIN_RIDE_SECONDS)
+        return now + np.where(on_the_way, 0.0, np.maximum(prep_left, pickup)) + ride_left
+
+    def stats(self):
+        with self._lock:
+            return {
+                'restaurants': len(self._prep),
+                'zones': len(self._speed),
+                'avgPrepSeconds': round(float(np.mean(list(self._prep.values()))), 1) if self._prep else None,
+                'avgSpeedKmh': round(float(np.mean(list(self._speed.values()))), 2) if self._speed else None
+            }
+
+    def _update(self, averages, key, value, default):
+        averages[key] = (1 - ALPHA) * averages.get(key, default) + ALPHA * value
+
+
+class EtaRefresher:
+    # Re-estimates every active delivery in one batch every `interval` seconds.
+    # active() returns [(job, delivery)], publish(delivery, eta) stores a result.
+
+    def __init__(self, model, active, publish, interval=5.0):
+        self.model = model
+        self.active = active
+        self.publish = publish
+        self.interval = interval
+        self.stats = {'refreshes': 0, 'lastCount': 0, 'lastSeconds': 0.0}
+        self._worker = BackgroundThread(self._run, 'eta-refresh')
+
+    def start(self):
+        self._worker.ensure_started()
+
+    def refresh(self):
+        started = time.perf_counter()
+        pairs = self.active()
+        etas = self.model.estimate([job for job, _ in pairs])
+        for (_, delivery), eta in zip(pairs, etas):
+            self.publish(delivery, float(eta))
+        self.stats['refreshes'] += 1
+        self.stats['lastCount'] = len(pairs)
+        self.stats['lastSeconds'] = round(time.perf_counter() - started, 6)
+        return len(pairs)
+
+    def _run(self):
+        while True:
+            time.sleep(self.interval)
+            try:
+                self.refresh()
+            except Exception as error:
+                print(f'Error refreshing ETAs: {error}')
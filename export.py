@@ -0,0 +1,32 @@
+import json
+import zlib
+
+# Streaming NDJSON export.
+#
+# Records are read from the collection a chunk at a time (by sequence number)
+# and written one JSON object per line, the same layout as requests.jsonl, so
+# memory use doesn't grow with the size of the collection.
+
+CHUNK_SIZE = 500
+
+
+def ndjson_chunks(collection, where=None, since=None, until=None, chunk_size=CHUNK_SIZE):
+    after = -1
+    while True:
+        records, last = collection.scan(after=after, where=where, since=since, until=until,
+            limit=chunk_size)
+        if records:
+            yield ''.join(json.dumps(record, default=dict) + '\n' for record in records).encode()
+        if last is None or len(records) < chunk_size:
+            return
+        after = last
+
+
+def gzip_chunks(chunks, level=6):
+    # wbits=31 produces a gzip container rather than a bare zlib stream
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 31)
+    for chunk in chunks:
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+    yield compressor.flush()
@@ -0,0 +1,104 @@
+import math
+import threading
+
+import numpy as np
+
+# Geospatial index over points (restaurants, delivery partners).
+#
+# Points are bucketed into a fixed lat/lng grid, so a radius query only looks
+# at the cells the circle overlaps. Distances are great-circle (haversine) and
+# computed with numpy over whole candidate arrays at once, which ranks
+# thousands of points in well under a millisecond.
+
+EARTH_RADIUS_KM = 6371.0088
+KM_PER_DEGREE = 111.195
+
+
+def valid_position(lat, lng):
+    return math.isfinite(lat) and math.isfinite(lng) and -90 <= lat <= 90 and -180 <= lng <= 180
+
+
+def haversine_km(lat, lng, lats, lngs):
+    # Distance from one point to arrays of points, in km
+    lat1 = np.radians(lat)
+    lat2 = np.radians(np.asarray(lats, dtype=float))
+    dlat = lat2 - lat1
+    dlng = np.radians(np.asarray(lngs, dtype=float) - lng)
+    a = np.sin(dlat / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin(dlng / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.minimum(a, 1.0)))
+
+
+def distance_matrix_km(lats1, lngs1, lats2, lngs2):
+    # Pairwise distances, shape (len(lats1), len(lats2)), in km
+    lat1 = np.radians(np.asarray(lats1, dtype=float))[:, None]
+    lng1 = np.radians(np.asarray(lngs1, dtype=float))[:, None]
+    lat2 = np.radians(np.asarray(lats2, dtype=float))[None, :]
+    lng2 = np.radians(np.asarray(lngs2, dtype=float))[None, :]
+    a = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lng2 - lng1) / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.minimum(a, 1.0)))
+
+
+class GeoIndex:
+    def __init__(self, cell_degrees=0.05):
+        self.cell_degrees = cell_degrees
+        self._positions = {}
+        self._cells = {}
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._positions)
+
+    def __contains__(self, key):
+        return key in self._positions
+
+    def position(self, key):
+        return self._positions.get(key)
+
+    def put(self, key, lat, lng):
+        with self._lock:
+            self._remove(key)
+            self._positions[key] = (float(lat), float(lng))
+            self._cells.setdefault(self._cell(lat, lng), set()).add(key)
+
+    def clear(self):
+        with self._lock:
+            self._positions.clear()
+            self._cells.clear()
+
+    def within(self, lat, lng, radius_km):
+        # [(key, distance_km)] inside the radius, nearest first
+        lat_span = radius_km / KM_PER_DEGREE
+        lng_span = radius_km / (KM_PER_DEGREE * max(math.cos(math.radians(lat)), 0.01))
+        lat_lo, lng_lo = self._cell(lat - lat_span, lng - lng_span)
+        lat_hi, lng_hi = self._cell(lat + lat_span, lng + lng_span)
+        with self._lock:
+            if (lat_hi - lat_lo + 1) * (lng_hi - lng_lo + 1) > len(self._cells):
+                # Huge radius: scanning every occupied cell is cheaper
+                keys = list(self._positions)
+            else:
+                keys = [key for i in range(lat_lo, lat_hi + 1) for j in range(lng_lo, lng_hi + 1)
+                        for key in self._cells.get((i, j), ())]
+            positions = [self._positions[key] for key in keys]
+        ranked = self._rank(lat, lng, keys, positions)
+        return [(key, distance) for key, distance in ranked if distance <= radius_km]
+
+    def _rank(self, lat, lng, keys, positions):
+        if not keys:
+            return []
+        coords = np.asarray(positions, dtype=float)
+        distances = haversine_km(lat, lng, coords[:, 0], coords[:, 1])
+        order = np.argsort(distances, kind='stable')
+        return [(keys[i], float(distances[i])) for i in order]
+
+    def _cell(self, lat, lng):
+        return (math.floor(lat / self.cell_degrees), math.floor(lng / self.cell_degrees))
+
+    def _remove(self, key):
+        position = self._positions.pop(key, None)
+        if position is not None:
+            cell = self._cell(*position)
+            bucket = self._cells.get(cell)
+            if bucket is not None:
+                bucket.discard(key)
+                if not bucket:
+                    del self._cells[cell]
@@ -0,0 +1,65 @@
+import os
+import signal
+import threading
+
+# Production server for backend2:
+#
+#   gunicorn -c gunicorn.conf.py backend2:app
+#
+# Defaults to one process with a pool of threads, which keeps a single
+# in-memory store. With BACKEND2_WORKERS > 1 every worker gets its own slot,
+# which stripes its id space and gives it its own WAL directory; the workers
+# do not share data, so only use that behind sticky routing. The worker count
+# is fixed at startup: there is no autoscaling, and TTIN/TTOU are refused
+# since a worker added at runtime would reuse a slot's ids and WAL.
+
+bind = f"0.0.0.0:{os.environ.get('PORT', 3002)}"
+workers = int(os.environ.get('BACKEND2_WORKERS', 1))
+threads = int(os.environ.get('BACKEND2_THREADS', 8))
+worker_class = 'gthread'
+keepalive = 5
+timeout = 30
+# In-flight requests get this long to finish after draining starts
+graceful_timeout = int(os.environ.get('BACKEND2_GRACEFUL_TIMEOUT', 30))
+# How long /health reports "draining" before the worker stops accepting, so
+# the load balancer (5s health check interval) takes it out of rotation first
+drain_seconds = float(os.environ.get('BACKEND2_DRAIN_SECONDS', 6))
+
+
+def nworkers_changed(server, new_value, old_value):
+    # Setting num_workers runs this hook again, with new_value == workers
+    if old_value is not None and new_value != workers:
+        server.log.warning('Changing the worker count at runtime is not supported; keeping %s', workers)
+        server.num_workers = workers
+
+
+def pre_fork(server, worker):
+    # Give the new worker the lowest slot not held by a live worker
+    taken = {getattr(w, 'slot', None) for w in server.WORKERS.values()}
+    worker.slot = next(slot for slot in range(workers + len(taken) + 1) if slot not in taken)
+
+
+def post_fork(server, worker):
+    # Read by ids.py when the app is imported in the worker
+    os.environ['BACKEND2_WORKER_INDEX'] = str(worker.slot % workers)
+    os.environ['BACKEND2_WORKER_COUNT'] = str(workers)
+
+
+def post_worker_init(worker):
+    import backend2
+    backend2.warm_up()
+
+    handle_exit = worker.handle_exit
+
+    def drain_then_exit(sig, frame):
+        backend2.start_draining()
+        worker.log.info('Draining for %ss before shutdown', drain_seconds)
+        threading.Timer(drain_seconds, handle_exit, args=(sig, frame)).start()
+
+    # The worker already registered its own handler, so re-register ours
+    signal.signal(signal.SIGTERM, drain_then_exit)
+
+
+def worker_exit(server, worker):
+    import backend2
+    backend2.shutdown()
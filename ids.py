@@ -0,0 +1,35 @@
+import os
+import threading
+
+# Concurrency-safe id allocation.
+#
+# Each sequence hands out integers under a lock, so threads never see the
+# same id. When several worker processes serve the same data, each worker
+# takes its own stripe of the id space: worker k of n allocates k+1, k+1+n,
+# k+1+2n, ... which keeps ids unique without any cross-process coordination.
+
+WORKER_INDEX = int(os.environ.get('BACKEND2_WORKER_INDEX', 0))
+WORKER_COUNT = int(os.environ.get('BACKEND2_WORKER_COUNT', 1))
+
+
+class IdSequence:
+    def __init__(self, worker_index=WORKER_INDEX, worker_count=WORKER_COUNT):
+        if not 0 <= worker_index < worker_count:
+            raise ValueError(f'worker index {worker_index} out of range for {worker_count} workers')
+        self.stride = worker_count
+        self.offset = worker_index + 1
+        self._next = self.offset
+        self._lock = threading.Lock()
+
+    def next(self):
+        with self._lock:
+            value = self._next
+            self._next += self.stride
+            return value
+
+    def advance_to(self, value):
+        # Make sure the next id handed out is >= value (used after recovery)
+        with self._lock:
+            if value > self._next:
+                steps = -(-(value - self.offset) // self.stride)
+                self._next = self.offset + steps * self.stride
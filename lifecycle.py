@@ -0,0 +1,37 @@
+# Order lifecycle.
+#
+# The allowed status transitions, checked before any order changes state.
+# Re-sending an order's current status is accepted as a no-op (so a retried
+# request neither fails nor repeats its side effects); anything else outside
+# TRANSITIONS is rejected.
+#
+#   CREATED -> CONFIRMED -> PREPARING -> OUT_FOR_DELIVERY -> DELIVERED
+#      \___________\____________\______> CANCELLED
+
+TRANSITIONS = {
+    'CREATED': ('CONFIRMED', 'CANCELLED'),
+    'CONFIRMED': ('PREPARING', 'CANCELLED'),
+    'PREPARING': ('OUT_FOR_DELIVERY', 'CANCELLED'),
+    'OUT_FOR_DELIVERY': ('DELIVERED',),
+    'DELIVERED': (),
+    'CANCELLED': ()
+}
+FINAL_STATUSES = ('DELIVERED', 'CANCELLED')
+
+
+class TransitionError(ValueError):
+    def __init__(self, code, message, http_status=409):
+        super().__init__(message)
+        self.code = code
+        self.http_status = http_status
+
+
+def check_transition(current, target):
+    # True if the order should move to target, False if it is already there
+    if target not in TRANSITIONS:
+        raise TransitionError('invalid_status', 'Invalid status', 400)
+    if target == current:
+        return False
+    if target not in TRANSITIONS[current]:
+        raise TransitionError('invalid_transition', f'Cannot change order from {current} to {target}')
+    return True
@@ -9,11 +9,20 @@ app.use(express.json());
 app.use(express.static('public'));
 
 const PORT = process.env.PORT || 3000;
+// round-robin, weighted or least-loaded
+const STRATEGY = process.env.LB_STRATEGY || 'least-loaded';
 
 // Backend servers (microservices)
+// Start out unhealthy so nothing is routed until a backend reports ready.
+// `active` counts requests this balancer has in flight to the server and
+// `reportedInFlight` is the backend's own count from its last health check.
+// Backend2's `asyncUrl` is its event-loop server, which serves the routes that
+// mostly wait (notification streams, register and login) without holding a
+// request thread.
 const BACKEND_SERVERS = [
-  { url: 'http://localhost:3001', name: 'Backend1-NodeJS', healthy: true, weight: 1 },
-  { url: 'http://localhost:3002', name: 'Backend2-Python', healthy: true, weight: 1 }
+  { url: 'http://localhost:3001', name: 'Backend1-NodeJS', healthy: false, weight: 1, active: 0, reportedInFlight: 0 },
+  { url: 'http://localhost:3002', name: 'Backend2-Python', healthy: false, weight: 1, active: 0, reportedInFlight: 0,
+    asyncUrl: process.env.BACKEND2_ASYNC_URL || 'http://localhost:3003' }
 ];
 
 let currentServerIndex = 0; // For round-robin
@@ -23,6 +32,8 @@ async function checkServerHealth(server) {
   try {
     const response = await axios.get(`${server.url}/health`, { timeout: 2000 });
     server.healthy = response.status === 200;
+    const load = response.data && response.data.load;
+    server.reportedInFlight = load && typeof load.inFlight === 'number' ? load.inFlight : 0;
     return server.healthy;
   } catch (error) {
     server.healthy = false;
@@ -64,11 +75,112 @@ function getServer(strategy = 'round-robin') {
       }
     }
     return healthyServers[0];
+  } else if (strategy === 'least-loaded') {
+    // Fewest outstanding requests per unit of weight. The backend's reported
+    // count is up to one health-check interval old, so the larger of it and
+    // our own live count is used. Ties rotate so equal servers share traffic.
+    const load = s => Math.max(s.active, s.reportedInFlight) / s.weight;
+    const start = currentServerIndex++ % healthyServers.length;
+    let best = null;
+    for (let i = 0; i < healthyServers.length; i++) {
+      const server = healthyServers[(start + i) % healthyServers.length];
+      if (best === null || load(server) < load(best)) {
+        best = server;
+      }
+    }
+    return best;
   }
   
   return healthyServers[0];
 }
 
+// Endpoints both backends serve. Everything else (batch routes, stats,
+// exports, ...) only exists on Backend2, and auth goes to Backend2 because
+// it signs the tokens (and mirrors new users to Backend1).
+const SHARED_ROUTES = [
+  ['GET', /^\/api\/restaurants$/],
+  ['POST', /^\/api\/restaurants$/],
+  ['GET', /^\/api\/restaurants\/\d+$/],
+  ['GET', /^\/api\/restaurants\/\d+\/menu$/],
+  ['POST', /^\/api\/restaurants\/\d+\/menu\/items$/],
+  ['GET', /^\/api\/orders$/],
+  ['POST', /^\/api\/orders$/],
+  ['GET', /^\/api\/orders\/(?!export$)[^/]+$/],
+  ['POST', /^\/api\/orders\/[^/]+\/restaurant-action$/],
+  ['PATCH', /^\/api\/orders\/[^/]+\/status$/],
+  ['GET', /^\/api\/deliveries$/],
+  ['GET', /^\/api\/notifications$/]
+];
+
+// Backend1 ignores the query string on its list endpoints, so a list request
+// asking for a page, a filter or a projection must go to Backend2
+const LIST_ROUTE = /^\/api\/(orders|deliveries|notifications)$/;
+
+function isShared(req) {
+  const urlPath = req.originalUrl.split('?')[0];
+  if (req.method === 'GET' && LIST_ROUTE.test(urlPath) && Object.keys(req.query).length > 0) {
+    return false;
+  }
+  return SHARED_ROUTES.some(([method, pattern]) => method === req.method && pattern.test(urlPath));
+}
+
+// Routes Backend2 serves from its event-loop server
+const ASYNC_ROUTES = [
+  ['POST', /^\/api\/auth\/(register|login)$/]
+];
+
+function baseUrl(server, req) {
+  const urlPath = req.originalUrl.split('?')[0];
+  const isAsync = ASYNC_ROUTES.some(([method, pattern]) => method === req.method && pattern.test(urlPath));
+  return isAsync && server.asyncUrl ? server.asyncUrl : server.url;
+}
+
+function backend2Server() {
+  return BACKEND_SERVERS.find(s => s.healthy && s.name === 'Backend2-Python') || null;
+}
+
+// Headers passed through in each direction (idempotency keys, version checks
+// and conditional GETs must reach the backend, ETags and cursors must reach
+// the client)
+const FORWARDED_REQUEST_HEADERS = ['authorization', 'idempotency-key', 'if-match', 'if-none-match'];
+const RELAYED_RESPONSE_HEADERS = ['etag', 'cache-control', 'x-next-cursor', 'retry-after'];
+
+// Forward a request to one server, counting it as active while it runs
+async function forward(server, req) {
+  const headers = { 'Content-Type': 'application/json' };
+  for (const name of FORWARDED_REQUEST_HEADERS) {
+    if (req.get(name)) {
+      headers[name] = req.get(name);
+    }
+  }
+  server.active++;
+  try {
+    return await axios({
+      method: req.method,
+      url: `${baseUrl(server, req)}${req.originalUrl}`,
+      data: Object.keys(req.body || {}).length > 0 ? req.body : undefined,
+      headers,
+      timeout: 10000,
+      validateStatus: () => true
+    });
+  } finally {
+    server.active--;
+  }
+}
+
+function relay(res, response) {
+  for (const name of RELAYED_RESPONSE_HEADERS) {
+    if (response.headers[name]) {
+      res.set(name, response.headers[name]);
+    }
+  }
+  if (response.status === 304) {
+    // Conditional GET matched: no body, the client keeps its copy
+    return res.status(304).end();
+  }
+  res.status(response.status).json(response.data);
+}
+
 // Serve frontend
 app.get('/', (req, res) => {
   res.sendFile(path.join(__dirname, 'public', 'index.html'));
@@ -85,58 +197,126 @@ app.get('/health', (req, res) => {
     backends: BACKEND_SERVERS.map(s => ({
       name: s.name,
       url: s.url,
-      healthy: s.healthy
-    }))
+      healthy: s.healthy,
+      active: s.active,
+      reportedInFlight: s.reportedInFlight
+    })),
+    strategy: STRATEGY
+  });
+});
+
+// Pipe a GET through unbuffered: the body is passed on as it arrives (still
+// compressed if it was), so the balancer never holds a whole response
+const PIPED_RESPONSE_HEADERS = ['content-type', 'content-disposition', 'content-encoding', 'vary',
+  'cache-control', 'retry-after'];
+
+async function pipe(server, baseUrl, req, res, requestHeaders) {
+  const headers = {};
+  for (const name of requestHeaders) {
+    if (req.get(name)) {
+      headers[name] = req.get(name);
+    }
+  }
+  server.active++;
+  let response;
+  try {
+    response = await axios({
+      method: 'GET',
+      url: `${baseUrl}${req.originalUrl}`,
+      headers,
+      responseType: 'stream',
+      decompress: false,
+      validateStatus: () => true
+    });
+  } catch (error) {
+    server.active--;
+    throw error;
+  }
+  res.on('close', () => {
+    server.active--;
+    response.data.destroy();
   });
+  res.status(response.status);
+  for (const name of PIPED_RESPONSE_HEADERS) {
+    if (response.headers[name]) {
+      res.set(name, response.headers[name]);
+    }
+  }
+  res.flushHeaders();
+  response.data.pipe(res);
+}
+
+// Notification streams (server-sent events) are only served by Backend2's
+// event-loop server
+app.get('/api/notifications/user/:userId/stream', async (req, res) => {
+  const server = backend2Server();
+  
+  if (!server) {
+    return res.status(503).json({
+      error: 'Service unavailable',
+      message: 'Notification streams are not available'
+    });
+  }
+  
+  try {
+    res.set('Connection', 'keep-alive');
+    await pipe(server, server.asyncUrl, req, res, ['last-event-id']);
+  } catch (error) {
+    console.error(`[Load Balancer] Error streaming from ${server.name}:`, error.message);
+    res.status(502).json({ error: 'Backend service error', message: error.message });
+  }
+});
+
+// NDJSON exports (Backend2 only) can be far larger than any other response
+app.get(/^\/api\/(orders|notifications)\/export$/, async (req, res) => {
+  const server = backend2Server();
+  
+  if (!server) {
+    return res.status(503).json({
+      error: 'Service unavailable',
+      message: 'Backend2 is down'
+    });
+  }
+  
+  try {
+    console.log(`[Load Balancer] ${req.method} ${req.originalUrl} -> ${server.name} (piped)`);
+    await pipe(server, server.url, req, res, ['authorization', 'accept-encoding']);
+  } catch (error) {
+    console.error(`[Load Balancer] Error streaming from ${server.name}:`, error.message);
+    res.status(502).json({ error: 'Backend service error', message: error.message });
+  }
 });
 
 // Proxy all API requests to backend servers
 app.use('/api', async (req, res) => {
-  const server = getServer('round-robin');
+  const shared = isShared(req);
+  const server = shared ? getServer(STRATEGY) : backend2Server();
   
   if (!server) {
     return res.status(503).json({
       error: 'Service unavailable',
-      message: 'All backend servers are down'
+      message: shared ? 'All backend servers are down' : 'Backend2 is down'
     });
   }
   
   try {
-    const targetUrl = `${server.url}${req.originalUrl}`;
     console.log(`[Load Balancer] ${req.method} ${req.originalUrl} -> ${server.name}`);
     
-    const response = await axios({
-      method: req.method,
-      url: targetUrl,
-      data: Object.keys(req.body || {}).length > 0 ? req.body : undefined,
-      params: req.query,
-      headers: {
-        'Content-Type': 'application/json',
-      },
-      timeout: 10000,
-      validateStatus: () => true
-    });
+    const response = await forward(server, req);
     
-    res.status(response.status).json(response.data);
+    relay(res, response);
   } catch (error) {
     console.error(`[Load Balancer] Error proxying to ${server.name}:`, error.message);
     
-    // Try next server if available
-    const nextServer = getServer('round-robin');
-    if (nextServer && nextServer.url !== server.url) {
+    // Try the other server, but only for reads: a POST or PATCH may already
+    // have been applied before the connection failed
+    const nextServer = shared && req.method === 'GET' &&
+      BACKEND_SERVERS.find(s => s.healthy && s.url !== server.url);
+    if (nextServer) {
       try {
-        const retryUrl = `${nextServer.url}${req.originalUrl}`;
         console.log(`[Load Balancer] Retrying with ${nextServer.name}`);
-        const retryResponse = await axios({
-          method: req.method,
-          url: retryUrl,
-          data: Object.keys(req.body || {}).length > 0 ? req.body : undefined,
-          params: req.query,
-          headers: { 'Content-Type': 'application/json' },
-          timeout: 10000,
-          validateStatus: () => true
-        });
-        return res.status(retryResponse.status).json(retryResponse.data);
+        const retryResponse = await forward(nextServer, req);
+        return relay(res, retryResponse);
       } catch (retryError) {
         console.error(`[Load Balancer] Retry also failed:`, retryError.message);
       }
@@ -155,6 +335,7 @@ app.listen(PORT, () => {
   BACKEND_SERVERS.forEach(server => {
     console.log(`   - ${server.name}: ${server.url}`);
   });
+  console.log(`🔀 Strategy: ${STRATEGY}`);
   console.log(`🌐 Frontend available at http://localhost:${PORT}`);
 });
 
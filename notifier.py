@@ -0,0 +1,107 @@
+import queue
+import threading
+import time
+import zlib
+
+from background import BackgroundThread
+
+# Asynchronous notification pipeline.
+#
+# Request handlers submit() notification events and return immediately. A
+# small pool of worker threads drains the queues in batches and hands each
+# batch to handle(), which formats, persists and publishes it. Events are
+# sharded to workers by user, so one user's notifications are always handled
+# in submission order.
+#
+# Each worker queue is bounded. When it is full, submit() blocks until there
+# is room: producers slow down to the pipeline's pace instead of losing
+# events or overtaking the ones already queued for the same user.
+
+
+class NotificationPipeline:
+    def __init__(self, handle, workers=2, maxsize=10000, batch_size=100):
+        self.handle = handle
+        self.batch_size = batch_size
+        self.stats = {
+            'enqueued': 0,
+            'processed': 0,
+            'batches': 0,
+            'blocked': 0,
+            'failed': 0,
+            'lastBatchSize': 0,
+            'lastLagSeconds': 0.0,
+            'avgLagSeconds': 0.0,
+            'maxLagSeconds': 0.0
+        }
+        self._queues = [queue.Queue(maxsize=max(maxsize // workers, 1)) for _ in range(workers)]
+        self._workers = [BackgroundThread(self._run, f'notifier-{i}', (shard,)) for i, shard in enumerate(self._queues)]
+        self._lag_total = 0.0
+        self._lock = threading.Lock()
+
+    def submit(self, user_id, event):
+        self._start_workers()
+        shard = self._queues[zlib.crc32(str(user_id).encode()) % len(self._queues)]
+        item = (time.monotonic(), event)
+        try:
+            shard.put_nowait(item)
+        except queue.Full:
+            self._count('blocked')
+            shard.put(item)
+        self._count('enqueued')
+
+    def depth(self):
+        return sum(q.qsize() for q in self._queues)
+
+    def flush(self, timeout=5.0):
+        # Wait until everything submitted so far has been handled
+        deadline = time.monotonic() + timeout
+        while any(q.unfinished_tasks for q in self._queues):
+            if time.monotonic() >= deadline:
+                return False
+            time.sleep(0.01)
+        return True
+
+    def summary(self):
+        with self._lock:
+            return dict(self.stats, depth=self.depth(), capacity=sum(q.maxsize for q in self._queues))
+
+    def start(self):
+        self._start_workers()
+
+    def _count(self, stat, amount=1):
+        with self._lock:
+            self.stats[stat] += amount
+
+    def _start_workers(self):
+        for worker in self._workers:
+            worker.ensure_started()
+
+    def _run(self, shard):
+        while True:
+            batch = [shard.get()]
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(shard.get_nowait())
+                except queue.Empty:
+                    break
+            self._process(batch)
+            for _ in batch:
+                shard.task_done()
+
+    def _process(self, batch):
+        try:
+            self.handle([event for _, event in batch])
+        except Exception as error:
+            print(f'Error handling {len(batch)} notifications: {error}')
+            self._count('failed', len(batch))
+            return
+        now = time.monotonic()
+        lags = [now - submitted_at for submitted_at, _ in batch]
+        with self._lock:
+            self.stats['processed'] += len(batch)
+            self.stats['batches'] += 1
+            self.stats['lastBatchSize'] = len(batch)
+            self.stats['lastLagSeconds'] = round(max(lags), 6)
+            self.stats['maxLagSeconds'] = max(self.stats['maxLagSeconds'], self.stats['lastLagSeconds'])
+            self._lag_total += sum(lags)
+            self.stats['avgLagSeconds'] = round(self._lag_total / self.stats['processed'], 6)
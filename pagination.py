@@ -0,0 +1,97 @@
+import base64
+from datetime import datetime
+
+# Cursor pagination, filtering and field projection for list endpoints.
+#
+# Cursors are opaque tokens wrapping the collection sequence number of the
+# last record returned, so a page boundary never shifts when new records are
+# appended. Query parameters:
+#
+#   limit=N              page size (default DEFAULT_LIMIT, max MAX_LIMIT)
+#   cursor=...           resume after the page that returned this cursor
+#   <field>=value        equality filters, for the fields an endpoint allows
+#   createdFrom/createdTo  inclusive ISO timestamp range (local time unless
+#                        an offset is given)
+#   fields=a,b,c         only return these keys of each record
+
+DEFAULT_LIMIT = 100
+MAX_LIMIT = 1000
+PAGING_PARAMS = ('limit', 'cursor', 'fields', 'createdFrom', 'createdTo')
+
+
+def encode_cursor(seq):
+    return base64.urlsafe_b64encode(f's{seq}'.encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        value = base64.urlsafe_b64decode(padded.encode()).decode()
+        if not value.startswith('s'):
+            raise ValueError
+        return int(value[1:])
+    except (ValueError, UnicodeDecodeError):
+        raise ValueError('Invalid cursor')
+
+
+def wants_page(args, filters):
+    return any(name in args for name in PAGING_PARAMS) or any(name in args for name in filters)
+
+
+def parse_fields(args):
+    fields = args.get('fields')
+    if not fields:
+        return None
+    return [field.strip() for field in fields.split(',') if field.strip()]
+
+
+def project(records, fields):
+    if not fields:
+        return records
+    return [{field: record[field] for field in fields if field in record} for record in records]
+
+
+def parse_filters(args, filters):
+    # filters maps an allowed query parameter to a converter for its value
+    where = {}
+    for name, convert in filters.items():
+        if name in args:
+            try:
+                where[name] = convert(args[name])
+            except ValueError:
+                raise ValueError(f'Invalid value for {name}')
+    return where
+
+
+def parse_time(args, name):
+    value = args.get(name)
+    if not value:
+        return None
+    try:
+        parsed = datetime.fromisoformat(value)
+    except ValueError:
+        raise ValueError(f'Invalid value for {name}')
+    # Stored timestamps are naive local time
+    return parsed.astimezone().replace(tzinfo=None) if parsed.tzinfo else parsed
+
+
+def time_range(args):
+    return parse_time(args, 'createdFrom'), parse_time(args, 'createdTo')
+
+
+def paginate(collection, args, filters):
+    try:
+        limit = int(args.get('limit', DEFAULT_LIMIT))
+    except ValueError:
+        raise ValueError('limit must be an integer')
+    if limit < 1:
+        raise ValueError('limit must be positive')
+    limit = min(limit, MAX_LIMIT)
+
+    after = decode_cursor(args['cursor']) if args.get('cursor') else -1
+
+    since, until = time_range(args)
+    records, last = collection.scan(after=after, where=parse_filters(args, filters),
+        since=since, until=until, limit=limit)
+    next_cursor = encode_cursor(last) if last is not None and len(records) == limit else None
+    return project(records, parse_fields(args)), next_cursor
@@ -0,0 +1,64 @@
+import threading
+
+# Order validation and pricing against per-restaurant menu tables.
+#
+# Each restaurant's menu is held as a dict of menu item id -> (price,
+# available, name), built on first use and dropped when the restaurant's
+# menu changes. Pricing an order is then one dict lookup per line item with
+# no store access, and a batch fetches each restaurant's table once.
+# Totals are summed in item order, as a Python sum over the items always was.
+
+
+class PriceTables:
+    def __init__(self, load):
+        # load(restaurant_id) -> that restaurant's menu item records
+        self._load = load
+        self._tables = {}
+        self._versions = {}
+        self._lock = threading.Lock()
+        self.stats = {'builds': 0, 'invalidations': 0}
+
+    def get(self, restaurant_id):
+        table = self._tables.get(restaurant_id)
+        if table is not None:
+            return table
+        version = self._versions.get(restaurant_id, 0)
+        table = {item['id']: (float(item['price']), bool(item.get('available')), item['name'])
+                 for item in self._load(restaurant_id)}
+        with self._lock:
+            self.stats['builds'] += 1
+            # Don't keep a table that missed a change made while it was built
+            if self._versions.get(restaurant_id, 0) == version:
+                self._tables[restaurant_id] = table
+        return table
+
+    def invalidate(self, restaurant_id):
+        with self._lock:
+            self._versions[restaurant_id] = self._versions.get(restaurant_id, 0) + 1
+            if self._tables.pop(restaurant_id, None) is not None:
+                self.stats['invalidations'] += 1
+
+    def summary(self):
+        with self._lock:
+            return dict(self.stats, restaurants=len(self._tables))
+
+
+def price_order(table, ids, quantities):
+    # (total, [(menuItemId, quantity, menuItemName, price), ...]) or (None,
+    # first menu item id that is missing or unavailable)
+    items = []
+    total = 0
+    for menu_item_id, quantity in zip(ids, quantities):
+        entry = table.get(menu_item_id)
+        if entry is None or not entry[1]:
+            return None, menu_item_id
+        items.append((menu_item_id, quantity, entry[2], entry[0]))
+        total += entry[0] * quantity
+    return total, items
+
+
+def price_orders(tables, orders):
+    # orders: [(restaurant id, [menu item id, ...], [quantity, ...])]; one
+    # price_order() result per order
+    return [price_order(tables.get(restaurant_id), ids, quantities)
+            for restaurant_id, ids, quantities in orders]
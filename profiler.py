@@ -0,0 +1,50 @@
+import os
+import sys
+import threading
+import time
+from collections import Counter
+
+# Sampling profiler for flame graphs.
+#
+# Every `interval` seconds the stack of every other thread is captured with
+# sys._current_frames() and counted. The result is in collapsed-stack format
+# ("outer;inner;leaf count" per line), which flamegraph.pl and speedscope read
+# directly. Sampling costs nothing when no profile is running.
+
+PROFILE_LOCK = threading.Lock()
+# A thread whose innermost Python frame is in one of these is parked in a
+# lock, queue or socket wait
+WAITING_MODULES = {'threading.py', 'queue.py', 'selectors.py', 'socket.py', 'socketserver.py', 'ssl.py'}
+
+
+def frame_name(frame):
+    code = frame.f_code
+    return f'{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})'
+
+
+def sample(seconds=5.0, interval=0.005, idle=False):
+    # Collapsed stacks over `seconds`. Idle threads (blocked in waits) are
+    # left out unless idle is True, so the profile shows where time is spent.
+    stacks = Counter()
+    me = threading.get_ident()
+    deadline = time.perf_counter() + seconds
+    samples = 0
+    while time.perf_counter() < deadline:
+        for thread_id, frame in sys._current_frames().items():
+            if thread_id == me:
+                continue
+            if not idle and os.path.basename(frame.f_code.co_filename) in WAITING_MODULES:
+                continue
+            names = []
+            while frame is not None:
+                names.append(frame_name(frame))
+                frame = frame.f_back
+            stacks[';'.join(reversed(names))] += 1
+        samples += 1
+        time.sleep(interval)
+    return stacks, samples
+
+
+def collapsed(stacks):
+    return ''.join(f'{stack} {count}\n' for stack, count in stacks.most_common())
+
@@ -0,0 +1,146 @@
+import asyncio
+import queue
+import threading
+from collections import OrderedDict, deque
+
+# In-process pub/sub for per-user event streams.
+#
+# Each user has a bounded ring buffer of recent events, so a client that
+# reconnects can resume after its Last-Event-ID without touching the store,
+# plus any number of live subscriptions (one bounded queue each). Publishing
+# never blocks: a subscription whose queue is full is closed, and its client
+# reconnects and resumes from the ring buffer. Buffers of users without live
+# subscriptions are evicted least recently published first once more than
+# max_users are held.
+#
+# A subscription made with an event loop is read with `await next()` on that
+# loop instead of the blocking get(), so a stream waits without a thread.
+
+
+class Subscription:
+    def __init__(self, hub, user_id, maxsize, loop=None):
+        self.hub = hub
+        self.user_id = user_id
+        self.closed = False
+        self._queue = queue.Queue(maxsize)
+        self._loop = loop
+        self._ready = asyncio.Event() if loop is not None else None
+
+    def get(self, timeout=None):
+        # Next (event_id, data), or None when nothing arrived within timeout
+        try:
+            return self._queue.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+    async def next(self, timeout=None):
+        # get() for subscriptions made with a loop; call it on that loop
+        while True:
+            try:
+                return self._queue.get_nowait()
+            except queue.Empty:
+                pass
+            if self.closed:
+                return None
+            self._ready.clear()
+            # Anything offered before the clear() is in the queue by now
+            if not self._queue.empty() or self.closed:
+                continue
+            try:
+                await asyncio.wait_for(self._ready.wait(), timeout)
+            except asyncio.TimeoutError:
+                return None
+
+    def close(self):
+        self.closed = True
+        self.hub.unsubscribe(self)
+        self._wake()
+
+    def _offer(self, event):
+        try:
+            self._queue.put_nowait(event)
+            return True
+        except queue.Full:
+            self.closed = True
+            return False
+        finally:
+            self._wake()
+
+    def _wake(self):
+        if self._loop is not None:
+            try:
+                self._loop.call_soon_threadsafe(self._ready.set)
+            except RuntimeError:
+                # Loop already closed (shutdown)
+                pass
+
+
+class Hub:
+    def __init__(self, buffer_size=100, max_users=10000, subscriber_queue=256):
+        self.buffer_size = buffer_size
+        self.max_users = max_users
+        self.subscriber_queue = subscriber_queue
+        self.stats = {'published': 0, 'delivered': 0, 'overflowed': 0, 'evictedUsers': 0}
+        self._buffers = OrderedDict()
+        self._subscribers = {}
+        self._lock = threading.Lock()
+
+    def publish(self, user_id, event_id, data):
+        event = (event_id, data)
+        with self._lock:
+            buffer = self._buffers.get(user_id)
+            if buffer is None:
+                self._evict_idle()
+                buffer = self._buffers[user_id] = deque(maxlen=self.buffer_size)
+            else:
+                self._buffers.move_to_end(user_id)
+            buffer.append(event)
+            subscribers = list(self._subscribers.get(user_id, ()))
+            self.stats['published'] += 1
+
+        for subscription in subscribers:
+            if subscription._offer(event):
+                self._count('delivered')
+            else:
+                self._count('overflowed')
+                self.unsubscribe(subscription)
+
+    def subscribe(self, user_id, last_event_id=None, loop=None):
+        # Returns (subscription, backlog). The backlog holds buffered events
+        # after last_event_id (all of them when it is None); anything
+        # published later arrives through the subscription.
+        subscription = Subscription(self, user_id, self.subscriber_queue, loop)
+        with self._lock:
+            self._subscribers.setdefault(user_id, set()).add(subscription)
+            buffer = self._buffers.get(user_id, ())
+            backlog = [event for event in buffer if last_event_id is None or event[0] > last_event_id]
+        return subscription, backlog
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            subscribers = self._subscribers.get(subscription.user_id)
+            if subscribers is not None:
+                subscribers.discard(subscription)
+                if not subscribers:
+                    del self._subscribers[subscription.user_id]
+
+    def summary(self):
+        with self._lock:
+            return dict(self.stats, users=len(self._buffers),
+                subscribers=sum(len(s) for s in self._subscribers.values()))
+
+    def _count(self, stat):
+        with self._lock:
+            self.stats[stat] += 1
+
+    def _evict_idle(self):
+        # Make room for one more user: oldest first, users with live
+        # subscriptions are kept
+        for _ in range(len(self._buffers)):
+            if len(self._buffers) < self.max_users:
+                return
+            user_id, buffer = self._buffers.popitem(last=False)
+            if user_id in self._subscribers:
+                self._buffers[user_id] = buffer
+            else:
+                self.stats['evictedUsers'] += 1
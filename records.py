@@ -0,0 +1,169 @@
+import sys
+from datetime import datetime
+from enum import StrEnum
+
+# Compact record types for the high-volume collections (orders, notifications).
+#
+# Records use __slots__ instead of a per-record dict. Status and type values
+# are shared enum members, user ids and titles are interned, timestamps are
+# integer epoch milliseconds and order items are tuples. Records still behave
+# like the dicts they replace: record['field'], get(), `in`, update() and
+# dict(record) all use the API field names and produce the API values (ISO
+# timestamps, item dicts), so the store, the log and JSON output see the same
+# shape as before. Internal code that wants the raw value can read the
+# attribute directly (order.createdAt is epoch milliseconds).
+#
+# Optional fields that are None are left out, as missing keys were before.
+
+
+class OrderStatus(StrEnum):
+    CREATED = 'CREATED'
+    CONFIRMED = 'CONFIRMED'
+    PREPARING = 'PREPARING'
+    OUT_FOR_DELIVERY = 'OUT_FOR_DELIVERY'
+    DELIVERED = 'DELIVERED'
+    CANCELLED = 'CANCELLED'
+
+
+class NotificationType(StrEnum):
+    ORDER_CREATED = 'ORDER_CREATED'
+    ORDER_CONFIRMED = 'ORDER_CONFIRMED'
+    ORDER_PREPARING = 'ORDER_PREPARING'
+    ORDER_OUT_FOR_DELIVERY = 'ORDER_OUT_FOR_DELIVERY'
+    ORDER_DELIVERED = 'ORDER_DELIVERED'
+    ORDER_CANCELLED = 'ORDER_CANCELLED'
+    DELIVERY_ASSIGNED = 'DELIVERY_ASSIGNED'
+
+
+def to_epoch_ms(value):
+    if value is None or isinstance(value, int):
+        return value
+    if isinstance(value, float):
+        return int(value * 1000)
+    return int(datetime.fromisoformat(value).timestamp() * 1000)
+
+
+def to_iso(ms):
+    return datetime.fromtimestamp(ms / 1000).isoformat(timespec='milliseconds')
+
+
+def intern(value):
+    return sys.intern(value) if type(value) is str else value
+
+
+def enum_or_intern(enum, value):
+    try:
+        return enum(value)
+    except ValueError:
+        return intern(value)
+
+
+class Record:
+    __slots__ = ()
+    FIELDS = ()
+    TIMESTAMPS = frozenset()
+
+    def __init__(self, **fields):
+        for field in self.FIELDS:
+            setattr(self, field, None)
+        self.update(fields)
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(**data)
+
+    def __getitem__(self, field):
+        if field not in self.__slots__:
+            raise KeyError(field)
+        value = getattr(self, field)
+        if value is None:
+            raise KeyError(field)
+        return self._export(field, value)
+
+    def __setitem__(self, field, value):
+        self.update({field: value})
+
+    def __contains__(self, field):
+        return field in self.__slots__ and getattr(self, field) is not None
+
+    def __iter__(self):
+        return iter(self.keys())
+
+    def __len__(self):
+        return len(self.keys())
+
+    def __repr__(self):
+        return f'{type(self).__name__}({self.to_dict()!r})'
+
+    def get(self, field, default=None):
+        try:
+            return self[field]
+        except KeyError:
+            return default
+
+    def keys(self):
+        return [field for field in self.FIELDS if getattr(self, field) is not None]
+
+    def items(self):
+        return [(field, self[field]) for field in self.keys()]
+
+    def update(self, changes=(), **more):
+        for field, value in dict(changes, **more).items():
+            if field not in self.__slots__:
+                raise KeyError(f'{type(self).__name__} has no field {field!r}')
+            setattr(self, field, self._import(field, value))
+
+    def to_dict(self):
+        return {field: self[field] for field in self.keys()}
+
+    def _import(self, field, value):
+        if value is None:
+            return None
+        if field in self.TIMESTAMPS:
+            return to_epoch_ms(value)
+        return value
+
+    def _export(self, field, value):
+        if field in self.TIMESTAMPS:
+            return to_iso(value)
+        return value
+
+
+class Order(Record):
+    __slots__ = ('orderId', 'id', 'userId', 'restaurantId', 'status', 'totalAmount', 'items',
+                 'deliveryAddress', 'deliveryLatitude', 'deliveryLongitude', 'createdAt', 'updatedAt',
+                 'deliveryId', 'preparingAt', 'outForDeliveryAt', 'deliveredAt')
+    FIELDS = __slots__
+    TIMESTAMPS = frozenset(('createdAt', 'updatedAt', 'preparingAt', 'outForDeliveryAt', 'deliveredAt'))
+    # items are stored as (menuItemId, quantity, price, menuItemName) tuples
+    ITEM_FIELDS = ('menuItemId', 'quantity', 'price', 'menuItemName')
+
+    def _import(self, field, value):
+        if field == 'status':
+            return enum_or_intern(OrderStatus, value)
+        if field == 'userId':
+            return intern(value)
+        if field == 'items' and value is not None:
+            return tuple((item['menuItemId'], item['quantity'], item['price'], intern(item['menuItemName']))
+                         for item in value)
+        return super()._import(field, value)
+
+    def _export(self, field, value):
+        if field == 'items':
+            return [dict(zip(self.ITEM_FIELDS, item)) for item in value]
+        return super()._export(field, value)
+
+
+class Notification(Record):
+    __slots__ = ('id', 'userId', 'type', 'title', 'message', 'orderId', 'status', 'timestamp')
+    FIELDS = __slots__
+    TIMESTAMPS = frozenset(('timestamp',))
+
+    def _import(self, field, value):
+        if field == 'type':
+            return enum_or_intern(NotificationType, value)
+        if field == 'status':
+            return enum_or_intern(OrderStatus, value)
+        if field in ('userId', 'title'):
+            return intern(value)
+        return super()._import(field, value)
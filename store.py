@@ -0,0 +1,265 @@
+import threading
+from collections import ChainMap
+from contextlib import ExitStack, contextmanager
+from bisect import bisect_left, bisect_right, insort
+from datetime import datetime
+
+from records import Notification, Order
+
+# In-memory store with hash indexes.
+#
+# Each collection keeps its records in insertion order and maintains a
+# primary-key index plus any number of secondary indexes. Unique indexes map
+# a key to one record, non-unique indexes map a key to the sorted insertion
+# sequence numbers of the records sharing it. All mutations must go through
+# insert()/update() so the indexes never drift from the records.
+#
+# Sequence numbers never change once assigned, which makes them stable
+# pagination cursors: scan() resumes strictly after a given sequence number,
+# and new records always land at the end.
+#
+# evict() drops the oldest records of a bounded collection; sequence numbers
+# of the remaining records stay the same (rows are offset by the number of
+# records evicted so far).
+#
+# A collection may have a record_type (see records.py); inserted dicts are
+# converted to it, so replayed logs and snapshots load as compact records.
+#
+# Every record also has a version number, bumped on each update, and the
+# collection has a generation bumped on any mutation; response caches use them
+# to tell when serialized output went stale.
+#
+# Each collection has its own lock, so writers to different collections
+# never contend. Mutations are reported to an optional listener (the
+# write-ahead log) while the lock is held, in the order they are applied.
+# Store.locked() takes every collection lock for a consistent snapshot.
+
+
+class DuplicateKeyError(KeyError):
+    pass
+
+
+class Collection:
+    def __init__(self, name, primary_key, unique=None, indexes=None, time_key=None, record_type=None):
+        self.name = name
+        self.record_type = record_type
+        self.listener = None
+        self.lock = threading.RLock()
+        self._pk = primary_key
+        self._time_key = time_key
+        self._rows = []
+        self._offset = 0
+        self._by_pk = {}
+        self._seqs = {}
+        self._versions = {}
+        self.generation = 0
+        self._unique = {index: {} for index in (unique or {})}
+        self._unique_keys = dict(unique or {})
+        self._indexes = {index: {} for index in (indexes or {})}
+        self._index_keys = dict(indexes or {})
+
+    def __iter__(self):
+        return iter(self._rows)
+
+    def __len__(self):
+        return len(self._rows)
+
+    def __contains__(self, key):
+        return key in self._by_pk
+
+    def all(self):
+        return list(self._rows)
+
+    def get(self, key):
+        return self._by_pk.get(key)
+
+    def version(self, key):
+        return self._versions.get(key, 0)
+
+    def find_one(self, index, key):
+        return self._unique[index].get(key)
+
+    def find(self, index, key):
+        # Under the lock: evict() shifts rows and offset together
+        with self.lock:
+            rows, offset = self._rows, self._offset
+            return [rows[seq - offset] for seq in self._indexes[index].get(key, ())]
+
+    def scan(self, after=-1, where=None, since=None, until=None, limit=None):
+        # Records with sequence number > after, in insertion order, matching
+        # every field in where. The smallest matching index bucket drives the
+        # scan; since/until (datetimes) bound time_key, which grows with
+        # insertion order, by binary search. Returns (records, seq of the last record).
+        with self.lock:
+            return self._scan(after, dict(where or {}), since, until, limit)
+
+    def _scan(self, after, where, since, until, limit):
+        indexed = [(len(self._indexes[f].get(v, ())), f) for f, v in where.items() if f in self._indexes]
+        if indexed:
+            _, field = min(indexed)
+            candidates = self._indexes[field].get(where.pop(field), [])
+        else:
+            candidates = range(self._offset, self._offset + len(self._rows))
+
+        rows, offset = self._rows, self._offset
+        start = bisect_right(candidates, after)
+        end = len(candidates)
+        if self._time_key is not None and since is not None:
+            start = max(start, bisect_left(candidates, since, key=lambda seq: self._time_key(rows[seq - offset])))
+        if self._time_key is not None and until is not None:
+            end = bisect_right(candidates, until, key=lambda seq: self._time_key(rows[seq - offset]))
+
+        checks = [(self._field_getter(f), v) for f, v in where.items()]
+        records = []
+        last = None
+        for i in range(start, end):
+            seq = candidates[i]
+            record = rows[seq - offset]
+            if all(get(record) == value for get, value in checks):
+                records.append(record)
+                last = seq
+                if limit is not None and len(records) >= limit:
+                    break
+        return records, last
+
+    def insert(self, record):
+        if self.record_type is not None and not isinstance(record, self.record_type):
+            record = self.record_type.from_dict(record)
+        with self.lock:
+            key = self._pk(record)
+            if key in self._by_pk:
+                raise DuplicateKeyError(f'{self.name}: duplicate key {key!r}')
+            # Every index key is computed (and checked hashable) before
+            # anything changes, so a bad record leaves no trace
+            values = self._index_values(record)
+            for index, value in values[0].items():
+                if value is not None and value in self._unique[index]:
+                    raise DuplicateKeyError(f'{self.name}: duplicate {index} {value!r}')
+
+            seq = self._offset + len(self._rows)
+            self._rows.append(record)
+            self._by_pk[key] = record
+            self._seqs[key] = seq
+            self._versions[key] = 1
+            self.generation += 1
+            self._add_to_indexes(seq, record, values)
+            if self.listener:
+                self.listener('insert', self.name, key, record)
+            return record
+
+    def update(self, record, **changes):
+        with self.lock:
+            key = self._pk(record)
+            seq = self._seqs[key]
+            self._index_values(ChainMap(changes, record))
+            self._remove_from_indexes(seq, record)
+            record.update(changes)
+            self._versions[key] += 1
+            self.generation += 1
+            self._add_to_indexes(seq, record)
+            if self.listener:
+                self.listener('update', self.name, key, changes)
+            return record
+
+    def evict(self, count):
+        # Drop the oldest `count` records; returns them
+        with self.lock:
+            evicted = self._rows[:count]
+            if not evicted:
+                return evicted
+            for seq, record in enumerate(evicted, self._offset):
+                key = self._pk(record)
+                self._remove_from_indexes(seq, record)
+                del self._by_pk[key]
+                del self._seqs[key]
+                del self._versions[key]
+            del self._rows[:len(evicted)]
+            self._offset += len(evicted)
+            self.generation += 1
+            if self.listener:
+                self.listener('evict', self.name, None, len(evicted))
+            return evicted
+
+    def _field_getter(self, field):
+        return self._index_keys.get(field) or (lambda record: record.get(field))
+
+    def _index_values(self, record):
+        # ({unique index: key}, {index: key}); raises before any change if a
+        # key function fails or a key is unhashable
+        unique = {index: key_func(record) for index, key_func in self._unique_keys.items()}
+        indexes = {index: key_func(record) for index, key_func in self._index_keys.items()}
+        for value in (*unique.values(), *indexes.values()):
+            hash(value)
+        return unique, indexes
+
+    def _add_to_indexes(self, seq, record, values=None):
+        unique, indexes = values or self._index_values(record)
+        for index, value in unique.items():
+            if value is not None:
+                self._unique[index][value] = record
+        for index, value in indexes.items():
+            bucket = self._indexes[index].setdefault(value, [])
+            if not bucket or bucket[-1] < seq:
+                bucket.append(seq)
+            else:
+                insort(bucket, seq)
+
+    def _remove_from_indexes(self, seq, record):
+        for index, key_func in self._unique_keys.items():
+            value = key_func(record)
+            if self._unique[index].get(value) is record:
+                del self._unique[index][value]
+        for index, key_func in self._index_keys.items():
+            value = key_func(record)
+            bucket = self._indexes[index].get(value)
+            if bucket is not None:
+                i = bisect_left(bucket, seq)
+                if i < len(bucket) and bucket[i] == seq:
+                    del bucket[i]
+                if not bucket:
+                    del self._indexes[index][value]
+
+
+class Store:
+    def __init__(self):
+        self.users = Collection('users', lambda u: u['id'],
+            unique={'email': lambda u: u['email']})
+        self.restaurants = Collection('restaurants', lambda r: r['id'])
+        self.menu_items = Collection('menu_items', lambda m: (m['restaurantId'], m['id']),
+            indexes={'restaurantId': lambda m: m['restaurantId']})
+        self.orders = Collection('orders', lambda o: o['orderId'],
+            indexes={'userId': lambda o: o['userId'],
+                     'restaurantId': lambda o: o['restaurantId'],
+                     'status': lambda o: o['status']},
+            time_key=lambda o: datetime.fromisoformat(o['createdAt']),
+            record_type=Order)
+        self.deliveries = Collection('deliveries', lambda d: d['deliveryId'],
+            indexes={'orderId': lambda d: d['orderId'],
+                     'status': lambda d: d['status'],
+                     'partnerId': lambda d: d['partnerId']},
+            time_key=lambda d: datetime.fromisoformat(d['createdAt']))
+        self.notifications = Collection('notifications', lambda n: n['id'],
+            indexes={'userId': lambda n: n['userId'],
+                     'type': lambda n: n['type'],
+                     'status': lambda n: n['status'],
+                     'orderId': lambda n: n['orderId']},
+            time_key=lambda n: datetime.fromisoformat(n['timestamp']),
+            record_type=Notification)
+
+    def collections(self):
+        return [self.users, self.restaurants, self.menu_items,
+                self.orders, self.deliveries, self.notifications]
+
+    @contextmanager
+    def locked(self):
+        with ExitStack() as stack:
+            for collection in self.collections():
+                stack.enter_context(collection.lock)
+            yield
+
+    def collection(self, name):
+        return getattr(self, name)
+
+    def attach(self, listener):
+        for collection in self.collections():
+            collection.listener = listener
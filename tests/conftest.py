@@ -0,0 +1,12 @@
+import os
+import sys
+
+# The modules live at the repository root, next to backend2.py
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+# Set before backend2 is imported by any test
+os.environ.setdefault('BACKEND2_NOTIFICATION_LOG', '0')
+os.environ.setdefault('BACKEND1_URL', 'http://127.0.0.1:9')
+os.environ.setdefault('BACKEND2_DISPATCH_WINDOW_MS', '20')
+os.environ.setdefault('BACKEND2_ASYNC_PORT', '0')
@@ -0,0 +1,102 @@
+import hashlib
+import http.client
+import json
+import time
+
+import pytest
+
+import auth
+import backend2
+from auth import SessionCache, decode_token, generate_token, verify_password
+
+
+@pytest.fixture(scope='module')
+def async_port():
+    backend2.warm_up()
+    return backend2.async_front.port
+
+
+def post(port, path, body):
+    connection = http.client.HTTPConnection('127.0.0.1', port, timeout=10)
+    try:
+        connection.request('POST', path, json.dumps(body), {'Content-Type': 'application/json'})
+        response = connection.getresponse()
+        return response.status, json.loads(response.read())
+    finally:
+        connection.close()
+
+
+def test_register_and_login_on_the_event_loop_server(async_port):
+    user = {'email': 'loop@example.com', 'password': 'secret', 'name': 'Loop'}
+    status, body = post(async_port, '/api/auth/register', user)
+    assert status == 201
+    assert backend2.verify_token(body['token'])['userId'] == body['user']['id']
+
+    assert post(async_port, '/api/auth/register', user) == (400, {'error': 'User with this email already exists'})
+
+    status, body = post(async_port, '/api/auth/login', {'email': user['email'], 'password': 'secret'})
+    assert status == 200
+    assert body['user']['email'] == user['email']
+    assert post(async_port, '/api/auth/login', {'email': user['email'], 'password': 'wrong'})[0] == 401
+
+
+@pytest.mark.parametrize('path', ['/api/auth/register', '/api/auth/login'])
+def test_auth_without_a_json_object_is_a_400(async_port, path):
+    assert post(async_port, path, ['secret'])[0] == 400
+    assert backend2.app.test_client().post(path, data='secret').status_code == 400
+
+
+def test_a_forged_token_is_rejected():
+    payload, signature = generate_token('USER-1').split('.')
+    other_payload = generate_token('USER-2').split('.')[0]
+    assert decode_token(f'{other_payload}.{signature}') is None
+    assert decode_token(f'{payload}.{signature[:-2]}AA') is None
+    assert decode_token(payload) is None
+    assert backend2.verify_token(f'{other_payload}.{signature}') is None
+
+
+def test_an_expired_token_is_rejected(monkeypatch):
+    assert decode_token(generate_token('USER-1', ttl=-1)) is None
+
+    # A cached session stops verifying once it expires
+    cache = SessionCache()
+    token = generate_token('USER-1', ttl=60)
+    assert cache.verify(token)['userId'] == 'USER-1'
+    now = time.time()
+    monkeypatch.setattr(auth.time, 'time', lambda: now + 61)
+    assert cache.verify(token) is None
+    assert cache.summary()['rejected'] == 1
+
+
+def test_a_legacy_sha256_hash_is_accepted_and_upgraded(async_port):
+    backend2.users.insert({'id': 'USER-LEGACY', 'email': 'legacy@example.com', 'name': 'Legacy', 'phone': '',
+        'password': hashlib.sha256(b'old-secret').hexdigest(), 'createdAt': '2024-01-01T00:00:00'})
+    client = backend2.app.test_client()
+
+    response = client.post('/api/auth/login', json={'email': 'legacy@example.com', 'password': 'old-secret'})
+    assert response.status_code == 200
+    stored = backend2.users.get('USER-LEGACY')['password']
+    assert stored.startswith('scrypt$')
+    assert verify_password('old-secret', stored) == (True, False)
+
+    response = client.post('/api/auth/login', json={'email': 'legacy@example.com', 'password': 'old-secret'})
+    assert response.status_code == 200
+    assert backend2.users.get('USER-LEGACY')['password'] == stored
+
+
+def test_me_with_a_cached_session(async_port):
+    status, body = post(async_port, '/api/auth/register',
+        {'email': 'me@example.com', 'password': 'secret', 'name': 'Me'})
+    assert status == 201
+    client = backend2.app.test_client()
+    headers = {'Authorization': f"Bearer {body['token']}"}
+
+    hits = backend2.sessions.summary()['hits']
+    for _ in range(2):
+        response = client.get('/api/auth/me', headers=headers)
+        assert response.status_code == 200
+        assert response.get_json() == body['user']
+    assert backend2.sessions.summary()['hits'] >= hits + 1
+
+    assert client.get('/api/auth/me', headers={'Authorization': 'Bearer forged.token'}).status_code == 401
+    assert client.get('/api/auth/me').status_code == 401
@@ -0,0 +1,63 @@
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from backend1_client import Backend1Client, CircuitBreaker, SyncQueue
+
+
+@pytest.fixture
+def backend1():
+    # Answers POST /bad with 500 and anything else with 200, counting calls
+    calls = {}
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_POST(self):
+            self.rfile.read(int(self.headers.get('Content-Length', 0)))
+            calls[self.path] = calls.get(self.path, 0) + 1
+            self.send_response(500 if self.path == '/bad' else 200)
+            self.send_header('Content-Length', '2')
+            self.end_headers()
+            self.wfile.write(b'{}')
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield f'http://127.0.0.1:{server.server_address[1]}', calls
+    server.shutdown()
+
+
+def wait_until(condition, timeout=10.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline
+        time.sleep(0.01)
+
+
+def test_a_rejected_sync_fails_after_max_retries(backend1):
+    url, calls = backend1
+    client = Backend1Client(url, breaker=CircuitBreaker(failure_threshold=3, reset_timeout=0.2))
+    sync_queue = SyncQueue(client, max_retries=3, backoff=0.01)
+    for path in ('/bad', '/bad', '/good', '/good'):
+        sync_queue.submit(path, {})
+
+    wait_until(lambda: sync_queue.stats['sent'] + sync_queue.stats['failed'] == 4)
+    assert sync_queue.stats['failed'] == 2
+    assert calls == {'/bad': 8, '/good': 2}
+    assert client.breaker.state == CircuitBreaker.CLOSED
+
+
+def test_syncs_wait_while_the_circuit_is_open(backend1):
+    url, calls = backend1
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=0.3)
+    breaker.record_failure()
+    sync_queue = SyncQueue(Backend1Client(url, breaker=breaker), backoff=0.01)
+    sync_queue.submit('/good', {})
+
+    wait_until(lambda: sync_queue.stats['sent'] == 1)
+    assert sync_queue.stats['deferred'] >= 1
+    assert sync_queue.stats['failed'] == 0
+    assert calls == {'/good': 1}
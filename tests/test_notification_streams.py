@@ -0,0 +1,76 @@
+import threading
+import time
+
+import httpx
+import pytest
+
+import backend2
+
+
+@pytest.fixture(scope='module')
+def base_url():
+    backend2.warm_up()
+    return f'http://127.0.0.1:{backend2.async_front.port}'
+
+
+def wait_until(condition, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline
+        time.sleep(0.01)
+
+
+def read_events(response, count):
+    ids = []
+    for line in response.iter_lines():
+        if line.startswith('id: '):
+            ids.append(int(line[4:]))
+            if len(ids) == count:
+                return ids
+    return ids
+
+
+def notify(user_id, count):
+    for _ in range(count):
+        backend2.send_notification(user_id, 'ORDER_CREATED', 'Order Created', 'Placed', 'ORD-0', 'CREATED')
+    backend2.notification_pipeline.flush()
+
+
+def test_streams_new_notifications(base_url):
+    results = []
+
+    def listen():
+        with httpx.stream('GET', f'{base_url}/api/notifications/user/stream-user/stream', timeout=10) as response:
+            results.append(response.headers['content-type'])
+            results.append(read_events(response, 2))
+
+    listener = threading.Thread(target=listen)
+    listener.start()
+    wait_until(lambda: backend2.open_streams == 1)
+    notify('stream-user', 2)
+    listener.join(10)
+    assert results[0] == 'text/event-stream'
+    assert len(results[1]) == 2
+    # Closing the connection ends the stream and frees its subscription
+    wait_until(lambda: backend2.open_streams == 0)
+
+
+def test_resumes_after_last_event_id(base_url):
+    notify('resume-user', 3)
+    with httpx.stream('GET', f'{base_url}/api/notifications/user/resume-user/stream', timeout=10) as response:
+        first, second, third = read_events(response, 3)
+    with httpx.stream('GET', f'{base_url}/api/notifications/user/resume-user/stream',
+            headers={'Last-Event-ID': str(first)}, timeout=10) as response:
+        assert read_events(response, 2) == [second, third]
+
+
+def test_rejects_a_bad_last_event_id(base_url):
+    response = httpx.get(f'{base_url}/api/notifications/user/u/stream', headers={'Last-Event-ID': 'abc'})
+    assert response.status_code == 400
+
+
+def test_caps_open_streams(base_url, monkeypatch):
+    monkeypatch.setattr(backend2, 'MAX_STREAMS', 0)
+    response = httpx.get(f'{base_url}/api/notifications/user/u/stream')
+    assert response.status_code == 503
+    assert response.headers['Retry-After'] == str(backend2.SSE_HEARTBEAT)
@@ -0,0 +1,25 @@
+import threading
+import time
+
+from notifier import NotificationPipeline
+
+
+def test_a_full_queue_blocks_instead_of_reordering():
+    handled = []
+    gate = threading.Event()
+
+    def handle(events):
+        gate.wait()
+        handled.extend(events)
+
+    pipeline = NotificationPipeline(handle, workers=1, maxsize=2, batch_size=1)
+    producer = threading.Thread(target=lambda: [pipeline.submit('user', i) for i in range(6)])
+    producer.start()
+    time.sleep(0.1)
+    assert producer.is_alive(), 'submit should wait for room in the full queue'
+
+    gate.set()
+    producer.join(5)
+    assert pipeline.flush()
+    assert handled == list(range(6))
+    assert pipeline.summary()['blocked'] > 0
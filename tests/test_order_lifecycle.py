@@ -0,0 +1,211 @@
+import itertools
+import threading
+import time
+
+import pytest
+
+import backend2
+from aggregates import Aggregates
+from lifecycle import TRANSITIONS, TransitionError, check_transition
+
+
+@pytest.fixture(scope='module')
+def client():
+    backend2.warm_up()
+    return backend2.app.test_client()
+
+
+@pytest.fixture(scope='module')
+def menu_item(client):
+    restaurant = client.post('/api/restaurants', json={'name': 'Lifecycle Diner', 'address': '1 Main St',
+        'latitude': 40.71, 'longitude': -74.0}).get_json()
+    return client.post(f"/api/restaurants/{restaurant['id']}/menu/items",
+        json={'name': 'Soup', 'price': 4.5}).get_json()
+
+
+@pytest.fixture
+def order_id(client, menu_item):
+    response = client.post('/api/orders', json={'userId': 'lifecycle-user', 'restaurantId': menu_item['restaurantId'],
+        'deliveryAddress': '2 Main St', 'items': [{'menuItemId': menu_item['id'], 'quantity': 1}]})
+    assert response.status_code == 201
+    return response.get_json()['orderId']
+
+
+def set_status(client, order_id, status, headers=None):
+    return client.patch(f'/api/orders/{order_id}/status', json={'status': status}, headers=headers)
+
+
+def wait_for_partner(order_id, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not backend2.orders.get(order_id).get('deliveryId'):
+        assert time.monotonic() < deadline, 'order was never dispatched'
+        time.sleep(0.01)
+
+
+@pytest.mark.parametrize('current,target', list(itertools.product(TRANSITIONS, TRANSITIONS)))
+def test_transition_table(current, target):
+    if target == current:
+        assert check_transition(current, target) is False
+    elif target in TRANSITIONS[current]:
+        assert check_transition(current, target) is True
+    else:
+        with pytest.raises(TransitionError) as error:
+            check_transition(current, target)
+        assert error.value.code == 'invalid_transition'
+        assert error.value.http_status == 409
+
+
+def test_unknown_status_is_rejected():
+    with pytest.raises(TransitionError) as error:
+        check_transition('CREATED', 'SHIPPED')
+    assert error.value.http_status == 400
+
+
+def test_walks_the_lifecycle(client, order_id):
+    for status in ('CONFIRMED', 'PREPARING'):
+        assert set_status(client, order_id, status).status_code == 200
+    wait_for_partner(order_id)
+    for status in ('OUT_FOR_DELIVERY', 'DELIVERED'):
+        response = set_status(client, order_id, status)
+        assert response.status_code == 200
+        assert response.get_json()['status'] == status
+
+    response = set_status(client, order_id, 'CANCELLED')
+    assert response.status_code == 409
+    assert response.get_json()['code'] == 'invalid_transition'
+    assert response.get_json()['currentStatus'] == 'DELIVERED'
+
+
+def test_resending_the_current_status_is_a_no_op(client, order_id):
+    first = set_status(client, order_id, 'CONFIRMED').get_json()
+    again = set_status(client, order_id, 'CONFIRMED')
+    assert again.status_code == 200
+    assert again.get_json()['updatedAt'] == first['updatedAt']
+
+
+def test_out_for_delivery_waits_for_a_partner(client, order_id, monkeypatch):
+    monkeypatch.setattr(backend2, 'dispatch_order', lambda order: None)
+    set_status(client, order_id, 'CONFIRMED')
+    set_status(client, order_id, 'PREPARING')
+    response = set_status(client, order_id, 'OUT_FOR_DELIVERY', headers={'Idempotency-Key': 'pickup'})
+    assert response.status_code == 409
+    assert response.get_json()['code'] == 'not_dispatched'
+
+    # The retry with the same key runs again instead of replaying the 409
+    monkeypatch.undo()
+    backend2.dispatch_order(backend2.orders.get(order_id))
+    wait_for_partner(order_id)
+    response = set_status(client, order_id, 'OUT_FOR_DELIVERY', headers={'Idempotency-Key': 'pickup'})
+    assert response.status_code == 200
+
+
+def test_if_match(client, order_id):
+    etag = client.get(f'/api/orders/{order_id}').headers['ETag']
+    response = set_status(client, order_id, 'CONFIRMED', headers={'If-Match': etag})
+    assert response.status_code == 200
+    assert response.headers['ETag'] != etag
+    assert response.headers['ETag'] == client.get(f'/api/orders/{order_id}').headers['ETag']
+
+    response = set_status(client, order_id, 'PREPARING', headers={'If-Match': etag})
+    assert response.status_code == 412
+    assert response.get_json()['code'] == 'version_conflict'
+    assert backend2.orders.get(order_id)['status'] == 'CONFIRMED'
+
+    assert set_status(client, order_id, 'CANCELLED', headers={'If-Match': '*'}).status_code == 200
+
+
+def test_idempotency_key_replays_the_first_result(client, order_id):
+    headers = {'Idempotency-Key': 'confirm-once'}
+    first = set_status(client, order_id, 'CONFIRMED', headers=headers)
+    set_status(client, order_id, 'CANCELLED')
+
+    replay = set_status(client, order_id, 'CONFIRMED', headers=headers)
+    assert replay.status_code == 200
+    assert replay.get_json() == first.get_json()
+    assert backend2.orders.get(order_id)['status'] == 'CANCELLED'
+
+    mismatch = set_status(client, order_id, 'PREPARING', headers=headers)
+    assert mismatch.status_code == 422
+    assert mismatch.get_json()['code'] == 'idempotency_mismatch'
+
+
+def test_an_order_cancelled_before_assignment_gets_no_partner(client, order_id):
+    # The dispatch tick reserved a partner, then the order was cancelled
+    # before assign ran
+    partner = backend2.MOCK_PARTNERS[0]
+    active = partner['activeOrders']
+    backend2.dispatcher.reserve(partner)
+    assert set_status(client, order_id, 'CANCELLED').status_code == 200
+
+    assert backend2.assign_delivery_partner(order_id, partner, 1.0) is None
+    assert partner['activeOrders'] == active
+    assert 'deliveryId' not in backend2.orders.get(order_id)
+    assert backend2.deliveries.find('orderId', order_id) == []
+
+
+def test_the_customer_is_told_about_the_partner(client, order_id):
+    set_status(client, order_id, 'CONFIRMED')
+    set_status(client, order_id, 'PREPARING')
+    wait_for_partner(order_id)
+    backend2.notification_pipeline.flush()
+    assigned = backend2.notifications.scan(where={'orderId': order_id, 'type': 'DELIVERY_ASSIGNED'})[0]
+    assert [n['userId'] for n in assigned] == ['lifecycle-user']
+
+
+@pytest.mark.parametrize('body', [['CONFIRMED'], {'status': ['CONFIRMED']}, {'status': None}])
+def test_malformed_status_update_is_a_400(client, order_id, body):
+    response = client.patch(f'/api/orders/{order_id}/status', json=body)
+    assert response.status_code == 400
+    assert 'error' in response.get_json()
+
+
+@pytest.mark.parametrize('body', [['accept'], {'action': ['accept']}, {'action': {'accept': 1}}])
+def test_malformed_restaurant_action_is_a_400(client, order_id, body):
+    response = client.post(f'/api/orders/{order_id}/restaurant-action', json=body)
+    assert response.status_code == 400
+    assert 'error' in response.get_json()
+
+
+def test_malformed_batch_items_fail_on_their_own(client, order_id):
+    updates = [
+        {'orderId': [order_id], 'status': 'CONFIRMED'},
+        {'orderId': order_id, 'status': ['CONFIRMED']},
+        {'orderId': order_id, 'status': 'CONFIRMED', 'etag': 42},
+        {'orderId': order_id, 'status': 'CONFIRMED', 'idempotencyKey': ['key']},
+        'CONFIRMED',
+        {'orderId': order_id, 'status': 'CONFIRMED'},
+    ]
+    response = client.post('/api/orders/status/batch', json={'updates': updates})
+    assert response.status_code == 200
+    body = response.get_json()
+    assert [result['status'] for result in body['results']] == [400, 400, 400, 400, 400, 200]
+    assert (body['applied'], body['failed']) == (1, 5)
+
+    assert client.post('/api/orders/status/batch', json=[{'orderId': order_id}]).status_code == 400
+
+
+def test_tallies_match_the_orders_when_updates_race_creation(client, menu_item, monkeypatch):
+    # Cancel each order the moment it is visible, while others are placed;
+    # a slow add() widens the window between insert and tally
+    add = backend2.order_aggregates.add
+    monkeypatch.setattr(backend2.order_aggregates, 'add', lambda order: (time.sleep(0.002), add(order)))
+    placed = threading.Event()
+
+    def cancel_as_they_appear():
+        while not placed.is_set() or any(o['status'] != 'CANCELLED' for o in backend2.orders.find('userId', 'racing-user')):
+            for order in backend2.orders.find('userId', 'racing-user'):
+                if order['status'] == 'CREATED':
+                    backend2.update_status(order['orderId'], 'CANCELLED')
+
+    canceller = threading.Thread(target=cancel_as_they_appear)
+    canceller.start()
+    for _ in range(50):
+        backend2.place_order({'userId': 'racing-user', 'deliveryAddress': '3 Main St'},
+            menu_item['restaurantId'], 4.5, [(menu_item['id'], 1, 'Soup', 4.5)])
+    placed.set()
+    canceller.join(10)
+
+    expected = Aggregates()
+    expected.rebuild(backend2.orders.find('userId', 'racing-user'))
+    assert backend2.order_aggregates.user('racing-user')['byStatus'] == {'CANCELLED': 50}
+    assert backend2.order_aggregates.user('racing-user')['byStatus'] == expected.user('racing-user')['byStatus']
@@ -0,0 +1,107 @@
+from datetime import datetime
+
+import pytest
+
+import backend2
+from pagination import MAX_LIMIT, decode_cursor, encode_cursor, paginate, time_range
+from store import Collection
+
+
+@pytest.fixture
+def events():
+    collection = Collection('events', lambda e: e['id'], indexes={'kind': lambda e: e['kind']},
+        time_key=lambda e: datetime.fromisoformat(e['createdAt']))
+    for i, created_at in enumerate(['2026-01-01T09:59:59.500', '2026-01-01T10:00:00',
+                                    '2026-01-01T10:00:00.250', '2026-01-01T11:00:00']):
+        collection.insert({'id': i, 'kind': 'even' if i % 2 == 0 else 'odd', 'createdAt': created_at})
+    return collection
+
+
+def ids(records):
+    return [record['id'] for record in records]
+
+
+def test_time_range_is_inclusive(events):
+    records, _ = paginate(events, {'createdFrom': '2026-01-01T10:00:00', 'createdTo': '2026-01-01T10:00:00.250'}, {})
+    assert ids(records) == [1, 2]
+
+
+def test_time_range_compares_times_not_strings(events):
+    # ' ' sorts before 'T', so as strings this bound would exclude every record
+    records, _ = paginate(events, {'createdFrom': '2026-01-01 10:00'}, {})
+    assert ids(records) == [1, 2, 3]
+
+
+def test_time_range_with_an_offset_is_converted_to_local_time(events):
+    local = datetime(2026, 1, 1, 10, 0, 0, 250000).astimezone()
+    records, _ = paginate(events, {'createdFrom': local.isoformat()}, {})
+    assert ids(records) == [2, 3]
+
+
+@pytest.mark.parametrize('name', ['createdFrom', 'createdTo'])
+def test_invalid_time_is_rejected(name):
+    with pytest.raises(ValueError, match=name):
+        time_range({name: 'yesterday'})
+
+
+@pytest.mark.parametrize('path', ['/api/orders', '/api/orders/export'])
+def test_invalid_time_is_a_400(path):
+    response = backend2.app.test_client().get(path, query_string={'createdTo': '2026-13-01'})
+    assert response.status_code == 400
+    assert 'createdTo' in response.get_json()['error']
+
+
+def test_cursor_pages_cover_every_record_once(events):
+    pages = []
+    args = {'limit': '3'}
+    while True:
+        records, cursor = paginate(events, args, {})
+        pages.append(ids(records))
+        if cursor is None:
+            break
+        # Records appended between pages don't shift the boundary
+        events.insert({'id': 10 + len(pages), 'kind': 'odd', 'createdAt': '2026-01-01T12:00:00'})
+        args = {'limit': '3', 'cursor': cursor}
+    assert pages == [[0, 1, 2], [3, 11]]
+
+
+def test_filters_and_fields(events):
+    records, _ = paginate(events, {'kind': 'odd', 'fields': 'id, createdAt'}, {'kind': str})
+    assert records == [{'id': 1, 'createdAt': '2026-01-01T10:00:00'}, {'id': 3, 'createdAt': '2026-01-01T11:00:00'}]
+
+
+@pytest.mark.parametrize('args,message', [
+    ({'limit': 'ten'}, 'limit must be an integer'),
+    ({'limit': '0'}, 'limit must be positive'),
+    ({'cursor': 'not-a-cursor'}, 'Invalid cursor'),
+    ({'kind': 'x'}, 'Invalid value for kind'),
+])
+def test_invalid_paging_parameters(events, args, message):
+    with pytest.raises(ValueError, match=message):
+        paginate(events, args, {'kind': int})
+
+
+def test_limit_is_capped(events):
+    for i in range(4, MAX_LIMIT + 10):
+        events.insert({'id': i, 'kind': 'even', 'createdAt': '2026-01-01T12:00:00'})
+    records, cursor = paginate(events, {'limit': str(MAX_LIMIT * 2)}, {})
+    assert len(records) == MAX_LIMIT
+    assert cursor == encode_cursor(MAX_LIMIT - 1)
+    assert decode_cursor(cursor) == MAX_LIMIT - 1
+
+
+def test_list_endpoint_links_the_next_page():
+    client = backend2.app.test_client()
+    for i in range(3):
+        backend2.notifications.insert({'id': f'NOTIF-PAGE-{i}', 'userId': 'paging-user', 'type': 'TEST',
+            'title': 'Page', 'message': str(i), 'orderId': 'ORD-PAGE', 'status': 'SENT',
+            'timestamp': '2026-01-01T10:00:00'})
+
+    response = client.get('/api/notifications', query_string={'userId': 'paging-user', 'limit': 2})
+    assert [n['message'] for n in response.get_json()] == ['0', '1']
+    cursor = response.headers['X-Next-Cursor']
+    assert f'cursor={cursor}' in response.headers['Link']
+
+    response = client.get('/api/notifications', query_string={'userId': 'paging-user', 'limit': 2, 'cursor': cursor})
+    assert [n['message'] for n in response.get_json()] == ['2']
+    assert 'X-Next-Cursor' not in response.headers
@@ -0,0 +1,111 @@
+import pytest
+
+import backend2
+from pricing import PriceTables, price_order, price_orders
+
+MENUS = {
+    1: [{'id': 10, 'price': '2.50', 'available': True, 'name': 'Tea'},
+        {'id': 11, 'price': 4.0, 'available': False, 'name': 'Cake'}],
+    2: [{'id': 20, 'price': 0.1, 'available': True, 'name': 'Mint'}],
+}
+
+
+@pytest.fixture
+def tables():
+    loads = []
+    tables = PriceTables(lambda restaurant_id: loads.append(restaurant_id) or MENUS.get(restaurant_id, []))
+    tables.loads = loads
+    return tables
+
+
+def test_price_order(tables):
+    assert price_order(tables.get(1), [10, 10], [2, 1]) == (7.5, [(10, 2, 'Tea', 2.5), (10, 1, 'Tea', 2.5)])
+    assert price_order(tables.get(1), [10, 11], [1, 1]) == (None, 11)
+    assert price_order(tables.get(1), [12], [1]) == (None, 12)
+
+
+def test_totals_are_summed_in_item_order(tables):
+    total, _ = price_order(tables.get(2), [20, 20, 20], [1, 1, 1])
+    assert total == 0.1 + 0.1 + 0.1
+
+
+def test_a_batch_loads_each_menu_once(tables):
+    results = price_orders(tables, [(1, [10], [1]), (2, [20], [3]), (1, [11], [1]), (1, [10], [4])])
+    assert [total for total, _ in results] == [2.5, 0.1 * 3, None, 10.0]
+    assert tables.loads == [1, 2]
+    assert tables.summary() == {'builds': 2, 'invalidations': 0, 'restaurants': 2}
+
+
+def test_invalidate_rebuilds_the_table(tables):
+    tables.get(1)
+    tables.invalidate(1)
+    tables.get(1)
+    assert tables.loads == [1, 1]
+    assert tables.stats['invalidations'] == 1
+
+
+def test_a_table_built_during_a_change_is_not_kept():
+    def load(restaurant_id):
+        # The menu changes while this table is being built
+        tables.invalidate(restaurant_id)
+        return MENUS[restaurant_id]
+
+    tables = PriceTables(load)
+    assert 10 in tables.get(1)
+    assert tables.summary()['restaurants'] == 0
+
+
+@pytest.fixture(scope='module')
+def client():
+    backend2.warm_up()
+    return backend2.app.test_client()
+
+
+@pytest.fixture(scope='module')
+def restaurant(client):
+    restaurant = client.post('/api/restaurants', json={'name': 'Batch Bistro', 'address': '5 Main St'}).get_json()
+    soup = client.post(f"/api/restaurants/{restaurant['id']}/menu/items", json={'name': 'Soup', 'price': 4.5}).get_json()
+    return restaurant['id'], soup['id']
+
+
+def order(restaurant_id, menu_item_id, quantity=1, **extra):
+    return dict({'userId': 'batch-user', 'restaurantId': restaurant_id, 'deliveryAddress': '6 Main St',
+        'items': [{'menuItemId': menu_item_id, 'quantity': quantity}]}, **extra)
+
+
+def test_batch_prices_each_order_on_its_own(client, restaurant):
+    restaurant_id, soup = restaurant
+    response = client.post('/api/orders/batch', json={'orders': [
+        order(restaurant_id, soup, 2),
+        order(restaurant_id, 999999),
+        {'userId': 'batch-user'},
+        order(restaurant_id, soup, 1),
+    ]})
+    assert response.status_code == 200
+    body = response.get_json()
+    assert (body['created'], body['failed']) == (2, 2)
+    assert [result['status'] for result in body['results']] == [201, 400, 400, 201]
+    assert body['results'][0]['order']['totalAmount'] == 9.0
+    assert 'Menu item 999999' in body['results'][1]['error']
+
+
+def test_batch_sees_a_new_menu_item(client, restaurant):
+    restaurant_id, soup = restaurant
+    client.post('/api/orders/batch', json={'orders': [order(restaurant_id, soup)]})
+    bread = client.post(f'/api/restaurants/{restaurant_id}/menu/items', json={'name': 'Bread', 'price': 1.25}).get_json()
+    body = client.post('/api/orders/batch', json={'orders': [order(restaurant_id, bread['id'], 4)]}).get_json()
+    assert body['results'][0]['order']['totalAmount'] == 5.0
+
+
+def test_batch_idempotency_keys(client, restaurant):
+    restaurant_id, soup = restaurant
+    batch = {'orders': [order(restaurant_id, soup, idempotencyKey='batch-a'),
+                        order(restaurant_id, soup, idempotencyKey='batch-a'),
+                        order(restaurant_id, soup, idempotencyKey=7)]}
+    first = client.post('/api/orders/batch', json=batch).get_json()
+    assert (first['created'], first['replayed'], first['failed']) == (1, 1, 1)
+    assert first['results'][1]['order'] == first['results'][0]['order']
+
+    again = client.post('/api/orders/batch', json=batch).get_json()
+    assert again['created'] == 0
+    assert again['results'][0]['order']['orderId'] == first['results'][0]['order']['orderId']
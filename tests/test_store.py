@@ -0,0 +1,65 @@
+import pytest
+
+from store import Collection, DuplicateKeyError
+
+
+@pytest.fixture
+def people():
+    collection = Collection('people', lambda p: p['id'], unique={'email': lambda p: p['email']},
+        indexes={'city': lambda p: p['city'], 'team': lambda p: p['team']})
+    for i, (city, team) in enumerate([('Oslo', 'red'), ('Rome', 'red'), ('Oslo', 'blue'), ('Lima', 'red')]):
+        collection.insert({'id': i, 'email': f'p{i}@example.com', 'city': city, 'team': team, 'age': 20 + i})
+    return collection
+
+
+def ids(records):
+    return [record['id'] for record in records]
+
+
+def test_find_uses_the_index(people):
+    assert ids(people.find('city', 'Oslo')) == [0, 2]
+    assert people.find('city', 'Paris') == []
+    assert people.find_one('email', 'p1@example.com')['id'] == 1
+
+
+def test_indexes_follow_updates(people):
+    people.update(people.get(0), city='Rome', email='moved@example.com')
+    assert ids(people.find('city', 'Oslo')) == [2]
+    assert ids(people.find('city', 'Rome')) == [0, 1]
+    assert people.find_one('email', 'p0@example.com') is None
+    assert people.find_one('email', 'moved@example.com')['id'] == 0
+    assert people.version(0) == 2
+
+
+def test_duplicates_leave_no_trace(people):
+    with pytest.raises(DuplicateKeyError):
+        people.insert({'id': 0, 'email': 'new@example.com', 'city': 'Oslo', 'team': 'red', 'age': 1})
+    with pytest.raises(DuplicateKeyError):
+        people.insert({'id': 9, 'email': 'p1@example.com', 'city': 'Oslo', 'team': 'red', 'age': 1})
+    with pytest.raises(TypeError):
+        people.insert({'id': 9, 'email': 'p9@example.com', 'city': ['Oslo'], 'team': 'red', 'age': 1})
+    assert len(people) == 4
+    assert 9 not in people
+    assert ids(people.find('city', 'Oslo')) == [0, 2]
+
+
+def test_scan_combines_index_and_field_filters(people):
+    assert ids(people.scan(where={'city': 'Oslo', 'team': 'red'})[0]) == [0]
+    assert ids(people.scan(where={'team': 'red', 'age': 23})[0]) == [3]
+    records, last = people.scan(where={'team': 'red'}, limit=2)
+    assert ids(records) == [0, 1]
+    assert ids(people.scan(after=last, where={'team': 'red'})[0]) == [3]
+
+
+def test_eviction_keeps_indexes_and_sequence_numbers(people):
+    _, last = people.scan(limit=2)
+    assert ids(people.evict(2)) == [0, 1]
+    assert 0 not in people
+    assert ids(people.find('city', 'Oslo')) == [2]
+    assert ids(people.find('team', 'red')) == [3]
+    assert people.find_one('email', 'p0@example.com') is None
+
+    # A cursor taken before the eviction still resumes in the right place
+    people.insert({'id': 4, 'email': 'p4@example.com', 'city': 'Oslo', 'team': 'red', 'age': 24})
+    assert ids(people.scan(after=last)[0]) == [2, 3, 4]
+    assert ids(people.find('city', 'Oslo')) == [2, 4]
@@ -0,0 +1,147 @@
+import json
+import os
+import subprocess
+import sys
+
+from store import Store
+from wal import Persistence
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def start(directory):
+    store = Store()
+    persistence = Persistence(store, str(directory), flush_interval=0.001)
+    recovery = persistence.start()
+    return store, persistence, recovery
+
+
+def restaurant(restaurant_id):
+    return {'id': restaurant_id, 'name': f'Restaurant {restaurant_id}', 'cuisine': 'Pizza'}
+
+
+def test_replays_the_log_without_a_snapshot(tmp_path):
+    store, persistence, _ = start(tmp_path)
+    for restaurant_id in (1, 2, 3):
+        store.restaurants.insert(restaurant(restaurant_id))
+    store.restaurants.update(store.restaurants.get(2), cuisine='Sushi')
+    persistence.close()
+
+    store, persistence, recovery = start(tmp_path)
+    assert recovery['snapshotRecords'] == 0
+    assert recovery['replayedEntries'] == 4
+    assert [r['id'] for r in store.restaurants] == [1, 2, 3]
+    assert store.restaurants.get(2)['cuisine'] == 'Sushi'
+    persistence.close()
+
+
+def test_loads_the_snapshot_then_replays_the_tail(tmp_path):
+    store, persistence, _ = start(tmp_path)
+    for restaurant_id in (1, 2, 3):
+        store.restaurants.insert(restaurant(restaurant_id))
+    lsn = persistence.snapshot()
+    store.restaurants.insert(restaurant(4))
+    store.restaurants.update(store.restaurants.get(1), cuisine='Thai')
+    persistence.close()
+    # Segments before the snapshot are gone
+    assert len(persistence.wal.segments()) == 1
+
+    store, persistence, recovery = start(tmp_path)
+    assert recovery['snapshotLsn'] == lsn
+    assert recovery['snapshotRecords'] == 3
+    assert recovery['replayedEntries'] == 2
+    assert [r['id'] for r in store.restaurants] == [1, 2, 3, 4]
+    assert store.restaurants.get(1)['cuisine'] == 'Thai'
+    persistence.close()
+
+
+def test_replays_updates_the_snapshot_already_has(tmp_path):
+    # The snapshot reads records after the lock is released, so it can hold
+    # updates that are also in the log after its LSN
+    store, persistence, _ = start(tmp_path)
+    store.orders.insert({'orderId': 'ORD-1', 'id': 1, 'userId': 'u1', 'restaurantId': 1, 'status': 'CREATED',
+        'totalAmount': 9.5, 'items': [], 'createdAt': '2026-01-01T10:00:00'})
+    persistence.snapshot()
+    order = store.orders.get('ORD-1')
+    store.orders.update(order, status='CONFIRMED')
+    store.orders.update(order, status='PREPARING', preparingAt='2026-01-01T10:05:00')
+    persistence.close()
+    path = os.path.join(tmp_path, 'snapshot.json')
+    with open(path, encoding='utf-8') as f:
+        snapshot = json.load(f)
+    snapshot['collections']['orders'] = [dict(order)]
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(snapshot, f)
+
+    store, persistence, recovery = start(tmp_path)
+    assert recovery['replayedEntries'] == 2
+    assert dict(store.orders.get('ORD-1')) == dict(order)
+    assert store.orders.find('status', 'PREPARING') == [store.orders.get('ORD-1')]
+    persistence.close()
+
+
+def test_replays_evictions(tmp_path):
+    store, persistence, _ = start(tmp_path)
+    for restaurant_id in range(1, 6):
+        store.restaurants.insert(restaurant(restaurant_id))
+    store.restaurants.evict(2)
+    persistence.snapshot()
+    store.restaurants.insert(restaurant(6))
+    store.restaurants.evict(1)
+    persistence.close()
+
+    store, persistence, _ = start(tmp_path)
+    assert [r['id'] for r in store.restaurants] == [4, 5, 6]
+    assert 3 not in store.restaurants
+    persistence.close()
+
+
+def test_stops_at_a_torn_write(tmp_path):
+    store, persistence, _ = start(tmp_path)
+    store.restaurants.insert(restaurant(1))
+    store.restaurants.insert(restaurant(2))
+    persistence.close()
+    with open(persistence.wal.segments()[-1], 'a', encoding='utf-8') as f:
+        f.write('{"op":"insert","c":"restau')
+
+    store, persistence, recovery = start(tmp_path)
+    assert recovery['replayedEntries'] == 2
+    assert [r['id'] for r in store.restaurants] == [1, 2]
+    # New entries continue after the last good one
+    store.restaurants.insert(restaurant(3))
+    persistence.close()
+    store, persistence, _ = start(tmp_path)
+    assert [r['id'] for r in store.restaurants] == [1, 2, 3]
+    persistence.close()
+
+
+PLACE_ORDER = '''
+import json
+import backend2
+backend2.warm_up()
+client = backend2.app.test_client()
+restaurant = client.post('/api/restaurants', json={'name': 'R', 'address': '1 Main St',
+    'latitude': 40.71, 'longitude': -74.0}).get_json()
+item = client.post(f"/api/restaurants/{restaurant['id']}/menu/items", json={'name': 'Pie', 'price': 9.5}).get_json()
+order = client.post('/api/orders', json={'userId': 'u1', 'restaurantId': restaurant['id'],
+    'deliveryAddress': '2 Main St', 'items': [{'menuItemId': item['id'], 'quantity': 1}]}).get_json()
+backend2.shutdown()
+print(json.dumps({'restaurant': restaurant['id'], 'item': item['id'], 'order': order['orderId'],
+    'orders': len(backend2.orders)}))
+'''
+
+
+def place_order(data_dir):
+    env = dict(os.environ, BACKEND2_DATA_DIR=str(data_dir))
+    output = subprocess.run([sys.executable, '-c', PLACE_ORDER], cwd=ROOT, env=env,
+        capture_output=True, text=True, check=True, timeout=60).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def test_ids_continue_after_a_restart(tmp_path):
+    first = place_order(tmp_path)
+    second = place_order(tmp_path)
+    assert second['orders'] == 2
+    assert second['restaurant'] > first['restaurant']
+    assert second['item'] > first['item']
+    assert second['order'] != first['order']
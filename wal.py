@@ -0,0 +1,261 @@
+import glob
+import json
+import os
+import threading
+import time
+
+# Durable persistence for the in-memory store.
+#
+# Every store mutation is appended to a write-ahead log as one JSON line. A
+# background flusher writes and fsyncs whatever has accumulated (group commit),
+# so many requests share one fsync. Requests that need durability wait for
+# their own log position with commit(); the wait is bounded by the flush
+# interval plus one fsync.
+#
+# The log is split into segments named after their first log sequence number
+# (LSN). A snapshot records the full store at some LSN, after which the older
+# segments are deleted. Recovery loads the latest snapshot and replays only
+# the entries after it.
+
+SNAPSHOT_FILE = 'snapshot.json'
+SEGMENT_PATTERN = 'wal-*.log'
+
+
+class WriteAheadLog:
+    def __init__(self, directory, flush_interval=0.005, max_pending=10000):
+        self.directory = directory
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+        self.lsn = 0
+        self.durable_lsn = 0
+        self.stats = {'appended': 0, 'flushes': 0, 'fsyncSeconds': 0.0}
+        self._pending = []
+        self._file = None
+        self._closed = False
+        self._cond = threading.Condition()
+        # Held while writing to the file, so batches land in LSN order; taken
+        # before _cond, never while holding it
+        self._io_lock = threading.Lock()
+        self._local = threading.local()
+        self._flusher = None
+
+    def open(self, next_lsn):
+        self.lsn = self.durable_lsn = next_lsn - 1
+        self._file = open(self._segment_path(next_lsn), 'a', encoding='utf-8')
+        self._flusher = threading.Thread(target=self._run, name='wal-flusher', daemon=True)
+        self._flusher.start()
+
+    def append(self, entry):
+        with self._cond:
+            # Back-pressure: don't let the buffer outrun the disk
+            while len(self._pending) >= self.max_pending and not self._closed:
+                self._cond.wait()
+            self.lsn += 1
+            entry['lsn'] = self.lsn
+            self._pending.append(json.dumps(entry, separators=(',', ':'), default=dict) + '\n')
+            self.stats['appended'] += 1
+            self._local.lsn = self.lsn
+            self._cond.notify_all()
+            return self.lsn
+
+    def commit(self, timeout=5.0):
+        # Wait until everything this thread appended is on disk
+        lsn = getattr(self._local, 'lsn', 0)
+        if not lsn:
+            return True
+        self._local.lsn = 0
+        deadline = time.monotonic() + timeout
+        with self._cond:
+            while self.durable_lsn < lsn:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0 or self._closed:
+                    return False
+                self._cond.wait(remaining)
+        return True
+
+    def rotate(self):
+        # Flush synchronously and start a new segment at the next LSN. The
+        # caller must make sure no appends race with this (Store.locked()).
+        with self._io_lock, self._cond:
+            self._write(self._pending)
+            self._pending = []
+            self._file.close()
+            self._file = open(self._segment_path(self.lsn + 1), 'a', encoding='utf-8')
+            self.durable_lsn = self.lsn
+            self._cond.notify_all()
+            return self.lsn
+
+    def close(self):
+        with self._io_lock, self._cond:
+            self._closed = True
+            self._write(self._pending)
+            self._pending = []
+            self.durable_lsn = self.lsn
+            self._file.close()
+            self._cond.notify_all()
+
+    def segments(self):
+        return sorted(glob.glob(os.path.join(self.directory, SEGMENT_PATTERN)))
+
+    def _segment_path(self, first_lsn):
+        return os.path.join(self.directory, f'wal-{first_lsn:016d}.log')
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._pending and not self._closed:
+                    self._cond.wait()
+                if self._closed:
+                    return
+            # Let concurrent writers pile into the same batch
+            time.sleep(self.flush_interval)
+            # Write and fsync outside _cond: append() runs under collection
+            # locks, so it must never wait for the disk
+            with self._io_lock:
+                with self._cond:
+                    if self._closed:
+                        return
+                    batch, self._pending = self._pending, []
+                    last = self.lsn
+                    self._cond.notify_all()
+                self._write(batch)
+                with self._cond:
+                    self.durable_lsn = max(self.durable_lsn, last)
+                    self._cond.notify_all()
+
+    def _write(self, lines):
+        if not lines:
+            return
+        started = time.perf_counter()
+        self._file.write(''.join(lines))
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self.stats['flushes'] += 1
+        self.stats['fsyncSeconds'] += time.perf_counter() - started
+
+
+class Persistence:
+    def __init__(self, store, directory, snapshot_every=50000, flush_interval=0.005):
+        self.store = store
+        self.directory = directory
+        self.snapshot_every = snapshot_every
+        self.wal = WriteAheadLog(directory, flush_interval=flush_interval)
+        self.recovery = None
+        self._since_snapshot = 0
+        self._snapshot_wanted = threading.Event()
+
+    def start(self):
+        # Recover the store, then start logging new mutations
+        os.makedirs(self.directory, exist_ok=True)
+        self.recovery = self.recover()
+        self.wal.open(self.recovery['lastLsn'] + 1)
+        self.store.attach(self._on_mutation)
+        threading.Thread(target=self._snapshot_loop, name='wal-snapshot', daemon=True).start()
+        return self.recovery
+
+    def commit(self):
+        return self.wal.commit()
+
+    def recover(self):
+        started = time.perf_counter()
+        snapshot_lsn = 0
+        loaded = 0
+        snapshot_path = os.path.join(self.directory, SNAPSHOT_FILE)
+        if os.path.exists(snapshot_path):
+            with open(snapshot_path, encoding='utf-8') as f:
+                snapshot = json.load(f)
+            snapshot_lsn = snapshot['lsn']
+            for name, records in snapshot['collections'].items():
+                collection = self.store.collection(name)
+                for record in records:
+                    collection.insert(record)
+                loaded += len(records)
+
+        last_lsn = snapshot_lsn
+        replayed = 0
+        for path in self.wal.segments():
+            with open(path, encoding='utf-8') as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        # Torn write at the tail of the log
+                        break
+                    if entry['lsn'] <= snapshot_lsn:
+                        continue
+                    self._apply(entry)
+                    last_lsn = entry['lsn']
+                    replayed += 1
+
+        return {
+            'snapshotLsn': snapshot_lsn,
+            'snapshotRecords': loaded,
+            'replayedEntries': replayed,
+            'lastLsn': last_lsn,
+            'seconds': round(time.perf_counter() - started, 4)
+        }
+
+    def snapshot(self):
+        # Only the log rotation and a copy of each row list happen under the
+        # store lock, so writers wait for a list copy rather than the whole
+        # conversion. The records are read after the lock is released and may
+        # include updates made since; those are also in the log after `lsn`,
+        # and replaying an update sets the same fields again, so recovery ends
+        # in the same state. Inserts and evictions after `lsn` are not in the
+        # copied lists, so they replay exactly once.
+        with self.store.locked():
+            lsn = self.wal.rotate()
+            rows = [(c.name, c.all()) for c in self.store.collections()]
+            self._since_snapshot = 0
+        collections = {name: [dict(record) for record in records] for name, records in rows}
+
+        path = os.path.join(self.directory, SNAPSHOT_FILE)
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({'lsn': lsn, 'createdAt': time.time(), 'collections': collections}, f,
+                separators=(',', ':'))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+
+        # Segments that end at or before the snapshot LSN are no longer needed
+        current = self.wal._segment_path(lsn + 1)
+        for segment in self.wal.segments():
+            if segment < current:
+                os.remove(segment)
+        return lsn
+
+    def close(self):
+        self.wal.close()
+
+    def _on_mutation(self, op, collection, key, data):
+        entry = {'op': op, 'c': collection, 'k': key}
+        if op == 'insert':
+            entry['r'] = data
+        else:
+            entry['ch'] = data
+        self.wal.append(entry)
+        self._since_snapshot += 1
+        if self._since_snapshot >= self.snapshot_every:
+            self._snapshot_wanted.set()
+
+    def _apply(self, entry):
+        collection = self.store.collection(entry['c'])
+        if entry['op'] == 'insert':
+            collection.insert(entry['r'])
+        elif entry['op'] == 'update':
+            key = entry['k']
+            record = collection.get(tuple(key) if isinstance(key, list) else key)
+            if record is not None:
+                collection.update(record, **entry['ch'])
+        elif entry['op'] == 'evict':
+            collection.evict(entry['ch'])
+
+    def _snapshot_loop(self):
+        while True:
+            self._snapshot_wanted.wait()
+            self._snapshot_wanted.clear()
+            try:
+                self.snapshot()
+            except OSError as error:
+                print(f'[WAL] Snapshot failed: {error}')